@@ -0,0 +1,114 @@
+import heapq
+
+import numpy as np
+
+
+# AABB tree over boxes [xmin, ymin, zmin, xmax, ymax, zmax] (faces or features), for spatial
+# queries in O(log n) instead of testing every pair: overlap, containment and nearest box.
+
+class AABBTree:
+    def __init__(self, boxes, ids=None, leaf_size=4):
+        self.boxes = np.asarray(boxes, dtype=float).reshape(-1, 6)
+        self.ids = list(ids) if ids is not None else list(range(len(self.boxes)))
+        self.leaf_size = leaf_size
+        self.build()
+
+    def build(self):
+        centers = 0.5 * (self.boxes[:, :3] + self.boxes[:, 3:])
+        order = np.arange(len(self.boxes))
+        node_box, left, right, start, count = [], [], [], [], []
+
+        def new_node(lo, hi):
+            idx = order[lo:hi]
+            node_box.append(np.concatenate([self.boxes[idx, :3].min(axis=0), self.boxes[idx, 3:].max(axis=0)]))
+            left.append(-1)
+            right.append(-1)
+            start.append(lo)
+            count.append(hi - lo)
+            return len(node_box) - 1
+
+        # median split on the longest axis of the centres
+        if len(self.boxes):
+            stack = [(new_node(0, len(self.boxes)), 0, len(self.boxes))]
+            while stack:
+                node, lo, hi = stack.pop()
+                if hi - lo <= self.leaf_size:
+                    continue
+                idx = order[lo:hi]
+                c = centers[idx]
+                split_axis = np.argmax(c.max(axis=0) - c.min(axis=0))
+                order[lo:hi] = idx[np.argsort(c[:, split_axis], kind='stable')]
+                mid = (lo + hi) // 2
+                left[node] = new_node(lo, mid)
+                right[node] = new_node(mid, hi)
+                count[node] = 0
+                stack.append((left[node], lo, mid))
+                stack.append((right[node], mid, hi))
+
+        self.order = order
+        self.node_box = np.array(node_box).reshape(-1, 6)
+        self.left, self.right = left, right
+        self.start, self.count = start, count
+
+    def _query(self, node_test, item_test):
+        # generic traversal: node_test(node box) prunes subtrees, item_test(box) selects items
+        found = []
+        if not len(self.node_box):
+            return found
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            if not node_test(self.node_box[node]):
+                continue
+            if self.count[node]:
+                for i in self.order[self.start[node]:self.start[node] + self.count[node]]:
+                    if item_test(self.boxes[i]):
+                        found.append(self.ids[i])
+            else:
+                stack.extend((self.left[node], self.right[node]))
+        return found
+
+    def overlapping(self, box, tol=0.0):
+        # ids whose box intersects `box` (touching counts if tol >= 0)
+        box = np.asarray(box, dtype=float)
+        def test(b):
+            return np.all(b[:3] <= box[3:] + tol) and np.all(box[:3] <= b[3:] + tol)
+        return self._query(test, test)
+
+    def contained_in(self, box, tol=1e-6):
+        # ids whose box lies inside `box`
+        box = np.asarray(box, dtype=float)
+        def node_test(b):
+            return np.all(b[:3] <= box[3:] + tol) and np.all(box[:3] <= b[3:] + tol)
+        def item_test(b):
+            return np.all(b[:3] >= box[:3] - tol) and np.all(b[3:] <= box[3:] + tol)
+        return self._query(node_test, item_test)
+
+    def containing(self, box, tol=1e-6):
+        # ids whose box contains `box`
+        box = np.asarray(box, dtype=float)
+        def test(b):
+            return np.all(b[:3] <= box[:3] + tol) and np.all(b[3:] >= box[3:] - tol)
+        return self._query(test, test)
+
+    def nearest(self, point, k=1):
+        # k closest boxes to a point (distance 0 inside the box) -> [(distance, id)]
+        point = np.asarray(point, dtype=float)
+        def distance(b):
+            return float(np.linalg.norm(np.maximum(np.maximum(b[:3] - point, point - b[3:]), 0.0)))
+
+        result = []
+        if not len(self.node_box):
+            return result
+        heap = [(distance(self.node_box[0]), 0, 0)] # (distance, is_item, node or item index)
+        while heap and len(result) < k:
+            d, is_item, i = heapq.heappop(heap)
+            if is_item:
+                result.append((d, self.ids[i]))
+            elif self.count[i]:
+                for item in self.order[self.start[i]:self.start[i] + self.count[i]]:
+                    heapq.heappush(heap, (distance(self.boxes[item]), 1, int(item)))
+            else:
+                for child in (self.left[i], self.right[i]):
+                    heapq.heappush(heap, (distance(self.node_box[child]), 0, child))
+        return result
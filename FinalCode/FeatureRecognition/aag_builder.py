@@ -1,64 +1,15 @@
-import json
-from collections import defaultdict, Counter
+from collections import Counter
 
 import numpy as np
-import matplotlib.pyplot as plt
-from jinja2.nodes import Continue
-from matplotlib.patches import Patch
-from matplotlib.lines import Line2D
-import plotly.graph_objects as go
-import plotly.io as pio
 import networkx as nx
 from typing import List, Dict, Any, Set, Tuple
 
-from OCC.Core.BRepMesh import BRepMesh_IncrementalMesh
-from OCC.Core.BRep import BRep_Tool
-from OCC.Core.TopAbs import TopAbs_FORWARD
-from OCC.Core.TopLoc import TopLoc_Location
-from OCC.Extend.TopologyUtils import TopologyExplorer
-from OCC.Core.STEPControl import STEPControl_Reader
-from OCC.Core.GProp import GProp_GProps
-from OCC.Core.BRepGProp import brepgprop_SurfaceProperties, brepgprop_LinearProperties
-from OCC.Core.GeomAbs import (GeomAbs_Plane, GeomAbs_Cylinder, GeomAbs_Cone,
-                              GeomAbs_Sphere, GeomAbs_Torus, GeomAbs_Circle)
-from OCC.Core.BRepAdaptor import BRepAdaptor_Surface, BRepAdaptor_Curve
-
-from FeatureRecognition.geometry_analysis import load_step_file, analyze_shape
-
-
-
-
-#generate a triangulated mesh of the part for Plotly visualization
-def mesh_shape_for_visualization(shape, linear_deflection=0.1):
-    BRepMesh_IncrementalMesh(shape, linear_deflection)
-
-#extract a renderable triangle mesh from the B‑rep
-def extract_mesh_data(shape):
-    vertices = []
-    triangles = []
-    vertex_count = 0
-    topo = TopologyExplorer(shape)
-    for face in topo.faces():
-        loc = TopLoc_Location()
-        triangulation = BRep_Tool.Triangulation(face, loc)
-        if triangulation is None:
-            continue
-        transform = loc.Transformation()
-        face_vertices = []
-        for i in range(1, triangulation.NbNodes() + 1):
-            pnt = triangulation.Node(i)
-            pnt.Transform(transform)
-            vertices.append([pnt.X(), pnt.Y(), pnt.Z()])
-            face_vertices.append(vertex_count)
-            vertex_count += 1
-        for i in range(1, triangulation.NbTriangles() + 1):
-            triangle = triangulation.Triangle(i)
-            n1, n2, n3 = triangle.Get()
-            if face.Orientation() == TopAbs_FORWARD:
-                triangles.append([face_vertices[n1 - 1], face_vertices[n2 - 1], face_vertices[n3 - 1]])
-            else:
-                triangles.append([face_vertices[n1 - 1], face_vertices[n3 - 1], face_vertices[n2 - 1]])
-    return vertices, triangles
+# compute imports only: matplotlib / plotly are imported inside the visualize_* methods
+from FeatureRecognition.geometry_analysis import analyze_shape, get_shape_mesh
+from FeatureRecognition.figure_export import show_or_export, show_or_save_matplotlib
+from FeatureRecognition.aag_io import aag_arrays, save_aag
+from FeatureRecognition.memory_profile import memory_stage
+
 
 
 
@@ -90,9 +41,10 @@ class AAGBuilder_3D:
             "geo_other": (0.4, 0.4, 0.4),  # Darker Gray
         }
 
-    def load_shape (self):
-        mesh_shape_for_visualization(self.shape, linear_deflection=0.1)
-        self.vertices, self.triangles = extract_mesh_data(self.shape)
+    def load_shape (self, linear_deflection=None):
+        # shared mesh (same triangulation as every other visualiser / rasteriser)
+        self.mesh = get_shape_mesh(self.shape, linear_deflection)
+        self.vertices, self.triangles = self.mesh['vertices'], self.mesh['triangles']
 
     '''
     #ONLY NEED IF I LOAD A FILE AND WANT TO CLASSIFY/MAP THE EDGES
@@ -149,26 +101,17 @@ class AAGBuilder_3D:
         final_unmapped = set(self.edge_classification.keys()) - set(self.convexity_to_current_map.keys())
         print(f"Final: {len(self.edge_id_map)} mapped, {len(final_unmapped)} unmapped")'''
 
-    def visualize_3d_aag(self, show_mesh=True, mesh_opacity=0.2, node_size=10, hide_convex=False):
+    def visualize_3d_aag(self, show_mesh=True, mesh_opacity=0.2, node_size=10, hide_convex=False,
+                         output_path=None):
         import plotly.graph_objects as go
-        from collections import Counter
+        from FeatureRecognition.plotly_traces import part_mesh_trace
 
         fig = go.Figure()
 
         # 1. Mesh visualization
-        if hasattr(self, "vertices") and hasattr(self, "triangles") and show_mesh:
-            fig.add_trace(go.Mesh3d(
-                x=[v[0] for v in self.vertices],
-                y=[v[1] for v in self.vertices],
-                z=[v[2] for v in self.vertices],
-                i=[t[0] for t in self.triangles],
-                j=[t[1] for t in self.triangles],
-                k=[t[2] for t in self.triangles],
-                color='lightblue',
-                opacity=mesh_opacity,
-                name='3D Model',
-                flatshading=True,
-            ))
+        if hasattr(self, "mesh") and show_mesh:
+            fig.add_trace(part_mesh_trace(self.mesh, color='lightblue', opacity=mesh_opacity,
+                                          name='3D Model', flatshading=True))
 
         # 2. Face centers colored by face type
         face_types = [f['type'] for f in self.face_data_list]
@@ -318,7 +261,7 @@ class AAGBuilder_3D:
             width=1200,
             height=900
         )
-        fig.show()
+        show_or_export(fig, output_path)
 
         print("\nFace type distribution:")
         for ftype, count in Counter(face_types).items():
@@ -350,6 +293,8 @@ class AAGBuilder_2D:
 
         self.G = None
         self.subG = None
+        self.subG2 = None
+        self.subgraph_faces = None # faces the subgraphs were limited to (None = whole part)
         self.subgraphs_info = []
 
         self.colors_rgb = {
@@ -375,6 +320,7 @@ class AAGBuilder_2D:
         }
 
     # 1. BUILD GRAPH AND SUBGRAPH
+    @memory_stage("aag_construction")
     def build_aag_graph(self): #graph with all edge types
         self.G = nx.Graph()
         all_faces, face_data_list, _, _, _ = analyze_shape(self.shape)
@@ -415,7 +361,15 @@ class AAGBuilder_2D:
         return self.G
 
 
-    def build_aag_subgraph (self):
+    def export_aag(self, path):
+        # compact binary AAG (.npz or folder of .npy), readable later without OCC (see aag_io)
+        if self.G is None:
+            self.build_aag_graph()
+        return save_aag(path, aag_arrays(self.face_data_list, self.G))
+
+
+    def build_aag_subgraph (self, faces=None):
+        # faces: only build the components that contain one of these faces (revision mode)
         if self.G is None:
             self.build_aag_graph()
         def filter_stock_faces(node):
@@ -449,8 +403,25 @@ class AAGBuilder_2D:
         view_not_all = nx.subgraph_view(self.G, filter_node=filter_stock_faces, filter_edge=filter_edge_not_all)
 
         # 2. Identify nodes to keep
+        if faces is None:
+            components = nx.connected_components(view)
+        else:
+            # components of view_not_all touching the faces: they contain every view component
+            # the node selection below has to look at (for subG2); subG/subG2 themselves only
+            # keep the components that contain one of the faces (same candidates as aag_sparse)
+            region = set()
+            for face in faces:
+                if face in view_not_all and face not in region:
+                    region.update(nx.node_connected_component(view_not_all, face))
+            components, seen = [], set()
+            for face in region:
+                if face not in seen:
+                    components.append(nx.node_connected_component(view, face))
+                    seen.update(components[-1])
+        self.subgraph_faces = None if faces is None else set(faces)
+
         nodes_to_keep = []
-        for component in nx.connected_components(view):
+        for component in components:
             # In a subgraph view, 'component' is a set of nodes
             # that are connected by concave/tangent edges.
             if len(component) > 1:
@@ -472,16 +443,28 @@ class AAGBuilder_2D:
                     nodes_to_keep.append(node_idx)
 
         # Create final filtered subgraph
-        self.subG = view.subgraph(nodes_to_keep).copy()
-        self.subG2 = view_not_all.subgraph(nodes_to_keep).copy()
+        if faces is None:
+            self.subG = view.subgraph(nodes_to_keep).copy()
+            self.subG2 = view_not_all.subgraph(nodes_to_keep).copy()
+        else:
+            self.subG = self._components_with(view.subgraph(nodes_to_keep), faces).copy()
+            self.subG2 = self._components_with(view_not_all.subgraph(nodes_to_keep), faces).copy()
 
         return self.subG, self.subG2
 
+    def _components_with(self, graph, faces):
+        # part of graph made of the connected components that contain one of the faces
+        nodes = set()
+        for face in faces:
+            if face in graph and face not in nodes:
+                nodes.update(nx.node_connected_component(graph, face))
+        return graph.subgraph(nodes)
+
     # 2. ANALYSE SUBGRAPH FOR FR (connected faces)
 
-    def analyse_subgraphs(self):
-        if self.subG is None:
-            self.build_aag_subgraph()
+    def analyse_subgraphs(self, faces=None):
+        if self.subG is None or self.subgraph_faces != (None if faces is None else set(faces)):
+            self.build_aag_subgraph(faces)
         subgraphs = list(nx.connected_components(self.subG))
         self.subgraphs_info = []
 
@@ -503,9 +486,9 @@ class AAGBuilder_2D:
             })
         return self.subgraphs_info
 
-    def analyse_subgraphs_not_all(self):
-        if self.subG2 is None:
-            self.build_aag_subgraph()
+    def analyse_subgraphs_not_all(self, faces=None):
+        if self.subG2 is None or self.subgraph_faces != (None if faces is None else set(faces)):
+            self.build_aag_subgraph(faces)
         subgraphs = list(nx.connected_components(self.subG2))
         self.subgraphs_info_2 = []
 
@@ -529,7 +512,11 @@ class AAGBuilder_2D:
 
 
     # 3. VISUALIZE GRAPHS
-    def visualize_2d_aag (self):
+    def visualize_2d_aag (self, output_path=None):
+        import matplotlib.pyplot as plt
+        from matplotlib.patches import Patch
+        from matplotlib.lines import Line2D
+
         if self.G is None:
             self.build_aag_graph()
         if self.subG is None:
@@ -612,6 +599,6 @@ class AAGBuilder_2D:
         for ax in (ax1, ax2):
             ax.axis('off')
         plt.tight_layout()
-        plt.show()
+        show_or_save_matplotlib(fig, output_path)
 
 
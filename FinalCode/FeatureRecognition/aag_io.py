@@ -0,0 +1,115 @@
+import json
+import os
+
+import numpy as np
+
+
+# Compact binary AAG: node attributes as flat arrays + the (symmetric) edges in CSR form.
+# Written as one .npz file, or as a folder of .npy files that can be memory-mapped.
+# Nothing here imports OCC, so saved graphs can be scanned/loaded without the CAD kernel.
+
+AAG_FORMAT_VERSION = 1
+FACE_TYPES = ("Plane", "Cylinder", "Other")
+EDGE_TYPES = ("convex", "concave", "tangent")
+
+
+def aag_arrays(face_data_list, G):
+    # G: graph from AAGBuilder_2D.build_aag_graph (one edge_type per face pair)
+    n = len(face_data_list)
+    face_type = np.array([FACE_TYPES.index(f['type']) if f['type'] in FACE_TYPES else FACE_TYPES.index("Other")
+                          for f in face_data_list], dtype=np.int8)
+    stock = np.array([f['stock_face'] == "Yes" for f in face_data_list], dtype=bool)
+    area = np.array([f['face_area'] for f in face_data_list], dtype=np.float64)
+    center = np.array([f['face_center'] for f in face_data_list], dtype=np.float64).reshape(n, 3)
+    normal = np.array([f['normal_vector_coords'] or (np.nan, np.nan, np.nan) for f in face_data_list],
+                      dtype=np.float64).reshape(n, 3)
+
+    # 1. Both directions of every edge, sorted by source node -> CSR
+    src, dst, etype = [], [], []
+    for u, v, data in G.edges(data=True):
+        code = EDGE_TYPES.index(data['edge_type'])
+        src.extend((u, v))
+        dst.extend((v, u))
+        etype.extend((code, code))
+    src = np.array(src, dtype=np.int32)
+    dst = np.array(dst, dtype=np.int32)
+    etype = np.array(etype, dtype=np.int8)
+    order = np.lexsort((dst, src))
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=n), out=indptr[1:])
+
+    return {
+        'face_type': face_type,
+        'stock': stock,
+        'area': area,
+        'center': center,
+        'normal': normal,
+        'indptr': indptr,
+        'indices': dst[order],
+        'edge_type': etype[order]
+    }
+
+
+#### Save / load ####
+
+def save_aag(path, arrays):
+    # path ending in .npz -> single file, anything else -> folder of .npy files (mmap-able)
+    meta = {'version': AAG_FORMAT_VERSION, 'face_types': FACE_TYPES, 'edge_types': EDGE_TYPES,
+            'n_faces': int(len(arrays['face_type'])), 'n_edges': int(len(arrays['indices']) // 2)}
+    if path.endswith('.npz'):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        np.savez(path, meta=np.array(json.dumps(meta)), **arrays) # uncompressed -> fast to read
+    else:
+        os.makedirs(path, exist_ok=True)
+        for name, values in arrays.items():
+            np.save(os.path.join(path, f"{name}.npy"), values)
+        with open(os.path.join(path, "meta.json"), 'w') as fh:
+            json.dump(meta, fh)
+    return path
+
+def load_aag(path, mmap=True):
+    # returns (meta, arrays); npz members are only read when accessed
+    if path.endswith('.npz'):
+        data = np.load(path)
+        meta = json.loads(str(data['meta']))
+        arrays = {name: data[name] for name in data.files if name != 'meta'}
+    else:
+        with open(os.path.join(path, "meta.json")) as fh:
+            meta = json.load(fh)
+        mode = 'r' if mmap else None
+        arrays = {os.path.splitext(name)[0]: np.load(os.path.join(path, name), mmap_mode=mode)
+                  for name in os.listdir(path) if name.endswith('.npy')}
+    if meta['version'] != AAG_FORMAT_VERSION:
+        raise ValueError(f"Unsupported AAG format version {meta['version']} in {path}")
+    return meta, arrays
+
+def iter_aags(folder, mmap=True):
+    # scan a folder of saved AAGs (.npz files and/or .npy folders)
+    for name in sorted(os.listdir(folder)):
+        path = os.path.join(folder, name)
+        if name.endswith('.npz') or os.path.isfile(os.path.join(path, "meta.json")):
+            yield path, load_aag(path, mmap)
+
+
+#### Back to NetworkX (only when needed) ####
+
+def neighbours(arrays, node):
+    start, end = arrays['indptr'][node], arrays['indptr'][node + 1]
+    return arrays['indices'][start:end], arrays['edge_type'][start:end]
+
+def to_networkx(arrays):
+    import networkx as nx
+    # same node/edge attributes as build_aag_graph (no OCC geometry)
+    G = nx.Graph()
+    indptr, indices, edge_type = arrays['indptr'], arrays['indices'], arrays['edge_type']
+    for i in range(len(arrays['face_type'])):
+        adjacent = indices[indptr[i]:indptr[i + 1]].tolist()
+        G.add_node(i, face_type=FACE_TYPES[arrays['face_type'][i]], geometry=None,
+                   adjacent_faces=adjacent, stock_face="Yes" if arrays['stock'][i] else "No",
+                   face_area=float(arrays['area'][i]), face_center=arrays['center'][i].tolist())
+    for i in range(len(arrays['face_type'])):
+        for k in range(indptr[i], indptr[i + 1]):
+            j = int(indices[k])
+            if i < j:
+                G.add_edge(i, j, edge_type=EDGE_TYPES[edge_type[k]])
+    return G
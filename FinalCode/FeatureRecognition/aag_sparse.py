@@ -0,0 +1,156 @@
+import numpy as np
+import networkx as nx
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+
+from FeatureRecognition.aag_builder import AAGBuilder_2D
+from FeatureRecognition.memory_profile import memory_stage
+
+
+# Sparse-matrix backend for the AAG: the graph is one symmetric CSR matrix with an edge-type
+# code per face pair. Stock faces / convex edges are removed with boolean masks and the
+# components come from scipy's csgraph. A NetworkX graph is only built for the candidates
+# the matcher actually looks at. Same interface as AAGBuilder_2D.
+
+EDGE_CODES = {"convex": 1, "concave": 2, "tangent": 3} # 0 = no edge
+EDGE_NAMES = {code: name for name, code in EDGE_CODES.items()}
+
+
+class LazySubgraphInfo(dict):
+    # candidate record like the ones of AAGBuilder_2D, 'subgraph' is built on first access
+    def __init__(self, build_subgraph, **info):
+        super().__init__(**info)
+        self._build_subgraph = build_subgraph
+
+    def __missing__(self, key):
+        if key != 'subgraph':
+            raise KeyError(key)
+        self['subgraph'] = self._build_subgraph()
+        return self['subgraph']
+
+
+class AAGBuilder_Sparse(AAGBuilder_2D):
+    def __init__(self, my_shape):
+        super().__init__(my_shape)
+        self.A = None # face x face, edge-type codes
+        self.keep_nodes = None
+        self.subgraphs_info_2 = []
+
+    # 1. BUILD MATRIX AND MASKS
+    @memory_stage("aag_construction")
+    def build_aag_matrix(self):
+        n = len(self.face_data_list)
+        # same rule as build_aag_graph: the first type found for a face pair wins
+        pair_codes = {}
+        for face_data in self.face_data_list:
+            i = face_data["index"]
+            for edge_type, key in (("convex", "convex_adjacent"), ("concave", "concave_adjacent"),
+                                   ("tangent", "tangent_adjacent")):
+                for j in face_data[key]:
+                    pair = (min(i, j), max(i, j))
+                    if pair not in pair_codes:
+                        pair_codes[pair] = EDGE_CODES[edge_type]
+
+        rows = np.array([p[0] for p in pair_codes], dtype=np.int32)
+        cols = np.array([p[1] for p in pair_codes], dtype=np.int32)
+        codes = np.array(list(pair_codes.values()), dtype=np.int8)
+        self.A = sparse.coo_matrix((np.concatenate([codes, codes]),
+                                    (np.concatenate([rows, cols]), np.concatenate([cols, rows]))),
+                                   shape=(n, n)).tocsr()
+
+        self.face_types = np.array([f["type"] for f in self.face_data_list])
+        self.non_stock = np.array([f["stock_face"] == "No" for f in self.face_data_list], dtype=bool)
+        return self.A
+
+    def _masked(self, A, node_mask, edge_mask=None):
+        # keep only edges between nodes of node_mask (and, optionally, of an allowed type)
+        A = A.tocoo()
+        keep = node_mask[A.row] & node_mask[A.col]
+        if edge_mask is not None:
+            keep &= edge_mask(A.data)
+        return sparse.csr_matrix((A.data[keep], (A.row[keep], A.col[keep])), shape=A.shape)
+
+    def build_aag_masks(self):
+        if self.A is None:
+            self.build_aag_matrix()
+        # subG: non-stock faces, no convex edges
+        self.A_sub = self._masked(self.A, self.non_stock, lambda codes: codes != EDGE_CODES["convex"])
+        # subG2: non-stock faces, every edge type (convex edges to stock faces go with the stock faces)
+        self.A_sub2 = self._masked(self.A, self.non_stock)
+
+        # same node selection as build_aag_subgraph: components with >1 face, or lone plane/cylinder
+        _, labels = connected_components(self.A_sub, directed=False)
+        sizes = np.bincount(labels)
+        lone_ok = np.isin(self.face_types, ("Cylinder", "Plane"))
+        self.keep_nodes = self.non_stock & ((sizes[labels] > 1) | lone_ok)
+
+        self.A_sub = self._masked(self.A_sub, self.keep_nodes)
+        self.A_sub2 = self._masked(self.A_sub2, self.keep_nodes)
+        return self.A_sub, self.A_sub2
+
+    # 2. CANDIDATES (connected components)
+    def _component_graph(self, A, nodes):
+        sg = nx.Graph()
+        for node in nodes:
+            face_data = self.face_data_list[node]
+            sg.add_node(node, face_type=face_data["type"], geometry=face_data["geom"],
+                        adjacent_faces=face_data["adjacent_indices"], stock_face=face_data["stock_face"])
+        block = sparse.triu(A[nodes][:, nodes]).tocoo()
+        for r, c, code in zip(block.row, block.col, block.data):
+            sg.add_edge(nodes[r], nodes[c], edge_type=EDGE_NAMES[int(code)])
+        return sg
+
+    def _components_info(self, A, faces=None):
+        # faces: only the components containing one of these faces get a record (revision mode)
+        _, labels = connected_components(A, directed=False)
+        kept = np.flatnonzero(self.keep_nodes)
+        if len(kept) == 0:
+            return []
+
+        # concave edges per component (upper triangle -> each edge once)
+        upper = sparse.triu(A).tocoo()
+        concave = upper.row[upper.data == EDGE_CODES["concave"]]
+        n_concave = np.bincount(labels[concave], minlength=labels.max() + 1)
+
+        # components ordered by their lowest face index, faces ascending (as with networkx)
+        components = {}
+        for node in kept:
+            components.setdefault(labels[node], []).append(int(node))
+        if faces is not None:
+            wanted = {labels[f] for f in faces if 0 <= f < len(labels) and self.keep_nodes[f]}
+            components = {label: nodes for label, nodes in components.items() if label in wanted}
+
+        info = []
+        for i, (label, nodes) in enumerate(components.items()):
+            info.append(LazySubgraphInfo(
+                lambda A=A, nodes=nodes: self._component_graph(A, nodes),
+                subgraph_idx=i,
+                nodes=nodes,
+                n_faces=len(nodes),
+                n_concave=int(n_concave[label]),
+                face_types=[self.face_data_list[node]['type'] for node in nodes]
+            ))
+        return info
+
+    def analyse_subgraphs(self, faces=None):
+        if self.keep_nodes is None:
+            self.build_aag_masks()
+        self.subgraphs_info = self._components_info(self.A_sub, faces)
+        return self.subgraphs_info
+
+    def analyse_subgraphs_not_all(self, faces=None):
+        if self.keep_nodes is None:
+            self.build_aag_masks()
+        self.subgraphs_info_2 = self._components_info(self.A_sub2, faces)
+        return self.subgraphs_info_2
+
+    # NetworkX versions of the filtered graphs, only needed for visualize_2d_aag
+    def build_aag_subgraph(self):
+        if self.keep_nodes is None:
+            self.build_aag_masks()
+        if self.G is None:
+            self.build_aag_graph()
+        nodes = np.flatnonzero(self.keep_nodes).tolist()
+        self.subG = self._component_graph(self.A_sub, nodes)
+        self.subG2 = self._component_graph(self.A_sub2, nodes)
+        return self.subG, self.subG2
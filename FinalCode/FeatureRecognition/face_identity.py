@@ -0,0 +1,86 @@
+import hashlib
+
+import numpy as np
+
+
+# Stable face identity. Face indices follow the TopExp_Explorer order, which changes whenever the
+# STEP exporter reorders entities; the uid only uses what depends neither on that order nor on where
+# the part is placed: the face's own invariants (type, area, radius, distance to the part centroid),
+# refined with its neighbourhood Weisfeiler-Lehman style (neighbour labels + edge type to each one).
+# Faces that are still equal after that (hole patterns, symmetries) are numbered "-0", "-1", ... by their
+# centre in the principal frame of the faces, which moves with the part; only faces the frame can't tell
+# apart either (exact symmetries of the part) fall back to index order.
+
+UID_LENGTH = 12
+EDGE_KEYS = (('convex_adjacent', "convex"), ('concave_adjacent', "concave"), ('tangent_adjacent', "tangent"))
+
+
+def _digest(*parts):
+    return hashlib.blake2b(repr(parts).encode(), digest_size=8).hexdigest()[:UID_LENGTH]
+
+def face_invariants(face_data, centroid, ndigits=3):
+    geom = face_data['geom']
+    radius = None
+    if face_data['type'] == "Cylinder" and geom is not None:
+        radius = round(geom.Radius(), ndigits)
+    distance = float(np.linalg.norm(np.asarray(face_data['face_center'], dtype=float) - centroid))
+    return (face_data['type'], round(face_data['face_area'], ndigits), radius, round(distance, ndigits))
+
+def principal_coords(centers, areas, centroid):
+    # face centres in the area-weighted principal axes of the faces (largest spread first), each axis
+    # pointing to the side where the faces are skewed -> same numbers wherever the part is placed
+    offsets = centers - centroid
+    weights = areas / max(areas.sum(), 1e-12)
+    _, axes = np.linalg.eigh((weights[:, None] * offsets).T @ offsets)
+    coords = offsets @ axes[:, ::-1]
+    skew = (weights[:, None] * coords ** 3).sum(axis=0)
+    return coords * np.where(skew < 0, -1.0, 1.0)
+
+def face_uids(face_data_list, rounds=None, ndigits=3):
+    # -> one uid per face, same order as face_data_list
+    # rounds: refinement rounds (None -> until the partition is stable, at most n)
+    n = len(face_data_list)
+    if n == 0:
+        return []
+    areas = np.array([f['face_area'] for f in face_data_list], dtype=float)
+    centers = np.array([f['face_center'] for f in face_data_list], dtype=float).reshape(n, 3)
+    centroid = (areas[:, None] * centers).sum(axis=0) / max(areas.sum(), 1e-12)
+
+    neighbours = [[(j, edge) for key, edge in EDGE_KEYS for j in f[key]] for f in face_data_list]
+    labels = [_digest(*face_invariants(f, centroid, ndigits)) for f in face_data_list]
+
+    # 1. Refine with the neighbourhood until the partition of the faces stops growing
+    for _ in range(n if rounds is None else rounds):
+        new_labels = [_digest(labels[i], sorted((edge, labels[j]) for j, edge in neighbours[i]))
+                      for i in range(n)]
+        grew = len(set(new_labels)) > len(set(labels))
+        labels = new_labels
+        if not grew:
+            break
+
+    # 2. Faces with the same label get a counter, in the order of their centre in the principal frame
+    groups = {}
+    for i, label in enumerate(labels):
+        groups.setdefault(label, []).append(i)
+    uids = list(labels)
+    coords = None
+    for label, members in groups.items():
+        if len(members) == 1:
+            continue
+        if coords is None:
+            coords = np.round(principal_coords(centers, areas, centroid), ndigits) + 0.0 # (no -0.0)
+        for k, i in enumerate(sorted(members, key=lambda i: (tuple(coords[i]), i))):
+            uids[i] = f"{label}-{k}"
+    return uids
+
+def assign_face_uids(face_data_list, rounds=None, ndigits=3):
+    for face_data, uid in zip(face_data_list, face_uids(face_data_list, rounds, ndigits)):
+        face_data['uid'] = uid
+    return face_data_list
+
+def feature_uid(feature_type, node_uids):
+    # same feature type on the same faces -> same id, whatever the face order
+    return _digest(feature_type, sorted(node_uids))
+
+def index_by_uid(face_data_list):
+    return {f['uid']: f['index'] for f in face_data_list}
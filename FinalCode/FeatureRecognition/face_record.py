@@ -0,0 +1,80 @@
+# Face record of the shape analysis. The fixed fields live in __slots__ (no dict per face) and the
+# coordinates are float tuples, but it is read and written like the old face dicts:
+# f['type'], f.get('bbox'), f['fingerprint'] = ..., 'stock_face' in f.
+# The OCC handles (TopoDS face, gp surface, gp_Vec / gp_Dir) can be dropped with detach() once
+# nothing needs the B-rep anymore; what remains is plain numbers and index lists.
+
+OCC_FIELDS = ('face', 'geom', 'normal_vector', 'cylinder_axis')
+COORD_FIELDS = ('face_center', 'bbox', 'normal_vector_coords', 'cylinder_axis_coords')
+
+
+class FaceRecord:
+    __slots__ = ('index', 'face', 'type', 'geom', 'face_area', 'face_center', 'bbox', 'stock_face',
+                 'adjacent_indices', 'convex_adjacent', 'concave_adjacent', 'tangent_adjacent',
+                 'normal_vector', 'normal_vector_coords', 'normal_vector_axis',
+                 'cylinder_axis', 'cylinder_axis_coords', 'uid', '_extra')
+    FIELDS = __slots__[:-1]
+    _FIELD_SET = frozenset(FIELDS)
+
+    def __init__(self, **fields):
+        self._extra = None # any other key set later (e.g. 'fingerprint')
+        for key in self.FIELDS:
+            value = fields.pop(key, None)
+            if key in COORD_FIELDS and value is not None:
+                value = tuple(float(c) for c in value)
+            setattr(self, key, value)
+        for key, value in fields.items():
+            self[key] = value
+
+    # dict-style access
+    def __getitem__(self, key):
+        if key in self._FIELD_SET:
+            return getattr(self, key)
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in self._FIELD_SET:
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __contains__(self, key):
+        return key in self._FIELD_SET or (self._extra is not None and key in self._extra)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return list(self.FIELDS) + list(self._extra or ())
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def __repr__(self):
+        return f"FaceRecord(index={self.index}, type={self.type}, stock_face={self.stock_face})"
+
+    # heavy payload
+    @property
+    def detached(self):
+        return self.face is None
+
+    def detach(self):
+        for key in OCC_FIELDS:
+            setattr(self, key, None)
+        return self
+
+
+def detach_faces(face_data_list):
+    for face_data in face_data_list:
+        face_data.detach()
+    return face_data_list
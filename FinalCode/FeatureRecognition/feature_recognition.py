@@ -1,10 +1,13 @@
 from typing import Dict, List, Tuple
+import numpy as np
 import networkx as nx
-import plotly.graph_objects as go
 from FeatureRecognition.aag_builder import AAGBuilder_2D, AAGBuilder_3D
-from FeatureRecognition.geometry_analysis import load_step_file, analyze_shape
-from FeatureRecognition.part_vizualizer_plotly import Part_Visualizer
-from networkx.generators.harary_graph import hkn_harary_graph
+from FeatureRecognition.geometry_analysis import load_step_file, analyze_shape, get_shape_mesh
+from FeatureRecognition.mesh_raster import footprint_areas
+from FeatureRecognition.figure_export import show_or_export, write_glb, mesh_vertex_face_ids
+from FeatureRecognition.aabb_tree import AABBTree
+from FeatureRecognition.face_identity import feature_uid
+from FeatureRecognition.memory_profile import memory_stage
 
 
 class FeatureLibrary:
@@ -175,10 +178,20 @@ class FeatureLibrary:
 
 
 class FeatureRecognition:
-    def __init__(self, my_shape):
-        self.aag = AAGBuilder_2D(my_shape)
-        self.subgraphs_info = self.aag.analyse_subgraphs()
-        self.subgraphs_info_2 = self.aag.analyse_subgraphs_not_all()
+    def __init__(self, my_shape, backend="networkx", candidate_faces=None):
+        # backend: "networkx" (AAGBuilder_2D) or "sparse" (scipy matrix + csgraph, AAGBuilder_Sparse)
+        # candidate_faces: only the AAG components containing these faces are built and matched
+        if backend == "sparse":
+            from FeatureRecognition.aag_sparse import AAGBuilder_Sparse
+            self.aag = AAGBuilder_Sparse(my_shape)
+        elif backend == "networkx":
+            self.aag = AAGBuilder_2D(my_shape)
+        else:
+            raise ValueError(f"Unknown AAG backend: {backend}")
+        # AAG components are only built when the matcher needs them (not with cached matches)
+        self.candidate_faces = candidate_faces
+        self._subgraphs_info = None
+        self._subgraphs_info_2 = None
         self.colors_rgb = self.aag.colors_rgb
         self.shape = my_shape
         (self.all_faces, self.face_data_list, self.analyser, self.all_edges,
@@ -189,6 +202,19 @@ class FeatureRecognition:
 
 
         self.matches: List[Dict] = None
+        self._footprints = None # axis -> {feat_idx: projected area}, see get_footprints
+
+    @property
+    def subgraphs_info(self):
+        if self._subgraphs_info is None:
+            self._subgraphs_info = self.aag.analyse_subgraphs(self.candidate_faces)
+        return self._subgraphs_info
+
+    @property
+    def subgraphs_info_2(self):
+        if self._subgraphs_info_2 is None:
+            self._subgraphs_info_2 = self.aag.analyse_subgraphs_not_all(self.candidate_faces)
+        return self._subgraphs_info_2
 
     # Free Form Pocket: 1 base node connected to n-1 nodes, that are all connected in a loop
     # all nodes are planes
@@ -320,6 +346,7 @@ class FeatureRecognition:
 
 
 
+    @memory_stage("identify_features")
     def identify_features(self) -> List[Dict]:
         if self.matches is not None:
             return self.matches
@@ -442,7 +469,6 @@ class FeatureRecognition:
 
         # 2. Second Pass (Conjoined - Only if nodes were flagged in Pass 1)
         for candidate_info in feature_candidates_2:
-            candidate_graph = candidate_info['subgraph']
             candidate_nodes = candidate_info['nodes']
             n_nodes = len(candidate_nodes)
             matched = False
@@ -454,6 +480,7 @@ class FeatureRecognition:
             # 2. Only proceed if these nodes are in our "suspect" set
             if not any(node in check_conjoined_pocket for node in candidate_nodes):
                 continue
+            candidate_graph = candidate_info['subgraph'] # (sparse backend builds it only here)
 
             # Conjoined Pockets Logic
             G_blind, G_thru = self.build_conjoined_pocket(n_nodes)
@@ -501,13 +528,18 @@ class FeatureRecognition:
 
             if not matched:
                 print(f"Candidate {candidate_idx} still unrecognized.")
+
+        # 3. Stable ids, so results can be compared between runs (indices depend on the STEP order)
+        for match in self.matches:
+            match['node_uids'] = [self.face_data_list[i]['uid'] for i in match['node_indices']]
+            match['feature_uid'] = feature_uid(match['feature_type'], match['node_uids'])
         return self.matches
 
     def visualize_features_3d(self, show_mesh=True, mesh_opacity=0.7,
                               show_face_centers=True, show_edges=True, show_feat_idx=True,
-                              show_all_face_centers = False):
+                              show_all_face_centers = False, output_path=None):
         import plotly.graph_objects as go
-        import numpy as np
+        from FeatureRecognition.plotly_traces import part_mesh_trace, legend_entry, edge_line_traces
 
         fig = go.Figure()
 
@@ -532,9 +564,15 @@ class FeatureRecognition:
 
         feature_colors = self.colors_rgb
 
-        # Colored Features + mesh
+        # Colored Features + mesh -> one Mesh3d per opacity (stock, unrecognized, features),
+        # colour per triangle from its face's group
         if show_mesh:
-            feature_groups = {}
+            group_colors = {
+                'stock': (200 / 255, 200 / 255, 200 / 255),
+                'unrecognized': (100 / 255, 100 / 255, 100 / 255)
+            }
+            group_keys = []
+            face_codes = np.zeros(len(self.face_data_list), dtype=np.int64)
             for face_data in self.face_data_list:
                 face_idx = face_data['index']
 
@@ -545,62 +583,32 @@ class FeatureRecognition:
                 else:
                     group_key = 'unrecognized'
 
-                if group_key not in feature_groups:
-                    feature_groups[group_key] = []
-                feature_groups[group_key].append(face_data)
-
-            for group_key, faces in feature_groups.items():
-                all_vertices = []
-                all_triangles = []
-                vertex_offset = 0
-
-                for face_data in faces:
-                    vertices = face_data.get('mesh_vertices', [])
-                    triangles = face_data.get('mesh_triangles', [])
-
-                    if not vertices or not triangles:
+                if group_key not in group_keys:
+                    group_keys.append(group_key)
+                face_codes[face_idx] = group_keys.index(group_key)
+
+            code_colors = [group_colors.get(k, feature_colors.get(k, (0.7, 0.7, 0.7))) for k in group_keys]
+            face_groups = np.array(group_keys, dtype=object)[face_codes]
+            layers = [('Part Body', face_groups == 'stock', 0.1),
+                      ('Unrecognized', face_groups == 'unrecognized', 0.5),
+                      ('Features', (face_groups != 'stock') & (face_groups != 'unrecognized'), mesh_opacity)]
+            mesh = get_shape_mesh(self.shape)
+            if len(mesh['triangles']):
+                for name, face_mask, opacity in layers:
+                    if not face_mask.any():
                         continue
-
-                    all_vertices.extend(vertices)
-                    for tri in triangles:
-                        all_triangles.append([
-                            tri[0] + vertex_offset,
-                            tri[1] + vertex_offset,
-                            tri[2] + vertex_offset
-                        ])
-                    vertex_offset += len(vertices)
-
-                if not all_vertices:
-                    continue
-
-                if group_key == 'stock':
-                    color_str = 'rgb(200, 200, 200)'
-                    current_opacity = 0.1
-                elif group_key == 'unrecognized':
-                    color_str = 'rgb(100, 100, 100)'
-                    current_opacity = 0.5
-                else:
-                    r, g, b = feature_colors.get(group_key, (0.7, 0.7, 0.7))
-                    color_str = f'rgb({int(r * 255)},{int(g * 255)},{int(b * 255)})'
-                    current_opacity = mesh_opacity
-
-                display_name = feature_name_map.get(group_key, group_key)
-
-                fig.add_trace(go.Mesh3d(
-                    x=[v[0] for v in all_vertices],
-                    y=[v[1] for v in all_vertices],
-                    z=[v[2] for v in all_vertices],
-                    i=[t[0] for t in all_triangles],
-                    j=[t[1] for t in all_triangles],
-                    k=[t[2] for t in all_triangles],
-                    color=color_str,
-                    opacity=current_opacity,
-                    name=display_name,
-                    showlegend=True,
-                    flatshading=False,
-                    lighting=dict(ambient=0.5, diffuse=0.8, specular=0.2),
-                    lightposition=dict(x=100, y=200, z=300)
-                ))
+                    fig.add_trace(part_mesh_trace(
+                        mesh, face_codes, code_colors,
+                        face_mask=face_mask,
+                        opacity=opacity,
+                        name=name,
+                        showlegend=False,
+                        flatshading=False,
+                        lighting=dict(ambient=0.5, diffuse=0.8, specular=0.2),
+                        lightposition=dict(x=100, y=200, z=300)
+                    ))
+                for group_key, rgb in zip(group_keys, code_colors):
+                    fig.add_trace(legend_entry(feature_name_map.get(group_key, group_key), rgb))
 
         # 2. FACE nodes
         if show_face_centers:
@@ -706,62 +714,16 @@ class FeatureRecognition:
                     showlegend=True
                 ))
 
-        # 3. EDGES
+        # 3. EDGES (one line trace per class)
         if show_edges:
-            edge_groups = {
-                'Convex': {
-                    'x': [], 'y': [], 'z': [],
-                    'color': self.colors_rgb.get('edge_convex', (0, 0, 1)),  # Blue-ish
-                    'width': 4
-                },
-                'Concave': {
-                    'x': [], 'y': [], 'z': [],
-                    'color': self.colors_rgb.get('edge_concave', (1, 0, 0)),  # Red
-                    'width': 4
-                },
-                'Tangent': {
-                    'x': [], 'y': [], 'z': [],
-                    'color': self.colors_rgb.get('edge_tangent', (0, 1, 0)),  # Green
-                    'width': 3
-                },
-                'Unknown': {
-                    'x': [], 'y': [], 'z': [],
-                    'color': (0.5, 0.5, 0.5),
-                    'width': 2
-                }
+            edge_styles = {
+                'Convex': {'color': self.colors_rgb.get('edge_convex', (0, 0, 1)), 'width': 4},  # Blue-ish
+                'Concave': {'color': self.colors_rgb.get('edge_concave', (1, 0, 0)), 'width': 4},  # Red
+                'Tangent': {'color': self.colors_rgb.get('edge_tangent', (0, 1, 0)), 'width': 3},  # Green
+                'Unknown': {'color': (0.5, 0.5, 0.5), 'width': 2}
             }
-
-            for edge in self.edge_data_list:
-                # Type
-                etype = 'Unknown'
-                if edge.get('classification'):
-                    etype = edge['classification'][0]  # Take the first classification
-
-                # Geometry Points
-                points = edge.get('points', [])
-                if len(points) == 0:
-                    continue
-
-                group = edge_groups.get(etype, edge_groups['Unknown'])
-
-                group['x'].extend([p[0] for p in points] + [None])
-                group['y'].extend([p[1] for p in points] + [None])
-                group['z'].extend([p[2] for p in points] + [None])
-
-            for name, group in edge_groups.items():
-                if not group['x']:
-                    continue
-
-                r, g, b = group['color']
-                color_str = f'rgb({int(r * 255)},{int(g * 255)},{int(b * 255)})'
-
-                fig.add_trace(go.Scatter3d(
-                    x=group['x'], y=group['y'], z=group['z'],
-                    mode='lines',
-                    line=dict(color=color_str, width=group['width']),
-                    name=f"{name} Edges",
-                    showlegend=True
-                ))
+            for trace in edge_line_traces(self.edge_data_list, edge_styles):
+                fig.add_trace(trace)
 
         fig.update_layout(
             title="Feature Recognition Visualization",
@@ -774,43 +736,71 @@ class FeatureRecognition:
             legend=dict(yanchor="top", y=0.99, xanchor="left", x=0.01),
             width=1200, height=900
         )
-        fig.show()
+        show_or_export(fig, output_path)
+
+    def export_features_glb(self, output_path):
+        # part mesh as binary glTF, every vertex carries its face index and feature id (0 = none)
+        if self.matches is None:
+            self.identify_features()
+        face_feature = np.zeros(len(self.face_data_list))
+        for match in self.matches:
+            face_feature[match['node_indices']] = match['feat_idx']
+
+        mesh = get_shape_mesh(self.shape)
+        vertex_faces = mesh_vertex_face_ids(mesh)
+        return write_glb(output_path, mesh['vertices'], mesh['triangles'], {
+            '_FACE_ID': vertex_faces,
+            '_FEATURE_ID': face_feature[vertex_faces]
+        })
 
 
     #FOR AREA THING OF THROUGH POCKETS AND HOLES
     def get_feature_bbox(self, face_indices):
         """Calculates the overall bounding box for a set of faces."""
-        all_x, all_y, all_z = [], [], []
-        for idx in face_indices:
-            # Assuming face_data_list[idx] contains 'bbox' as [xmin, ymin, zmin, xmax, ymax, zmax]
-            bbox = self.face_data_list[idx].get('bbox')
-            if bbox:
-                all_x.extend([bbox[0], bbox[3]])
-                all_y.extend([bbox[1], bbox[4]])
-                all_z.extend([bbox[2], bbox[5]])
-
-        if not all_x: return (0, 0, 0, 0, 0, 0)
-        return (min(all_x), min(all_y), min(all_z), max(all_x), max(all_y), max(all_z))
+        boxes = [self.face_data_list[idx]['bbox'] for idx in face_indices if self.face_data_list[idx].get('bbox')]
+        if not boxes: return (0, 0, 0, 0, 0, 0)
+        boxes = np.array(boxes)
+        return tuple(np.concatenate([boxes[:, :3].min(axis=0), boxes[:, 3:].max(axis=0)]).tolist())
+
+    def get_feature_boxes(self):
+        # feat_idx -> box of the feature (union of its face boxes)
+        if self.matches is None:
+            self.identify_features()
+        return {m['feat_idx']: self.get_feature_bbox(m['node_indices']) for m in self.matches}
+
+    def get_face_tree(self):
+        # AABB tree of all face boxes (ids = face index)
+        if getattr(self, '_face_tree', None) is None:
+            self._face_tree = AABBTree([f['bbox'] for f in self.face_data_list])
+        return self._face_tree
+
+    def get_feature_tree(self):
+        # AABB tree of the feature boxes (ids = feat_idx)
+        if getattr(self, '_feature_tree', None) is None:
+            boxes = self.get_feature_boxes()
+            self._feature_tree = AABBTree(list(boxes.values()), ids=list(boxes.keys()))
+        return self._feature_tree
+
+    def get_footprints(self, resolution=256):
+        # filled projected footprint of every feature along x, y and z (rasterised per feature, cached)
+        if self._footprints is None:
+            if self.matches is None:
+                self.identify_features()
+            mesh = get_shape_mesh(self.shape)
+            face_feature = np.full(len(self.face_data_list), -1, dtype=np.int64)
+            for match in self.matches:
+                face_feature[match['node_indices']] = match['feat_idx']
+            tri_label = face_feature[mesh['tri_face']]
+            self._footprints = {}
+            for axis in ('x', 'y', 'z'):
+                self._footprints[axis] = footprint_areas(mesh['vertices'], mesh['triangles'], tri_label,
+                                                         axis, resolution)
+        return self._footprints
 
     def get_projected_area(self, feat_idx, axis_label):
-        """Calculates the footprint area of a feature projected onto the plane of the TAD."""
-        # Find the match dictionary
-        match = next((m for m in self.matches if m['feat_idx'] == feat_idx), None)
-        if not match: return 0
-
-        xmin, ymin, zmin, xmax, ymax, zmax = self.get_feature_bbox(match['node_indices'])
-
-        dx = xmax - xmin
-        dy = ymax - ymin
-        dz = zmax - zmin
-
-        # Projection depends on which way the tool is pointing
-        if 'z' in axis_label:
-            return dx * dy
-        elif 'x' in axis_label:
-            return dy * dz
-        elif 'y' in axis_label:
-            return dx * dz
-
-        return 0
+        """Footprint area of a feature projected onto the plane of the TAD."""
+        axis = axis_label.replace('-', '')
+        if axis not in ('x', 'y', 'z'):
+            return 0
+        return self.get_footprints()[axis].get(feat_idx, 0)
 
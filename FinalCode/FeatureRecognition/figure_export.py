@@ -0,0 +1,105 @@
+import json
+import os
+import struct
+
+import numpy as np
+
+
+# Headless output for the visualisations: instead of fig.show() / plt.show() the figures are
+# written to disk, so they can be produced inside batch workers without a display server.
+
+def show_or_export(fig, output_path=None):
+    # plotly figure -> browser, or .html (self-contained) / .png / .json file
+    if output_path is None:
+        fig.show()
+        return None
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    ext = os.path.splitext(output_path)[1].lower()
+    if ext == '.html':
+        fig.write_html(output_path, include_plotlyjs=True, full_html=True)
+    elif ext == '.png':
+        fig.write_image(output_path) # needs kaleido
+    elif ext == '.json':
+        fig.write_json(output_path)
+    else:
+        raise ValueError(f"Unsupported export format: {ext}")
+    print(f"Figure written to {output_path}")
+    return output_path
+
+def show_or_save_matplotlib(fig, output_path=None):
+    import matplotlib.pyplot as plt
+    if output_path is None:
+        plt.show()
+        return None
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    fig.savefig(output_path, dpi=150, bbox_inches='tight')
+    plt.close(fig)
+    print(f"Figure written to {output_path}")
+    return output_path
+
+
+#### Binary glTF (.glb) of the shared mesh, face/feature ids as vertex attributes ####
+
+def mesh_vertex_face_ids(mesh):
+    # every vertex of the shared mesh belongs to exactly one face
+    counts = np.diff(mesh['face_vertex_offsets'])
+    return np.repeat(np.arange(len(counts)), counts)
+
+def write_glb(output_path, vertices, triangles, vertex_attributes=None):
+    # vertex_attributes: name -> per-vertex scalar array (names must start with '_' in glTF)
+    positions = np.ascontiguousarray(vertices, dtype=np.float32)
+    indices = np.ascontiguousarray(triangles, dtype=np.uint32).ravel()
+    vertex_attributes = vertex_attributes or {}
+
+    blobs, buffer_views, accessors = [], [], []
+    offset = 0
+
+    def add_blob(data, target):
+        nonlocal offset
+        raw = data.tobytes()
+        raw += b'\x00' * ((4 - len(raw) % 4) % 4)
+        buffer_views.append({'buffer': 0, 'byteOffset': offset, 'byteLength': data.nbytes, 'target': target})
+        blobs.append(raw)
+        offset += len(raw)
+        return len(buffer_views) - 1
+
+    # 1. positions
+    view = add_blob(positions, 34962) # ARRAY_BUFFER
+    accessors.append({'bufferView': view, 'componentType': 5126, 'count': len(positions), 'type': 'VEC3',
+                      'min': positions.min(axis=0).tolist(), 'max': positions.max(axis=0).tolist()})
+    attributes = {'POSITION': 0}
+
+    # 2. custom per-vertex attributes
+    for name, values in vertex_attributes.items():
+        values = np.ascontiguousarray(values, dtype=np.float32)
+        view = add_blob(values, 34962)
+        accessors.append({'bufferView': view, 'componentType': 5126, 'count': len(values), 'type': 'SCALAR'})
+        attributes[name] = len(accessors) - 1
+
+    # 3. triangle indices
+    view = add_blob(indices, 34963) # ELEMENT_ARRAY_BUFFER
+    accessors.append({'bufferView': view, 'componentType': 5125, 'count': len(indices), 'type': 'SCALAR'})
+
+    gltf = {
+        'asset': {'version': '2.0', 'generator': 'FeatureRecognition'},
+        'scene': 0,
+        'scenes': [{'nodes': [0]}],
+        'nodes': [{'mesh': 0}],
+        'meshes': [{'primitives': [{'attributes': attributes, 'indices': len(accessors) - 1, 'mode': 4}]}],
+        'buffers': [{'byteLength': offset}],
+        'bufferViews': buffer_views,
+        'accessors': accessors
+    }
+    json_chunk = json.dumps(gltf, separators=(',', ':')).encode()
+    json_chunk += b' ' * ((4 - len(json_chunk) % 4) % 4)
+    bin_chunk = b''.join(blobs)
+
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, 'wb') as fh:
+        fh.write(struct.pack('<III', 0x46546C67, 2, 12 + 8 + len(json_chunk) + 8 + len(bin_chunk)))
+        fh.write(struct.pack('<II', len(json_chunk), 0x4E4F534A)) # JSON
+        fh.write(json_chunk)
+        fh.write(struct.pack('<II', len(bin_chunk), 0x004E4942)) # BIN
+        fh.write(bin_chunk)
+    print(f"glTF written to {output_path}")
+    return output_path
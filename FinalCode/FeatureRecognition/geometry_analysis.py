@@ -1,9 +1,13 @@
+import hashlib
 import os
 import numpy as np
+import OCC
 from OCC.Core.STEPControl import STEPControl_Reader
+from OCC.Core.BinTools import bintools
+from OCC.Core.TopoDS import TopoDS_Shape
 from OCC.Core.IFSelect import IFSelect_RetDone
 from OCC.Core.TopExp import TopExp_Explorer
-from OCC.Core.TopAbs import TopAbs_FACE, TopAbs_EDGE
+from OCC.Core.TopAbs import TopAbs_FACE, TopAbs_EDGE, TopAbs_SOLID, TopAbs_FORWARD
 from OCC.Core.TopoDS import TopoDS_Face
 from OCC.Core import TopoDS
 from OCC.Core.BRepAdaptor import BRepAdaptor_Surface, BRepAdaptor_Curve
@@ -20,41 +24,136 @@ from OCC.Core.GeomAbs import (GeomAbs_Plane, GeomAbs_Cylinder,
 )
 from OCC.Core.GProp import GProp_GProps
 from OCC.Core.BRepGProp import brepgprop
+from OCC.Core.GCPnts import GCPnts_QuasiUniformDeflection
 
 from OCC.Core.Bnd import Bnd_Box
 from OCC.Core.BRepBndLib import brepbndlib
+from FeatureRecognition.memory_profile import memory_stage
 
 from OCC.Core.gp import gp_Pnt, gp_Vec
 
 from OCC.Core.BRepMesh import BRepMesh_IncrementalMesh
+from OCC.Core.BRepTools import breptools
 from OCC.Core.TopLoc import TopLoc_Location
 from OCC.Core.BRep import BRep_Tool
 
 from OCC.Core.gp import gp_Dir
 
+from FeatureRecognition.face_record import FaceRecord, detach_faces
+from FeatureRecognition.face_identity import assign_face_uids
 
 
-def load_step_file(step_file):
+
+#### STEP -> binary BREP cache ####
+# STEP translation is slow, so the translated shape is also written in OCC's binary BREP format and
+# read back directly next time. The file name is <stem>_<hash of the STEP path>_<hash of the content
+# + OCC version>: an edited STEP gets a new name and the old BREP of that same file is removed, while
+# STEP files with the same name in other folders (shared cache folder) keep their own entries.
+BREP_CACHE_ENV = "STEP_BREP_CACHE" # folder for the cache (default: .brep_cache next to the STEP)
+
+def step_content_hash(step_file, chunk=1 << 20):
+    sha = hashlib.sha256(OCC.VERSION.encode())
+    with open(step_file, 'rb') as fh:
+        for block in iter(lambda: fh.read(chunk), b''):
+            sha.update(block)
+    return sha.hexdigest()[:20]
+
+def brep_cache_path(step_file, cache_dir=None):
+    cache_dir = cache_dir or os.environ.get(BREP_CACHE_ENV) or \
+                os.path.join(os.path.dirname(os.path.abspath(step_file)), ".brep_cache")
+    stem = os.path.splitext(os.path.basename(step_file))[0]
+    path_hash = hashlib.sha1(os.path.abspath(step_file).encode()).hexdigest()[:8]
+    return os.path.join(cache_dir, f"{stem}_{path_hash}_{step_content_hash(step_file)}.bbrep")
+
+def read_brep_cache(path):
+    if not os.path.exists(path):
+        return None
+    shape = TopoDS_Shape()
+    if not bintools.Read(shape, path) or shape.IsNull():
+        return None
+    return shape
+
+def write_brep_cache(path, shape):
+    # best effort: a read-only folder just means no cache
+    try:
+        folder = os.path.dirname(path)
+        os.makedirs(folder, exist_ok=True)
+        source = os.path.basename(path).rsplit('_', 1)[0] # <stem>_<path hash>
+        for name in os.listdir(folder): # older versions of the same STEP file
+            if name.endswith('.bbrep') and name.rsplit('_', 1)[0] == source:
+                os.remove(os.path.join(folder, name))
+        tmp = f"{path}.{os.getpid()}.tmp"
+        if bintools.Write(shape, tmp):
+            os.replace(tmp, path)
+        elif os.path.exists(tmp):
+            os.remove(tmp)
+    except OSError as e:
+        print(f"BREP cache not written ({e})")
+
+def load_step_file(step_file, use_brep_cache=True, cache_dir=None):
     if not os.path.exists(step_file):
         print("ERROR: NO STEP FILE")
         return None
 
+    cache_path = brep_cache_path(step_file, cache_dir) if use_brep_cache else None
+    if cache_path:
+        shape = read_brep_cache(cache_path)
+        if shape is not None:
+            print("STEP file loaded from the BREP cache!")
+            return shape
+
     reader_occ = STEPControl_Reader() #translate step file info to smth readable by OCC
 
     if reader_occ.ReadFile(step_file) == IFSelect_RetDone: #reads file --> success or failure
         print("STEP file read successfully!")
         reader_occ.TransferRoots() #step data --> occ internal representation
         shape = reader_occ.OneShape() #shape with all geometry
+        if cache_path:
+            write_brep_cache(cache_path, shape)
         return shape
     else:
         print("ERROR: Could not read STEP file.")
         return None
 
+def location_matrix(location):
+    # placement of a solid/instance as a 3x4 matrix (rotation | translation)
+    trsf = location.Transformation()
+    return [[trsf.Value(r, c) for c in range(1, 5)] for r in range(1, 4)]
+
+def load_step_solids(step_file, use_brep_cache=True, cache_dir=None):
+    # every solid (or placed part instance) of a multi-body / assembly STEP as its own work item
+    shape = load_step_file(step_file, use_brep_cache, cache_dir)
+    if not shape:
+        return []
+
+    solids = []
+    solid_explorer = TopExp_Explorer(shape, TopAbs_SOLID)
+    while solid_explorer.More():
+        solid = TopoDS.Solid(solid_explorer.Current())
+        solids.append({
+            'step_file': step_file,
+            'solid_idx': len(solids),
+            'shape': solid,
+            'transform': location_matrix(solid.Location())
+        })
+        solid_explorer.Next()
+
+    # no solids (e.g. a shell model) -> keep the old behaviour and treat everything as one part
+    if not solids:
+        solids.append({
+            'step_file': step_file,
+            'solid_idx': 0,
+            'shape': shape,
+            'transform': location_matrix(shape.Location())
+        })
+    print(f"{len(solids)} solid(s) found in {os.path.basename(step_file)}")
+    return solids
+
 
 def get_stock_box(shape, tol=1e-6):
     bbox = Bnd_Box()
     bbox.SetGap(tol)  # small tolerance to avoid precision issues
-    brepbndlib.Add(shape, bbox)  # Add shape to bounding box
+    brepbndlib.AddOptimal(shape, bbox, False, False)  # exact box from the geometry (no mesh needed)
     xmin, ymin, zmin, xmax, ymax, zmax = bbox.Get()
     cx = 0.5 * (xmin + xmax)
     cy = 0.5 * (ymin + ymax)
@@ -62,6 +161,12 @@ def get_stock_box(shape, tol=1e-6):
     stock_box_center = gp_Pnt(cx, cy, cz)
     return xmin, ymin, zmin, xmax, ymax, zmax, stock_box_center
 
+def get_face_bbox(face):
+    # [xmin, ymin, zmin, xmax, ymax, zmax] of a single face (exact, from the geometry)
+    bbox = Bnd_Box()
+    brepbndlib.AddOptimal(face, bbox, False, False)
+    return list(bbox.Get())
+
 def get_face_geometry(face):
     adaptor = BRepAdaptor_Surface(face, True) #adapts a face so it can be treated as a surface
     face_type = adaptor.GetType()
@@ -225,6 +330,63 @@ def triangulate_shape(shape, linear_deflection=0.1):
     if not mesher.IsDone():
         print("Warning: Meshing may be incomplete")
 
+#### Shared mesh: one triangulation per (shape, deflection), only built on demand ####
+_mesh_cache = {}
+
+def default_deflection(shape, ratio=5e-4, minimum=0.01):
+    # deflection scales with the part size (~0.1 for a 100 mm part)
+    xmin, ymin, zmin, xmax, ymax, zmax, _ = get_stock_box(shape)
+    diagonal = np.sqrt((xmax - xmin) ** 2 + (ymax - ymin) ** 2 + (zmax - zmin) ** 2)
+    return max(round(diagonal * ratio, 4), minimum)
+
+@memory_stage("mesh_extraction")
+def get_shape_mesh(shape, linear_deflection=None):
+    # all face meshes in flat numpy arrays, faces in the same order as analyze_shape
+    if (shape, linear_deflection) in _mesh_cache:
+        return _mesh_cache[(shape, linear_deflection)]
+    if linear_deflection is None:
+        mesh = get_shape_mesh(shape, default_deflection(shape))
+        _mesh_cache[(shape, None)] = mesh # default mesh, same object
+        return mesh
+    key = (shape, linear_deflection)
+
+    breptools.Clean(shape) # drop any triangulation made with another deflection
+    triangulate_shape(shape, linear_deflection)
+
+    vertices, triangles, tri_face = [], [], []
+    face_vertex_offsets, face_tri_offsets = [0], [0]
+    for face_idx, face in enumerate(get_all_faces(shape)):
+        face_vertices, face_triangles = triangulate_face(face)
+        offset = face_vertex_offsets[-1]
+        vertices.extend(face_vertices)
+        for n1, n2, n3 in face_triangles:
+            # keep the triangles facing outwards
+            if face.Orientation() == TopAbs_FORWARD:
+                triangles.append([n1 + offset, n2 + offset, n3 + offset])
+            else:
+                triangles.append([n1 + offset, n3 + offset, n2 + offset])
+            tri_face.append(face_idx)
+        face_vertex_offsets.append(offset + len(face_vertices))
+        face_tri_offsets.append(len(triangles))
+
+    mesh = {
+        'deflection': linear_deflection,
+        'vertices': np.array(vertices, dtype=float).reshape(-1, 3),
+        'triangles': np.array(triangles, dtype=np.int64).reshape(-1, 3),
+        'tri_face': np.array(tri_face, dtype=np.int64),  # face index of every triangle
+        'face_vertex_offsets': np.array(face_vertex_offsets, dtype=np.int64),
+        'face_tri_offsets': np.array(face_tri_offsets, dtype=np.int64)
+    }
+    _mesh_cache[key] = mesh
+    return mesh
+
+def get_face_mesh(shape, face_idx, linear_deflection=None):
+    # vertices and (local) triangles of one face, taken from the shared mesh
+    mesh = get_shape_mesh(shape, linear_deflection)
+    v0, v1 = mesh['face_vertex_offsets'][face_idx], mesh['face_vertex_offsets'][face_idx + 1]
+    t0, t1 = mesh['face_tri_offsets'][face_idx], mesh['face_tri_offsets'][face_idx + 1]
+    return mesh['vertices'][v0:v1], mesh['triangles'][t0:t1] - v0
+
 def classify_edge_type(face1, face2, shared_edge, analyser):
     # Prepare occ lists for each type
     convex_edges = TopTools_ListOfShape()
@@ -258,92 +420,111 @@ def get_edge_info(edge):
     adaptor = BRepAdaptor_Curve(edge)
     edge_geom = adaptor.GetType()
 
+    # exact length from the curve itself (no polyline sampling)
+    props = GProp_GProps()
+    brepgprop.LinearProperties(edge, props)
+    edge_length = props.Mass()
+
+    return edge_geom, edge_length
+
+def sample_edge_points(edge, deflection=0.1):
+    # points along the edge, only needed for plotting
+    adaptor = BRepAdaptor_Curve(edge)
     first_param = adaptor.FirstParameter()
     last_param = adaptor.LastParameter()
 
-    is_straight = edge_geom == GeomAbs_Line
-    num_points = 50 if not is_straight else 2
-    params = np.linspace(first_param, last_param, num_points)
+    if adaptor.GetType() == GeomAbs_Line:
+        params = [first_param, last_param]
+    else:
+        # as many points as needed to stay within the deflection
+        sampler = GCPnts_QuasiUniformDeflection(adaptor, deflection)
+        if sampler.IsDone():
+            params = [sampler.Parameter(i) for i in range(1, sampler.NbPoints() + 1)]
+        else:
+            params = np.linspace(first_param, last_param, 50)
 
     points = []
     for param in params:
         pnt = adaptor.Value(param)
         points.append([pnt.X(), pnt.Y(), pnt.Z()])
+    return np.array(points)
 
-    points = np.array(points)
+def get_edge_points(edge_data, deflection=0.1):
+    # lazy: sampled the first time a visualiser asks for them, then kept in the edge record
+    if edge_data.get('points') is None:
+        edge_data['points'] = sample_edge_points(edge_data['edge'], deflection)
+    return edge_data['points']
 
-    edge_length = 0
-    for j in range(len(points) - 1):
-        edge_length += np.linalg.norm(points[j + 1] - points[j])
 
-    return edge_geom, edge_length, points
 
+# analysis results per shape, so every class working on the same part shares one analysis
+_analysis_cache = {}
 
+def register_analysis(my_shape, analysis):
+    _analysis_cache[my_shape] = analysis
 
-def analyze_shape(my_shape):
-    # First, triangulate the entire shape
-    linear_deflection = 0.1
-    triangulate_shape(my_shape, linear_deflection)
-    analyser = BRepOffset_Analyse(my_shape, 0.01) #make sre it considers right normals
-    t = TopologyExplorer(my_shape)
+def clear_analysis_cache(my_shape=None):
+    if my_shape is None:
+        _analysis_cache.clear()
+        _mesh_cache.clear()
+    else:
+        _analysis_cache.pop(my_shape, None)
+        for key in [k for k in _mesh_cache if k[0] == my_shape]:
+            del _mesh_cache[key]
+
+def detach_analysis(my_shape):
+    # drop the OCC handles of a cached analysis (faces, edges, analyser), the records stay cached
+    # -> recognition/planning still work on it, things that need the B-rep (edge points, plots) don't
+    if my_shape not in _analysis_cache:
+        return
+    _, face_data_list, _, _, edge_data_list = _analysis_cache[my_shape]
+    detach_faces(face_data_list)
+    for edge_data in edge_data_list:
+        edge_data['edge'] = None
+    _analysis_cache[my_shape] = ([], face_data_list, None, [], edge_data_list)
 
+def get_all_faces(my_shape):
     all_faces = []
     face_explorer = TopExp_Explorer(my_shape, TopAbs_FACE)
     while face_explorer.More():
         all_faces.append(TopoDS.Face(face_explorer.Current()))
         face_explorer.Next()
-
-    face_to_index_map = {face: i for i, face in enumerate(all_faces)}
-    face_data_list = []
-
-    # First pass: geometry types
-    for i, face in enumerate(all_faces):
-        face_type, geometry = get_face_geometry(face)
-        face_center, _ = get_face_center(face)
-        face_area = get_face_area(face)
-
-        n, n_coords, n_axis = normal_vector_face(face, my_shape)
-        axis_obj, axis_coords = get_cylinder_axis(face)
-        vertices, triangles = triangulate_face(face, linear_deflection) #mesh triangulation
-        face_data_list.append({
-            "index": i,
-            "face": face,
-            "type": face_type,
-            "geom": geometry,
-            "face_area": face_area,
-            "face_center": face_center,
-            "stock_face": "Pending",
-            "adjacent_indices": [],
-            "convex_adjacent" : [],
-            "concave_adjacent" : [],
-            "tangent_adjacent" : [],
-            "normal_vector": n,
-            "normal_vector_coords": n_coords,
-            "normal_vector_axis": n_axis,
-            "cylinder_axis": axis_obj,
-            "cylinder_axis_coords": axis_coords,
-            "mesh_vertices": vertices,
-            "mesh_triangles": triangles
-        })
-
-
-    # Second pass: adjacency
-    for face_data in face_data_list:
-        adjacent_faces = get_adjacent_faces(my_shape, face_data["face"])
-        adj_indices = [face_to_index_map[adj_f] for adj_f in adjacent_faces] #get the indices for the adj faces
-        face_data["adjacent_indices"] = adj_indices
-
-    # Third pass: Edge extraction + deduplication
-
+    return all_faces
+
+def build_face_data(i, face, my_shape):
+    face_type, geometry = get_face_geometry(face)
+    face_center, _ = get_face_center(face)
+    face_area = get_face_area(face)
+
+    n, n_coords, n_axis = normal_vector_face(face, my_shape)
+    axis_obj, axis_coords = get_cylinder_axis(face)
+    return FaceRecord(
+        index=i,
+        face=face,
+        type=face_type,
+        geom=geometry,
+        face_area=face_area,
+        face_center=face_center,
+        bbox=get_face_bbox(face),
+        stock_face="Pending",
+        adjacent_indices=[],
+        convex_adjacent=[],
+        concave_adjacent=[],
+        tangent_adjacent=[],
+        normal_vector=n,
+        normal_vector_coords=n_coords,
+        normal_vector_axis=n_axis,
+        cylinder_axis=axis_obj,
+        cylinder_axis_coords=axis_coords
+    )
+
+def get_unique_edges(my_shape):
     all_edges_raw = []  # store raw edges as given by OCC
     edge_explorer = TopExp_Explorer(my_shape, TopAbs_EDGE)
     while edge_explorer.More():
         all_edges_raw.append(TopoDS.Edge(edge_explorer.Current()))
         edge_explorer.Next()
 
-    '''print("\n--- Duplicate Edge Debug Check ---")
-    print(f"Total edges detected (raw OCC): {len(all_edges_raw)}")'''
-
     # --- REMOVE DUPLICATE EDGES
     unique_edges = []  # will hold only topologically unique edges
     for e in all_edges_raw:
@@ -354,73 +535,109 @@ def analyze_shape(my_shape):
                 break
         if not is_dup:
             unique_edges.append(e)
+    return unique_edges
+
+def classify_face_edges(face_data, t, all_edges, edge_to_index_map, edge_data_list, face_to_index_map,
+                        classify):
+    # classify(face, adj_face, edge) -> "Convex" / "Concave" / "Tangent" / "Unknown"
+    face = face_data['face']
+    edges_of_face = t.edges_from_face(face)
+
+    for edge in edges_of_face:
+        # Match the face-local edge handle to our unique edge list using IsSame()
+        matched_index = None  # index in all_edges corresponding to this edge
+        for unique_edge in all_edges:
+            if edge.IsSame(unique_edge):
+                matched_index = edge_to_index_map[unique_edge]
+                break
+
+        if matched_index is None:
+            # skip if no matching unique edge found
+            continue
+
+        edge_data = edge_data_list[matched_index]
+
+        adjacent_faces = [f for f in t.faces_from_edge(edge) if not f.IsSame(face)]
+        for adj_face in adjacent_faces:
+            edge_type = classify(face, adj_face, edge)
+            edge_data['classification'].append(edge_type)
+            edge_data['faces_of_edge'].append((face_data['index'], face_to_index_map[adj_face]))
+
+            adj_index = face_to_index_map[adj_face]
+            if edge_type == "Convex":
+                face_data['convex_adjacent'].append(adj_index)
+            elif edge_type == "Concave":
+                face_data['concave_adjacent'].append(adj_index)
+            elif edge_type == "Tangent":
+                face_data['tangent_adjacent'].append(adj_index)
+
+def assign_stock_faces(my_shape, face_data_list):
+    xmin, ymin, zmin, xmax, ymax, zmax, _ = get_stock_box(my_shape)
+
+    for face_data in face_data_list:
+        # Pass the bbox limits to the detection function
+        face_data["stock_face"] = define_stock_face(
+            face_data, xmin, ymin, zmin, xmax, ymax, zmax
+        )
+
+@memory_stage("analyze_shape")
+def analyze_shape(my_shape):
+    if my_shape in _analysis_cache:
+        return _analysis_cache[my_shape]
+
+    # (no meshing here, the mesh is only built when something needs it -> get_shape_mesh)
+    analyser = BRepOffset_Analyse(my_shape, 0.01) #make sre it considers right normals
+    t = TopologyExplorer(my_shape)
 
-    #print(f"Unique edges (after IsSame filtering): {len(unique_edges)}")
-    #print("------------------------------------------------------\n")
+    all_faces = get_all_faces(my_shape)
+    face_to_index_map = {face: i for i, face in enumerate(all_faces)}
+
+    # First pass: geometry types
+    face_data_list = [build_face_data(i, face, my_shape) for i, face in enumerate(all_faces)]
 
-    # Use deduplicated edges from now on
-    all_edges = unique_edges  # replace raw list with deduped list
+    # Second pass: adjacency
+    for face_data in face_data_list:
+        adjacent_faces = get_adjacent_faces(my_shape, face_data["face"])
+        adj_indices = [face_to_index_map[adj_f] for adj_f in adjacent_faces] #get the indices for the adj faces
+        face_data["adjacent_indices"] = adj_indices
+
+    # Third pass: Edge extraction + deduplication
+    all_edges = get_unique_edges(my_shape)
 
     # Build edge index map for unique edges
     edge_to_index_map = {edge: i for i, edge in enumerate(all_edges)}
     edge_data_list = []
 
     for i, edge in enumerate(all_edges):
-        edge_geom, edge_length, points = get_edge_info(edge)
+        edge_geom, edge_length = get_edge_info(edge)
         edge_data_list.append({
             "index": i,
             "edge": edge,
             "edge_geom": edge_geom,
             "edge_length": edge_length,
-            "points": points,  # Nx3 array
+            "points": None,  # Nx3 array, filled on demand by get_edge_points
             "faces_of_edge" : [],
             "classification": []
         })
 
 
     # Classify edges per face adjacency
+    def classify(face, adj_face, edge):
+        return classify_edge_type(face, adj_face, edge, analyser)
+
     for face_data in face_data_list:
-        face = face_data['face']
-        edges_of_face = t.edges_from_face(face)
-
-        for edge in edges_of_face:
-            # Match the face-local edge handle to our unique edge list using IsSame()
-            matched_index = None  # index in all_edges corresponding to this edge
-            for unique_edge in all_edges:
-                if edge.IsSame(unique_edge):
-                    matched_index = edge_to_index_map[unique_edge]
-                    break
-
-            if matched_index is None:
-                # skip if no matching unique edge found
-                continue
-
-            edge_data = edge_data_list[matched_index]
-
-            adjacent_faces = [f for f in t.faces_from_edge(edge) if not f.IsSame(face)]
-            for adj_face in adjacent_faces:
-                edge_type = classify_edge_type(face, adj_face, edge, analyser)
-                edge_data['classification'].append(edge_type)
-                edge_data['faces_of_edge'].append((face_data['index'], face_to_index_map[adj_face]))
-
-                adj_index = face_to_index_map[adj_face]
-                if edge_type == "Convex":
-                    face_data['convex_adjacent'].append(adj_index)
-                elif edge_type == "Concave":
-                    face_data['concave_adjacent'].append(adj_index)
-                elif edge_type == "Tangent":
-                    face_data['tangent_adjacent'].append(adj_index)
+        classify_face_edges(face_data, t, all_edges, edge_to_index_map, edge_data_list,
+                            face_to_index_map, classify)
 
     # 5. FINAL PASS: Determine Stock Faces
-    xmin, ymin, zmin, xmax, ymax, zmax, _ = get_stock_box(my_shape)
+    assign_stock_faces(my_shape, face_data_list)
 
-    for face_data in face_data_list:
-        # Pass the bbox limits to the detection function
-        face_data["stock_face"] = define_stock_face(
-            face_data, xmin, ymin, zmin, xmax, ymax, zmax
-        )
+    # 6. Stable face ids (independent of the explorer order and of the placement)
+    assign_face_uids(face_data_list)
 
-    return all_faces, face_data_list, analyser, all_edges, edge_data_list
+    analysis = (all_faces, face_data_list, analyser, all_edges, edge_data_list)
+    register_analysis(my_shape, analysis)
+    return analysis
 
 def print_face_analysis_table(all_faces, face_data_list):
     def get_axis_label(coords, tol=1e-3):
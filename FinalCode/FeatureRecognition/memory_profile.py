@@ -0,0 +1,157 @@
+import functools
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource # not on Windows -> no peak RSS
+except ImportError:
+    resource = None
+
+
+# Opt-in memory profiler of the pipeline stages (analysis, mesh, AAG, recognition, locator grids,
+# clamping area). Stages are marked with @memory_stage("name"); while profiling is off that's one
+# check per call. When on, each stage records its tracemalloc peak, the growth of the process peak
+# RSS and the top allocation sites (snapshot diff), aggregated per stage and written as json.
+# Nested stages are fine: a parent's peak includes its children.
+
+_profiler = None
+
+
+def rss_peak_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10 # bytes on macOS, KB on Linux
+
+def rss_current_mb():
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class MemoryProfiler:
+    def __init__(self, top=10, frames=1):
+        self.top = top
+        self.stages = {}
+        self._stack = [] # open stages: {'name', 'start', 'current', 'peak', 'snapshot', 'rss_peak'}
+        self._traced_peak = 0 # highest traced memory seen before each reset_peak (stages reset it)
+        self._stopped = False # after stop() tracemalloc reports (0, 0) -> _traced_peak is the answer
+        self._started_tracing = not tracemalloc.is_tracing()
+        if self._started_tracing:
+            tracemalloc.start(frames)
+        self._filters = [tracemalloc.Filter(False, tracemalloc.__file__),
+                         tracemalloc.Filter(False, __file__),
+                         tracemalloc.Filter(False, "<frozen importlib._bootstrap>")]
+
+    def _snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces(self._filters)
+
+    def enter(self, name):
+        current, peak = tracemalloc.get_traced_memory()
+        self._traced_peak = max(self._traced_peak, peak)
+        if self._stack:
+            self._stack[-1]['peak'] = max(self._stack[-1]['peak'], peak)
+        tracemalloc.reset_peak()
+        self._stack.append({'name': name, 'start': time.perf_counter(), 'current': current, 'peak': current,
+                            'snapshot': self._snapshot(), 'rss_peak': rss_peak_mb()})
+
+    def exit(self):
+        frame = self._stack.pop()
+        current, peak = tracemalloc.get_traced_memory()
+        self._traced_peak = max(self._traced_peak, peak)
+        peak = max(frame['peak'], peak)
+        if self._stack:
+            self._stack[-1]['peak'] = max(self._stack[-1]['peak'], peak)
+        diff = self._snapshot().compare_to(frame['snapshot'], 'lineno')
+        rss_after = rss_peak_mb()
+
+        stage = self.stages.setdefault(frame['name'], {
+            'calls': 0, 'time_s': 0.0, 'peak_traced_mb': 0.0, 'retained_mb': 0.0,
+            'rss_peak_growth_mb': 0.0, 'sites': {}})
+        stage['calls'] += 1
+        stage['time_s'] += time.perf_counter() - frame['start']
+        stage['peak_traced_mb'] = max(stage['peak_traced_mb'], (peak - frame['current']) / 2**20)
+        stage['retained_mb'] += (current - frame['current']) / 2**20
+        if rss_after is not None and frame['rss_peak'] is not None:
+            stage['rss_peak_growth_mb'] += rss_after - frame['rss_peak']
+        for stat in diff[:self.top]:
+            if stat.size_diff <= 0:
+                continue
+            where = stat.traceback[0]
+            site = stage['sites'].setdefault(f"{where.filename}:{where.lineno}", {'size_mb': 0.0, 'count': 0})
+            site['size_mb'] += stat.size_diff / 2**20
+            site['count'] += stat.count_diff
+        tracemalloc.reset_peak()
+
+    def report(self):
+        stages = {}
+        for name, s in self.stages.items():
+            sites = sorted(s['sites'].items(), key=lambda kv: kv[1]['size_mb'], reverse=True)[:self.top]
+            stages[name] = dict({k: v for k, v in s.items() if k != 'sites'},
+                                top_sites=[dict(site=where, **info) for where, info in sites])
+        return {'pid': os.getpid(), 'python': sys.version.split()[0],
+                'traced_peak_mb': self.traced_peak() / 2**20,
+                'rss_peak_mb': rss_peak_mb(), 'rss_current_mb': rss_current_mb(),
+                'stages': stages}
+
+    def write_report(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as fh:
+            json.dump(self.report(), fh, indent=2)
+        print(f"Memory profile written to {path}")
+
+    def traced_peak(self):
+        if not self._stopped:
+            self._traced_peak = max(self._traced_peak, tracemalloc.get_traced_memory()[1])
+        return self._traced_peak
+
+    def stop(self):
+        self.traced_peak()
+        self._stopped = True
+        if self._started_tracing:
+            tracemalloc.stop()
+
+    def print_report(self):
+        print("\n" + "=" * 100)
+        print(f"{'STAGE':<25} | {'CALLS':>5} | {'TIME s':>8} | {'PEAK MB':>8} | {'KEPT MB':>8} | {'RSS+ MB':>8} | TOP SITE")
+        print("-" * 100)
+        for name, s in self.report()['stages'].items():
+            top = s['top_sites'][0]['site'] if s['top_sites'] else "-"
+            print(f"{name:<25} | {s['calls']:>5} | {s['time_s']:>8.2f} | {s['peak_traced_mb']:>8.1f} | "
+                  f"{s['retained_mb']:>8.1f} | {s['rss_peak_growth_mb']:>8.1f} | {os.path.basename(top)}")
+        print("=" * 100 + "\n")
+
+
+def enable_memory_profiling(top=10, frames=1):
+    global _profiler
+    if _profiler is None:
+        _profiler = MemoryProfiler(top, frames)
+    return _profiler
+
+def disable_memory_profiling():
+    # -> the profiler (for its report), profiling off
+    global _profiler
+    profiler, _profiler = _profiler, None
+    if profiler is not None:
+        profiler.stop()
+    return profiler
+
+def memory_stage(name):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            profiler = _profiler
+            if profiler is None:
+                return func(*args, **kwargs)
+            profiler.enter(name)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profiler.exit()
+        return wrapper
+    return decorator
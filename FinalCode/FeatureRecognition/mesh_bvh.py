@@ -0,0 +1,140 @@
+import numpy as np
+
+
+# BVH over the triangles of the shared part mesh + batched any-hit ray casting, all in numpy.
+# The tree is stored as flat arrays; rays are traversed all together, level by level, as
+# (ray, node) pairs, so there is no python loop over rays or triangles.
+
+AXIS_DIRECTIONS = {
+    'x': (1.0, 0.0, 0.0), '-x': (-1.0, 0.0, 0.0),
+    'y': (0.0, 1.0, 0.0), '-y': (0.0, -1.0, 0.0),
+    'z': (0.0, 0.0, 1.0), '-z': (0.0, 0.0, -1.0)
+}
+
+
+def triangle_geometry(mesh):
+    # centroid, unit normal (outward, triangles are oriented by get_shape_mesh) and area per triangle
+    tri = mesh['vertices'][mesh['triangles']]
+    cross = np.cross(tri[:, 1] - tri[:, 0], tri[:, 2] - tri[:, 0])
+    norm = np.linalg.norm(cross, axis=1)
+    normals = cross / np.where(norm > 0, norm, 1.0)[:, None]
+    return tri.mean(axis=1), normals, 0.5 * norm
+
+
+class MeshBVH:
+    def __init__(self, vertices, triangles, leaf_size=8):
+        self.tri = np.asarray(vertices, dtype=float)[np.asarray(triangles)] # (M, 3, 3)
+        self.leaf_size = leaf_size
+        self.build()
+
+    def build(self):
+        tri_min = self.tri.min(axis=1)
+        tri_max = self.tri.max(axis=1)
+        centroids = self.tri.mean(axis=1)
+
+        order = np.arange(len(self.tri))
+        bbox_min, bbox_max, left, right, start, count = [], [], [], [], [], []
+
+        def new_node(lo, hi):
+            idx = order[lo:hi]
+            bbox_min.append(tri_min[idx].min(axis=0))
+            bbox_max.append(tri_max[idx].max(axis=0))
+            left.append(-1)
+            right.append(-1)
+            start.append(lo)
+            count.append(hi - lo)
+            return len(bbox_min) - 1
+
+        # 1. Median split on the longest axis of the centroid box (explicit stack, no recursion limit)
+        if len(self.tri):
+            stack = [(new_node(0, len(self.tri)), 0, len(self.tri))]
+            while stack:
+                node, lo, hi = stack.pop()
+                if hi - lo <= self.leaf_size:
+                    continue
+                idx = order[lo:hi]
+                c = centroids[idx]
+                split_axis = np.argmax(c.max(axis=0) - c.min(axis=0))
+                order[lo:hi] = idx[np.argsort(c[:, split_axis], kind='stable')]
+                mid = (lo + hi) // 2
+                left[node] = new_node(lo, mid)
+                right[node] = new_node(mid, hi)
+                count[node] = 0 # internal node
+                stack.append((left[node], lo, mid))
+                stack.append((right[node], mid, hi))
+
+        self.order = order
+        self.bbox_min = np.array(bbox_min).reshape(-1, 3)
+        self.bbox_max = np.array(bbox_max).reshape(-1, 3)
+        self.left = np.array(left, dtype=np.int64)
+        self.right = np.array(right, dtype=np.int64)
+        self.start = np.array(start, dtype=np.int64)
+        self.count = np.array(count, dtype=np.int64)
+
+    def _ray_box(self, origins, inv_dirs, nodes):
+        # slab test, nan (origin on a slab of a parallel ray) counts as inside
+        with np.errstate(invalid='ignore', divide='ignore'):
+            t1 = (self.bbox_min[nodes] - origins) * inv_dirs
+            t2 = (self.bbox_max[nodes] - origins) * inv_dirs
+        t_near = np.fmax.reduce(np.fmin(t1, t2), axis=1)
+        t_far = np.fmin.reduce(np.fmax(t1, t2), axis=1)
+        return t_far >= np.maximum(t_near, 0.0)
+
+    def _ray_triangle(self, origins, dirs, tris, t_min, t_max, eps=1e-12):
+        # Moller-Trumbore, one (ray, triangle) pair per row
+        e1 = tris[:, 1] - tris[:, 0]
+        e2 = tris[:, 2] - tris[:, 0]
+        p = np.cross(dirs, e2)
+        det = np.einsum('ij,ij->i', e1, p)
+        ok = np.abs(det) > eps
+        inv_det = np.where(ok, 1.0 / np.where(ok, det, 1.0), 0.0)
+        s = origins - tris[:, 0]
+        u = np.einsum('ij,ij->i', s, p) * inv_det
+        q = np.cross(s, e1)
+        v = np.einsum('ij,ij->i', dirs, q) * inv_det
+        t = np.einsum('ij,ij->i', e2, q) * inv_det
+        return ok & (u >= 0) & (v >= 0) & (u + v <= 1) & (t > t_min) & (t < t_max)
+
+    def any_hit(self, origins, dirs, t_min=0.0, t_max=np.inf):
+        # -> bool per ray: does it hit any triangle between t_min and t_max
+        origins = np.asarray(origins, dtype=float).reshape(-1, 3)
+        dirs = np.broadcast_to(np.asarray(dirs, dtype=float), origins.shape)
+        hit = np.zeros(len(origins), dtype=bool)
+        if len(origins) == 0 or len(self.bbox_min) == 0:
+            return hit
+        with np.errstate(divide='ignore'):
+            inv_dirs = 1.0 / dirs
+
+        rays = np.arange(len(origins))
+        nodes = np.zeros(len(origins), dtype=np.int64)
+        while len(rays):
+            # 1. Drop pairs of rays that already hit something or miss the node box
+            keep = ~hit[rays]
+            rays, nodes = rays[keep], nodes[keep]
+            keep = self._ray_box(origins[rays], inv_dirs[rays], nodes)
+            rays, nodes = rays[keep], nodes[keep]
+
+            # 2. Leaves -> test their triangles
+            is_leaf = self.count[nodes] > 0
+            leaf_rays, leaf_nodes = rays[is_leaf], nodes[is_leaf]
+            if len(leaf_rays):
+                n_tris = self.count[leaf_nodes]
+                pair_rays = np.repeat(leaf_rays, n_tris)
+                first = np.repeat(self.start[leaf_nodes], n_tris)
+                within = np.arange(len(pair_rays)) - np.repeat(np.cumsum(n_tris) - n_tris, n_tris)
+                pair_tris = self.order[first + within]
+                hits = self._ray_triangle(origins[pair_rays], dirs[pair_rays], self.tri[pair_tris], t_min, t_max)
+                hit[pair_rays[hits]] = True
+
+            # 3. Internal nodes -> both children
+            rays, nodes = rays[~is_leaf], nodes[~is_leaf]
+            rays = np.concatenate([rays, rays])
+            nodes = np.concatenate([self.left[nodes], self.right[nodes]])
+        return hit
+
+
+def get_mesh_bvh(mesh):
+    # one BVH per (cached) shared mesh
+    if 'bvh' not in mesh:
+        mesh['bvh'] = MeshBVH(mesh['vertices'], mesh['triangles'])
+    return mesh['bvh']
@@ -0,0 +1,178 @@
+import numpy as np
+
+from FeatureRecognition.mesh_bvh import AXIS_DIRECTIONS
+
+
+# Orthographic software rasteriser for the shared part mesh: looking down an axis, every pixel
+# keeps the depth of the closest surface (z-buffer) and the triangle it belongs to.
+# Triangles are expanded to the pixel centres of their 2D bounding box in chunks, so it is all numpy.
+
+# image axes (u, v) and depth coordinate for each viewing axis
+AXIS_COORDS = {'z': (0, 1, 2), '-z': (0, 1, 2),
+               'x': (1, 2, 0), '-x': (1, 2, 0),
+               'y': (0, 2, 1), '-y': (0, 2, 1)}
+
+
+def raster_grid(bounds_min, bounds_max, axis, resolution=512):
+    # pixel grid covering the box on the image plane of the axis
+    u, v, _ = AXIS_COORDS[axis]
+    bounds_min, bounds_max = np.asarray(bounds_min, dtype=float), np.asarray(bounds_max, dtype=float)
+    extent = max(bounds_max[u] - bounds_min[u], bounds_max[v] - bounds_min[v], 1e-9)
+    pixel = extent / resolution
+    width = int(np.ceil((bounds_max[u] - bounds_min[u]) / pixel)) + 1
+    height = int(np.ceil((bounds_max[v] - bounds_min[v]) / pixel)) + 1
+    return {'axis': axis, 'origin': (bounds_min[u], bounds_min[v]), 'pixel': pixel,
+            'width': width, 'height': height}
+
+def triangle_pixels(vertices, triangles, grid, tri_ids=None, chunk=2_000_000):
+    # -> (pixel index, depth, triangle) for every pixel centre covered by a triangle
+    u, v, k = AXIS_COORDS[grid['axis']]
+    sign = AXIS_DIRECTIONS[grid['axis']][k] # tool looks from +axis -> bigger coordinate is closer
+    ou, ov = grid['origin']
+    p = grid['pixel']
+    tri_ids = np.arange(len(triangles)) if tri_ids is None else np.asarray(tri_ids)
+
+    tri = np.asarray(vertices, dtype=float)[np.asarray(triangles)[tri_ids]]
+    tu, tv, td = (tri[:, :, u] - ou) / p - 0.5, (tri[:, :, v] - ov) / p - 0.5, sign * tri[:, :, k]
+
+    # 1. Pixel box of each triangle (pixel centres inside the 2D box)
+    i0 = np.maximum(np.ceil(tu.min(axis=1)), 0).astype(np.int64)
+    i1 = np.minimum(np.floor(tu.max(axis=1)), grid['width'] - 1).astype(np.int64)
+    j0 = np.maximum(np.ceil(tv.min(axis=1)), 0).astype(np.int64)
+    j1 = np.minimum(np.floor(tv.max(axis=1)), grid['height'] - 1).astype(np.int64)
+    nu = np.maximum(i1 - i0 + 1, 0)
+    n_pix = nu * np.maximum(j1 - j0 + 1, 0)
+
+    # 2D signed area (0 for triangles seen edge-on -> they cover no pixel)
+    area2 = ((tu[:, 1] - tu[:, 0]) * (tv[:, 2] - tv[:, 0]) - (tu[:, 2] - tu[:, 0]) * (tv[:, 1] - tv[:, 0]))
+    n_pix[np.abs(area2) < 1e-12] = 0
+
+    out_pix, out_depth, out_tri = [], [], []
+    ends = np.cumsum(n_pix)
+    start = 0
+    while start < len(tri):
+        # 2. Chunk of triangles with at most `chunk` candidate pixels (at least 1 triangle)
+        base = ends[start - 1] if start else 0
+        stop = max(int(np.searchsorted(ends, base + chunk, side='right')), start + 1)
+        idx = np.arange(start, stop)
+        counts = n_pix[idx]
+        start = stop
+        if counts.sum() == 0:
+            continue
+        t = np.repeat(idx, counts)
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        pi = i0[t] + local % nu[t]
+        pj = j0[t] + local // nu[t]
+
+        # 3. Barycentric coordinates of the pixel centre
+        x0, y0 = tu[t, 0], tv[t, 0]
+        d = area2[t]
+        w1 = ((pi - x0) * (tv[t, 2] - y0) - (tu[t, 2] - x0) * (pj - y0)) / d
+        w2 = ((tu[t, 1] - x0) * (pj - y0) - (pi - x0) * (tv[t, 1] - y0)) / d
+        w0 = 1.0 - w1 - w2
+        inside = (w0 >= -1e-9) & (w1 >= -1e-9) & (w2 >= -1e-9)
+
+        t, pi, pj = t[inside], pi[inside], pj[inside]
+        depth = w0[inside] * td[t, 0] + w1[inside] * td[t, 1] + w2[inside] * td[t, 2]
+        out_pix.append(pj * grid['width'] + pi)
+        out_depth.append(depth)
+        out_tri.append(tri_ids[t])
+
+    if not out_pix:
+        return np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0, dtype=np.int64)
+    return np.concatenate(out_pix), np.concatenate(out_depth), np.concatenate(out_tri)
+
+def rasterize_depth(vertices, triangles, grid, depth_tol=None):
+    # z-buffer + id buffer; coverage/visible = pixels covered/won per triangle
+    pix, depth, tri = triangle_pixels(vertices, triangles, grid)
+    n_pixels = grid['width'] * grid['height']
+    zbuf = np.full(n_pixels, -np.inf)
+    np.maximum.at(zbuf, pix, depth)
+
+    if depth_tol is None:
+        depth_tol = 1e-5 * grid['pixel'] * max(grid['width'], grid['height'])
+    won = depth >= zbuf[pix] - depth_tol
+    tri_id = np.full(n_pixels, -1, dtype=np.int64)
+    tri_id[pix[won]] = tri[won]
+
+    return dict(grid,
+                depth=zbuf.reshape(grid['height'], grid['width']),
+                tri_id=tri_id.reshape(grid['height'], grid['width']),
+                coverage=np.bincount(tri, minlength=len(triangles)),
+                visible=np.bincount(tri[won], minlength=len(triangles)),
+                depth_tol=depth_tol)
+
+
+#### Footprints (projected area of groups of triangles, e.g. features) ####
+
+def edge_pixels(vertices, triangles, grid, tri_ids):
+    # pixels along the 3 edges of the triangles (walls seen edge-on only show up as lines)
+    u, v, _ = AXIS_COORDS[grid['axis']]
+    ou, ov = grid['origin']
+    p = grid['pixel']
+    tri = np.asarray(vertices, dtype=float)[np.asarray(triangles)[tri_ids]]
+    pts = np.stack([(tri[:, :, u] - ou) / p - 0.5, (tri[:, :, v] - ov) / p - 0.5], axis=2) # (N, 3, 2)
+    a = pts.reshape(-1, 2)
+    b = pts[:, [1, 2, 0]].reshape(-1, 2)
+    owner = np.repeat(np.asarray(tri_ids), 3)
+
+    # samples every half pixel along each edge
+    n = np.ceil(2 * np.linalg.norm(b - a, axis=1)).astype(np.int64) + 1
+    edge = np.repeat(np.arange(len(a)), n)
+    s = (np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)) / np.maximum(np.repeat(n, n) - 1, 1)
+    q = np.rint(a[edge] + (b[edge] - a[edge]) * s[:, None]).astype(np.int64)
+    ok = (q[:, 0] >= 0) & (q[:, 0] < grid['width']) & (q[:, 1] >= 0) & (q[:, 1] < grid['height'])
+    return q[ok, 1] * grid['width'] + q[ok, 0], owner[edge[ok]]
+
+def fill_holes(mask):
+    # empty pixels that can't be reached from the border (4-connected) are inside the outline
+    outside = np.zeros_like(mask)
+    outside[[0, -1], :] = ~mask[[0, -1], :]
+    outside[:, [0, -1]] |= ~mask[:, [0, -1]]
+    while True:
+        grown = outside.copy()
+        grown[1:] |= outside[:-1]
+        grown[:-1] |= outside[1:]
+        grown[:, 1:] |= outside[:, :-1]
+        grown[:, :-1] |= outside[:, 1:]
+        grown &= ~mask
+        if np.array_equal(grown, outside):
+            return ~outside
+        outside = grown
+
+def footprint_areas(vertices, triangles, tri_label, axis, resolution=256):
+    # tri_label: group per triangle (-1 = ignore) -> {label: area of its filled projected footprint}
+    # every group gets its own grid over its bounding box (resolution px across the group, so small
+    # holes are as precise as big pockets). Area = pixel centres covered by the triangles + pixels
+    # enclosed by the outline; an outline pixel only counts (half) where it bounds such an enclosed
+    # part, i.e. for walls seen edge-on
+    vertices, triangles = np.asarray(vertices, dtype=float), np.asarray(triangles)
+    tri_label = np.asarray(tri_label)
+    areas = {}
+    for label in np.unique(tri_label[tri_label >= 0]):
+        tri_ids = np.flatnonzero(tri_label == label)
+        pts = vertices[triangles[tri_ids]].reshape(-1, 3)
+        grid = raster_grid(pts.min(axis=0), pts.max(axis=0), axis, resolution)
+        n_pixels = grid['width'] * grid['height']
+
+        # 1. Pixel centres covered by the triangles + outline (through holes/pockets are only walls)
+        pix, _, _ = triangle_pixels(vertices, triangles, grid, tri_ids=tri_ids)
+        e_pix, _ = edge_pixels(vertices, triangles, grid, tri_ids)
+        covered = np.zeros(n_pixels, dtype=bool)
+        covered[pix] = True
+        outline = np.zeros(n_pixels, dtype=bool)
+        outline[e_pix] = True
+        outline &= ~covered
+
+        # 2. Holes filled (1 px margin so the border flood fill goes all around)
+        covered = np.pad(covered.reshape(grid['height'], grid['width']), 1)
+        outline = np.pad(outline.reshape(grid['height'], grid['width']), 1)
+        enclosed = fill_holes(covered | outline) & ~covered & ~outline
+        near = np.zeros_like(enclosed)
+        near[1:] |= enclosed[:-1]
+        near[:-1] |= enclosed[1:]
+        near[:, 1:] |= enclosed[:, :-1]
+        near[:, :-1] |= enclosed[:, 1:]
+        n_in = covered.sum() + enclosed.sum() + 0.5 * (outline & near).sum()
+        areas[int(label)] = float(n_in * grid['pixel'] ** 2)
+    return areas
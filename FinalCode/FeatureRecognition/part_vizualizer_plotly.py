@@ -1,6 +1,8 @@
 import plotly.graph_objects as go
 import plotly.io as pio
 from FeatureRecognition.geometry_analysis import load_step_file, analyze_shape
+from FeatureRecognition.plotly_traces import part_mesh_trace, edge_line_traces
+from FeatureRecognition.figure_export import show_or_export
 from FeatureRecognition.aag_builder import AAGBuilder_3D
 
 class Part_Visualizer:
@@ -12,28 +14,17 @@ class Part_Visualizer:
         self.colors_rgb = builder.colors_rgb
 
         # mesh from builder
-        self.vertices = getattr(builder, "vertices", None)
-        self.triangles = getattr(builder, "triangles", None)
+        self.mesh = getattr(builder, "mesh", None)
 
     def add_mesh_trace(self, fig, opacity=0.2, name="3D Model"):
-        if self.vertices is None or self.triangles is None:
+        if self.mesh is None:
             return
 
-        fig.add_trace(go.Mesh3d(
-            x=[v[0] for v in self.vertices],
-            y=[v[1] for v in self.vertices],
-            z=[v[2] for v in self.vertices],
-            i=[t[0] for t in self.triangles],
-            j=[t[1] for t in self.triangles],
-            k=[t[2] for t in self.triangles],
-            color='lightblue',
-            opacity=opacity,
-            name=name,
-            flatshading=True,
-        ))
+        fig.add_trace(part_mesh_trace(self.mesh, color='lightblue', opacity=opacity,
+                                      name=name, flatshading=True))
 
 
-    def visualize_numbered_faces(self, node_size=10, title="Numbered faces"):
+    def visualize_numbered_faces(self, node_size=10, title="Numbered faces", output_path=None):
 
         face_idx = [f['index'] for f in self.face_data_list]
         face_types = [f['type'] for f in self.face_data_list]
@@ -96,52 +87,21 @@ class Part_Visualizer:
             width=900,
             height=700
         )
-        fig.show()
+        show_or_export(fig, output_path)
 
-    def visualize_geometric_edges(self, title="Real edges by convexity"):
+    def visualize_geometric_edges(self, title="Real edges by convexity", output_path=None):
         fig = go.Figure()
         self.add_mesh_trace(fig, 0.2)
 
-        # group by classification
-        edge_groups = {
-            "Convex": {"xs": [], "ys": [], "zs": [], "name": "Convex edges", "color": self.colors_rgb["edge_convex"],
-                       "width": 4},
-            "Concave": {"xs": [], "ys": [], "zs": [], "name": "Concave edges", "color": self.colors_rgb["edge_concave"],
-                        "width": 4},
-            "Tangent": {"xs": [], "ys": [], "zs": [], "name": "Tangent edges", "color": self.colors_rgb["edge_tangent"],
-                        "width": 3},
-            "Unknown": {"xs": [], "ys": [], "zs": [], "name": "Unknown edges", "color": (0.5, 0.5, 0.5), "width": 2},
+        # group by classification -> one line trace per class
+        edge_styles = {
+            "Convex": {"name": "Convex edges", "color": self.colors_rgb["edge_convex"], "width": 4},
+            "Concave": {"name": "Concave edges", "color": self.colors_rgb["edge_concave"], "width": 4},
+            "Tangent": {"name": "Tangent edges", "color": self.colors_rgb["edge_tangent"], "width": 3},
+            "Unknown": {"name": "Unknown edges", "color": (0.5, 0.5, 0.5), "width": 2},
         }
-
-        for e in self.edge_data_list:
-            cls = e["classification"][0] if e["classification"] else "Unknown"
-            group = edge_groups.get(cls, edge_groups["Unknown"])
-
-            points = e.get("points")
-            if points is None or len(points) == 0:
-                continue
-
-            xs = points[:, 0].tolist()
-            ys = points[:, 1].tolist()
-            zs = points[:, 2].tolist()
-
-            group["xs"].extend(xs + [None])
-            group["ys"].extend(ys + [None])
-            group["zs"].extend(zs + [None])
-
-        # add one trace per group
-        for grp in edge_groups.values():
-            if not grp["xs"]:
-                continue
-            r, g, b = grp["color"]
-            color_str = f"rgb({int(r * 255)},{int(g * 255)},{int(b * 255)})"
-            fig.add_trace(go.Scatter3d(
-                x=grp["xs"], y=grp["ys"], z=grp["zs"],
-                mode="lines",
-                line=dict(color=color_str, width=grp["width"]),
-                name=grp["name"],
-                hoverinfo="none"
-            ))
+        for trace in edge_line_traces(self.edge_data_list, edge_styles):
+            fig.add_trace(trace)
 
         fig.update_layout(
             title=title,
@@ -153,4 +113,4 @@ class Part_Visualizer:
             legend=dict(yanchor="top", y=0.99, xanchor="left", x=0.01),
             width=1000, height=800,
         )
-        fig.show()
+        show_or_export(fig, output_path)
@@ -0,0 +1,70 @@
+import numpy as np
+import plotly.graph_objects as go
+
+from FeatureRecognition.geometry_analysis import get_edge_points
+
+
+# Shared plotly building blocks: the whole part is ONE Mesh3d built straight from the shared
+# numpy mesh buffer, coloured per triangle from a face -> code array, and the edges are one
+# NaN-separated line trace per class.
+
+def rgb_str(rgb):
+    r, g, b = rgb
+    return f'rgb({int(r * 255)},{int(g * 255)},{int(b * 255)})'
+
+def part_mesh_trace(mesh, face_codes=None, code_colors=None, color='lightblue', face_mask=None, **kwargs):
+    # face_codes: int per face (index into code_colors), code_colors: list of (r, g, b)
+    # face_mask: bool per face, only the triangles of those faces (e.g. one trace per opacity)
+    vertices, triangles, tri_face = mesh['vertices'], mesh['triangles'], mesh['tri_face']
+    if face_mask is not None:
+        keep = np.asarray(face_mask, dtype=bool)[tri_face]
+        triangles, tri_face = triangles[keep], tri_face[keep]
+    if face_codes is not None:
+        palette = np.array([rgb_str(c) for c in code_colors], dtype=object)
+        kwargs['facecolor'] = palette[np.asarray(face_codes)[tri_face]]
+    else:
+        kwargs['color'] = color
+    return go.Mesh3d(
+        x=vertices[:, 0], y=vertices[:, 1], z=vertices[:, 2],
+        i=triangles[:, 0], j=triangles[:, 1], k=triangles[:, 2],
+        **kwargs
+    )
+
+def legend_entry(name, rgb, legendgroup=None):
+    # empty trace so a colour of the single mesh still shows up in the legend
+    return go.Scatter3d(x=[None], y=[None], z=[None], mode='markers', name=name,
+                        marker=dict(size=8, color=rgb_str(rgb), symbol='square'),
+                        legendgroup=legendgroup, showlegend=True)
+
+def edge_class(edge_data):
+    return edge_data['classification'][0] if edge_data['classification'] else 'Unknown'
+
+def edge_line_arrays(edge_data_list, classes=('Convex', 'Concave', 'Tangent', 'Unknown')):
+    # class -> (N, 3) array, polylines of all edges of that class separated by a NaN row
+    gap = np.full((1, 3), np.nan)
+    pieces = {cls: [] for cls in classes}
+    for edge_data in edge_data_list:
+        cls = edge_class(edge_data)
+        if cls not in pieces:
+            cls = 'Unknown'
+        points = get_edge_points(edge_data)
+        if len(points) == 0:
+            continue
+        pieces[cls].append(points)
+        pieces[cls].append(gap)
+    return {cls: np.concatenate(p) for cls, p in pieces.items() if p}
+
+def edge_line_traces(edge_data_list, styles):
+    # styles: class -> dict(color=(r, g, b), width=..., name=...)
+    traces = []
+    for cls, pts in edge_line_arrays(edge_data_list, tuple(styles)).items():
+        style = styles[cls]
+        traces.append(go.Scatter3d(
+            x=pts[:, 0], y=pts[:, 1], z=pts[:, 2],
+            mode='lines',
+            line=dict(color=rgb_str(style['color']), width=style['width']),
+            name=style.get('name', f"{cls} Edges"),
+            hoverinfo='none',
+            showlegend=True
+        ))
+    return traces
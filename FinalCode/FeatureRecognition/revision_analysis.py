@@ -0,0 +1,271 @@
+import json
+
+from OCC.Core.BRepOffset import BRepOffset_Analyse
+from OCC.Extend.TopologyUtils import TopologyExplorer
+
+from FeatureRecognition.geometry_analysis import (get_all_faces, build_face_data, get_adjacent_faces,
+                                                  get_unique_edges, get_edge_info, classify_edge_type,
+                                                  classify_face_edges, assign_stock_faces,
+                                                  register_analysis)
+from FeatureRecognition.face_identity import assign_face_uids, feature_uid
+from FeatureRecognition.feature_recognition import FeatureRecognition
+
+
+# Revision mode: compare a new revision of a part with the record of the previous run and
+# only redo the work around the faces that actually changed.
+
+def face_fingerprint(face_data, ndigits=4):
+    # type, centre, area, normal + surface parameters (rounded so small numeric noise is ignored)
+    fp = [face_data['type'],
+          round(face_data['face_area'], ndigits)]
+    fp.extend(round(c, ndigits) for c in face_data['face_center'])
+    n_coords = face_data['normal_vector_coords'] or [0.0, 0.0, 0.0]
+    fp.extend(round(c, ndigits) for c in n_coords)
+
+    geom = face_data['geom']
+    if face_data['type'] == "Cylinder" and geom is not None:
+        loc = geom.Location()
+        fp.append(round(geom.Radius(), ndigits))
+        fp.extend(round(c, ndigits) for c in (loc.X(), loc.Y(), loc.Z()))
+        fp.extend(round(c, ndigits) for c in face_data['cylinder_axis_coords'])
+    elif face_data['type'] == "Plane" and geom is not None:
+        a, b, c, d = geom.Coefficients()
+        fp.extend(round(v, ndigits) for v in (a, b, c, d))
+    return tuple(fp)
+
+
+#### Record of a run (plain data, can be saved as json) ####
+
+def build_revision_record(face_data_list, matches, plan=None):
+    faces = []
+    for f in face_data_list:
+        faces.append({
+            'fingerprint': list(f.get('fingerprint') or face_fingerprint(f)),
+            'uid': f.get('uid'),
+            'stock_face': f['stock_face'],
+            'adjacent_indices': list(f['adjacent_indices']),
+            'convex_adjacent': list(f['convex_adjacent']),
+            'concave_adjacent': list(f['concave_adjacent']),
+            'tangent_adjacent': list(f['tangent_adjacent'])
+        })
+    return {'faces': faces, 'matches': matches or [], 'plan': plan}
+
+def save_revision_record(record, path):
+    with open(path, 'w') as fh:
+        json.dump(record, fh)
+
+def load_revision_record(path):
+    with open(path) as fh:
+        return json.load(fh)
+
+
+#### 1. Incremental analysis ####
+
+def analyze_revision(my_shape, previous_record):
+    old_faces = previous_record['faces']
+    t = TopologyExplorer(my_shape)
+
+    all_faces = get_all_faces(my_shape)
+    face_to_index_map = {face: i for i, face in enumerate(all_faces)}
+
+    # 1.1. Per-face geometry (needed anyway to fingerprint the faces)
+    face_data_list = []
+    for i, face in enumerate(all_faces):
+        face_data = build_face_data(i, face, my_shape)
+        face_data['fingerprint'] = face_fingerprint(face_data)
+        face_data_list.append(face_data)
+
+    for face_data in face_data_list:
+        adjacent_faces = get_adjacent_faces(my_shape, face_data["face"])
+        face_data["adjacent_indices"] = [face_to_index_map[adj_f] for adj_f in adjacent_faces]
+
+    # 1.2. Match new faces to old faces by fingerprint
+    old_by_fp = {}
+    for old_idx, old_face in enumerate(old_faces):
+        old_by_fp.setdefault(tuple(old_face['fingerprint']), []).append(old_idx)
+
+    new_to_old = {}
+    for face_data in face_data_list:
+        candidates = old_by_fp.get(face_data['fingerprint'])
+        if candidates:
+            new_to_old[face_data['index']] = candidates.pop(0)
+    old_to_new = {o: n for n, o in new_to_old.items()}
+
+    # 1.3. Changed faces -> new faces, or faces whose neighbourhood is not the same anymore
+    changed = set()
+    for face_data in face_data_list:
+        i = face_data['index']
+        if i not in new_to_old:
+            changed.add(i)
+            continue
+        old_adj = old_faces[new_to_old[i]]['adjacent_indices']
+        mapped_old_adj = set(old_to_new.get(o, -1) for o in old_adj)
+        if mapped_old_adj != set(face_data['adjacent_indices']):
+            changed.add(i)
+
+    # dirty = changed faces + their neighbours (the edges between them have to be classified again)
+    dirty = set(changed)
+    for i in changed:
+        dirty.update(face_data_list[i]['adjacent_indices'])
+
+    # 1.4. Edges (only the expensive convexity analysis is skipped for clean faces)
+    all_edges = get_unique_edges(my_shape)
+    edge_to_index_map = {edge: i for i, edge in enumerate(all_edges)}
+    edge_data_list = []
+    for i, edge in enumerate(all_edges):
+        edge_geom, edge_length = get_edge_info(edge)
+        edge_data_list.append({
+            "index": i,
+            "edge": edge,
+            "edge_geom": edge_geom,
+            "edge_length": edge_length,
+            "points": None,
+            "faces_of_edge": [],
+            "classification": []
+        })
+
+    analyser = BRepOffset_Analyse(my_shape, 0.01) if dirty else None
+
+    def old_edge_type(face, adj_face):
+        old_face = old_faces[new_to_old[face_to_index_map[face]]]
+        old_adj = new_to_old.get(face_to_index_map[adj_face])
+        if old_adj in old_face['convex_adjacent']:
+            return "Convex"
+        if old_adj in old_face['concave_adjacent']:
+            return "Concave"
+        if old_adj in old_face['tangent_adjacent']:
+            return "Tangent"
+        return "Unknown"
+
+    def classify(face, adj_face, edge):
+        if face_to_index_map[face] in dirty:
+            return classify_edge_type(face, adj_face, edge, analyser)
+        return old_edge_type(face, adj_face)
+
+    for face_data in face_data_list:
+        classify_face_edges(face_data, t, all_edges, edge_to_index_map, edge_data_list,
+                            face_to_index_map, classify)
+
+    assign_stock_faces(my_shape, face_data_list)
+    assign_face_uids(face_data_list)
+
+    analysis = (all_faces, face_data_list, analyser, all_edges, edge_data_list)
+    register_analysis(my_shape, analysis) # every class built on this shape now uses this analysis
+
+    revision = {
+        'new_to_old': new_to_old,
+        'old_to_new': old_to_new,
+        'changed': changed,
+        'dirty': dirty
+    }
+    print(f"Revision analysis: {len(changed)} changed faces, {len(dirty)} faces re-classified "
+          f"out of {len(face_data_list)}")
+    return analysis, revision
+
+
+#### 2. Incremental recognition ####
+
+def remap_match(match, old_to_new, face_data_list):
+    new_match = dict(match)
+    new_match['node_indices'] = [old_to_new[n] for n in match['node_indices']]
+    new_match['tad_faces'] = [old_to_new[n] for n in match['tad_faces']]
+    # uids come from the new analysis (neighbourhood of a face may have changed, old records may have none)
+    new_match['node_uids'] = [face_data_list[n]['uid'] for n in new_match['node_indices']]
+    new_match['feature_uid'] = feature_uid(new_match['feature_type'], new_match['node_uids'])
+    return new_match
+
+def recognize_revision(my_shape, previous_record, revision, backend="networkx"):
+    old_to_new = revision['old_to_new']
+    dirty = revision['dirty']
+    recognizer = FeatureRecognition(my_shape, backend, candidate_faces=dirty)
+
+    # 2.1. Keep old matches if all their faces still exist and are clean
+    reused, dropped = [], []
+    for match in previous_record['matches']:
+        nodes = match['node_indices']
+        if all(n in old_to_new for n in nodes) and not any(old_to_new[n] in dirty for n in nodes):
+            reused.append(remap_match(match, old_to_new, recognizer.face_data_list))
+        else:
+            dropped.append(match['feat_idx'])
+
+    # 2.2. Only the candidates (AAG components) touching a dirty face were built -> go through the matcher
+    new_matches = recognizer.identify_features() if recognizer.subgraphs_info else []
+
+    # a clean feature can still be part of a re-matched candidate (e.g. joined to a changed pocket by a
+    # convex edge in the 2nd pass) -> the new match wins, the old one is dropped
+    rematched = set()
+    for match in new_matches:
+        rematched.update(match['node_indices'])
+    for match in [m for m in reused if rematched.intersection(m['node_indices'])]:
+        reused.remove(match)
+        dropped.append(match['feat_idx'])
+
+    # 2.3. Reused features keep their ids, the new ones get the next free ids
+    next_id = max([m['feat_idx'] for m in previous_record['matches']], default=0)
+    for match in new_matches:
+        next_id += 1
+        match['feat_idx'] = next_id
+
+    recognizer.matches = reused + new_matches
+    revision['reused_features'] = [m['feat_idx'] for m in reused]
+    revision['dropped_features'] = dropped
+    revision['new_features'] = [m['feat_idx'] for m in new_matches]
+    print(f"Revision recognition: {len(reused)} features reused, {len(new_matches)} re-recognised, "
+          f"{len(dropped)} dropped")
+    return recognizer
+
+
+def check_revision_backends(my_shape, previous_record, revision):
+    # same revision through both AAG backends -> same features (type + faces); returns the differences
+    results = {}
+    for backend in ("networkx", "sparse"):
+        recognizer = recognize_revision(my_shape, previous_record, dict(revision), backend=backend)
+        results[backend] = sorted((m['feature_type'], tuple(sorted(m['node_indices'])))
+                                  for m in recognizer.matches)
+    for backend, features in results.items():
+        faces = [f for _, nodes in features for f in nodes]
+        if len(faces) != len(set(faces)):
+            print(f"Revision ({backend}): some faces belong to more than one feature")
+    only_nx = sorted(set(results["networkx"]) - set(results["sparse"]))
+    only_sparse = sorted(set(results["sparse"]) - set(results["networkx"]))
+    if only_nx or only_sparse or len(results["networkx"]) != len(results["sparse"]):
+        print(f"Revision backends differ: networkx only {only_nx}, sparse only {only_sparse}")
+    else:
+        print(f"Revision backends agree: {len(results['networkx'])} features")
+    return only_nx, only_sparse
+
+
+#### 3. Planning reuse ####
+
+def reuse_plan(previous_record, revision, face_data_list):
+    # the previous plan is still valid if no feature changed and the stock faces (locators) are untouched
+    plan = previous_record.get('plan')
+    if plan is None or revision.get('dropped_features') or revision.get('new_features'):
+        return None
+    old_to_new = revision['old_to_new']
+    for f in face_data_list:
+        if f['stock_face'] == "Yes" and f['index'] in revision['dirty']:
+            return None
+
+    def remap_faces(faces):
+        return [dict(face, Face_idx=old_to_new[face['Face_idx']]) for face in faces]
+
+    new_plan = []
+    for step in plan:
+        new_step = dict(step)
+        for key in ('PLF', 'SLF', 'TLF'):
+            if step.get(key):
+                faces_key = f'{key}_faces'
+                try:
+                    new_step[key] = dict(step[key], **{faces_key: remap_faces(step[key][faces_key])})
+                except KeyError: # a locating face disappeared in this revision
+                    return None
+        new_plan.append(new_step)
+    return new_plan
+
+
+def run_revision(my_shape, previous_record):
+    analysis, revision = analyze_revision(my_shape, previous_record)
+    recognizer = recognize_revision(my_shape, previous_record, revision)
+    plan = reuse_plan(previous_record, revision, analysis[1])
+    return analysis, recognizer, plan, revision
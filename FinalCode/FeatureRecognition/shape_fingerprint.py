@@ -0,0 +1,80 @@
+import hashlib
+
+import numpy as np
+from OCC.Core.GProp import GProp_GProps
+from OCC.Core.BRepGProp import brepgprop
+
+from FeatureRecognition.geometry_analysis import get_all_faces, get_face_geometry, get_face_area
+
+
+# Placement-invariant fingerprint of a part: only quantities that don't change when the part is
+# moved/rotated (volume, area, principal moments, multiset of face signatures).
+# Two instances with the same fingerprint are analysed once.
+
+def face_signature(face, ndigits=3):
+    face_type, geom = get_face_geometry(face)
+    radius = round(geom.Radius(), ndigits) if face_type == "Cylinder" else 0.0
+    return face_type, round(get_face_area(face), ndigits), radius
+
+def shape_fingerprint(shape, ndigits=3):
+    props = GProp_GProps()
+    brepgprop.VolumeProperties(shape, props)
+    volume = props.Mass()
+    moments = sorted(props.PrincipalProperties().Moments())
+
+    area_props = GProp_GProps()
+    brepgprop.SurfaceProperties(shape, area_props)
+
+    face_signatures = sorted(face_signature(f, ndigits) for f in get_all_faces(shape))
+    key = [round(volume, ndigits), round(area_props.Mass(), ndigits),
+           [round(m, ndigits) for m in moments], face_signatures]
+    return hashlib.sha1(repr(key).encode()).hexdigest()
+
+def principal_frame(shape):
+    # 4x4 matrix: principal axes of inertia as columns + centre of mass
+    props = GProp_GProps()
+    brepgprop.VolumeProperties(shape, props)
+    principal = props.PrincipalProperties()
+    com = props.CentreOfMass()
+    frame = np.eye(4)
+    for col, axis in enumerate((principal.FirstAxisOfInertia(), principal.SecondAxisOfInertia(),
+                                principal.ThirdAxisOfInertia())):
+        frame[:3, col] = [axis.X(), axis.Y(), axis.Z()]
+    frame[:3, 3] = [com.X(), com.Y(), com.Z()]
+    return frame
+
+def relative_transform(rep_shape, instance_shape):
+    # transform that moves the representative onto the instance (3x4, like location_matrix)
+    if instance_shape.IsPartner(rep_shape):
+        # same part placed twice in an assembly -> exact, from the locations
+        rep = _location_4x4(rep_shape.Location())
+        inst = _location_4x4(instance_shape.Location())
+    else:
+        # identical geometry from another file -> align principal frames
+        # (axes of inertia have a sign ambiguity, fine for symmetric fixture plates)
+        rep = principal_frame(rep_shape)
+        inst = principal_frame(instance_shape)
+    return (inst @ np.linalg.inv(rep))[:3, :].tolist()
+
+def _location_4x4(location):
+    trsf = location.Transformation()
+    mat = np.eye(4)
+    for r in range(3):
+        for c in range(4):
+            mat[r, c] = trsf.Value(r + 1, c + 1)
+    return mat
+
+def group_unique_shapes(items):
+    # items: dicts with a 'shape' -> {fingerprint: [items]}, first item of each group is analysed
+    groups = {}
+    representatives = []
+    for item in items:
+        # cheap check first: instances of an already seen part share the same TShape
+        rep = next((r for r in representatives if item['shape'].IsPartner(r['shape'])), None)
+        fingerprint = rep['fingerprint'] if rep else shape_fingerprint(item['shape'])
+        item['fingerprint'] = fingerprint
+        if fingerprint not in groups:
+            groups[fingerprint] = []
+            representatives.append(item)
+        groups[fingerprint].append(item)
+    return groups
@@ -1,20 +1,63 @@
 from FeatureRecognition.feature_recognition import FeatureRecognition
-from FeatureRecognition.geometry_analysis import analyze_shape, get_stock_box
+from FeatureRecognition.geometry_analysis import analyze_shape, get_stock_box, get_shape_mesh, get_face_mesh
+from FeatureRecognition.figure_export import show_or_export
+from FeatureRecognition.memory_profile import memory_stage
 from SetupPlanning.TAD_and_Dependencies import TAD_Extraction, Dependencies
+from SetupPlanning.visibility_maps import get_visibility_maps
 
+import heapq
+import time
 import numpy as np
 import itertools
 
-from OCC.Core.BRepProj import BRepProj_Projection
-from OCC.Core.gp import gp_Pnt, gp_Dir, gp_Lin
-from OCC.Core.BRepClass3d import BRepClass3d_SolidClassifier
 from OCC.Core.GProp import GProp_GProps
 from OCC.Core.BRepGProp import brepgprop
-from networkx.generators.harary_graph import hkn_harary_graph
+
+
+SHARP_EDGE_TYPES = ('feat_slot_blind', 'feat_step_blind')
+AXIS_BITS = {'x': 0, '-x': 1, 'y': 2, '-y': 3, 'z': 4, '-z': 5}
+
+def axes_to_mask(axes):
+    mask = 0
+    for axis in axes:
+        if axis in AXIS_BITS:
+            mask |= 1 << AXIS_BITS[axis]
+    return mask
+
+def min_setup_cover(requirements, axis_order):
+    # requirements: [(bitmask of allowed setups, number of setups needed)], axis_order: bits to try
+    # -> bitmask with the fewest setups that satisfies all of them (0 if impossible)
+    def deficit(chosen):
+        return max((needed - (mask & chosen).bit_count() for mask, needed in requirements), default=0)
+
+    remaining_after = [0] * (len(axis_order) + 1) # setups still available from position i on
+    for i in range(len(axis_order) - 1, -1, -1):
+        remaining_after[i] = remaining_after[i + 1] | (1 << axis_order[i])
+
+    best = {'mask': 0, 'n': len(axis_order) + 1}
+
+    def search(pos, chosen, n_chosen):
+        lower_bound = deficit(chosen) # at least this many setups still to add
+        if lower_bound <= 0:
+            if n_chosen < best['n']:
+                best['mask'], best['n'] = chosen, n_chosen
+            return
+        if n_chosen + lower_bound >= best['n'] or pos == len(axis_order):
+            return
+        if deficit(chosen | remaining_after[pos]) > 0: # can't be completed anymore
+            return
+        bit = 1 << axis_order[pos]
+        search(pos + 1, chosen | bit, n_chosen + 1) # with this setup first (bigger groups come first)
+        search(pos + 1, chosen, n_chosen)
+
+    search(0, 0, 0)
+    return best['mask']
 
 
 class Setup_Plan:
-    def __init__(self, my_shape, recognizer=None):
+    def __init__(self, my_shape, recognizer=None, feature_info=None, locator_options=None):
+        # feature_info: TAD + dependency table from a previous run (result cache) -> not recomputed
+        # locator_options: time_budget / max_evaluations / cancel / progress for find_locators
         self.shape = my_shape
         (self.all_faces, self.face_data_list, self.analyser, self.all_edges,
          self.edge_data_list) = analyze_shape(self.shape)
@@ -23,9 +66,37 @@ class Setup_Plan:
         self.features = self.recognizer.identify_features()
         self.colors_rgb = self.recognizer.colors_rgb
 
-        self.tad_extractor = TAD_Extraction(self.shape, recognizer=self.recognizer)
-        self.dep_extractor = Dependencies(self.shape, recognizer=self.recognizer)
-        self.feature_info = self.dep_extractor.identify_relationships()
+        # visibility maps + TAD / dependency extractors are only built when feature_info is computed
+        self._visibility = None
+        self._tad_extractor = None
+        self._dep_extractor = None
+        if feature_info is not None:
+            self.feature_info = feature_info
+        else:
+            self.feature_info = self.dep_extractor.identify_relationships()
+        self._workholding_cache = {}
+        self.sequencing_issues = {} # setup axis -> features order_in_setup could not sequence
+        self.locator_options = locator_options or {}
+        self.locator_search = {} # PLF axis -> quality of the locator search (see find_locators)
+
+    @property
+    def visibility(self):
+        if self._visibility is None:
+            self._visibility = get_visibility_maps(self.shape) # 6 z-buffers of the part
+        return self._visibility
+
+    @property
+    def tad_extractor(self):
+        if self._tad_extractor is None:
+            self._tad_extractor = TAD_Extraction(self.shape, recognizer=self.recognizer, visibility=self.visibility)
+        return self._tad_extractor
+
+    @property
+    def dep_extractor(self):
+        if self._dep_extractor is None:
+            self._dep_extractor = Dependencies(self.shape, recognizer=self.recognizer,
+                                               tad_extractor=self.tad_extractor)
+        return self._dep_extractor
 
     #### Grouping ####
     def group_by_tads(self):
@@ -124,6 +195,7 @@ class Setup_Plan:
 
     #### define the points for locators based on grid ###
 
+    @memory_stage("locator_grid")
     def generate_locating_grid(self, xLFs, axis, step_size=1.0):
         axis_map = {
             'z': (0, 1, 2), '-z': (0, 1, 2),
@@ -139,15 +211,13 @@ class Setup_Plan:
         dim2_range = np.arange(bounds[idx2][0], bounds[idx2][1], step_size)
 
         grid_points = []
+        face_meshes = [get_face_mesh(self.shape, xlf['Face_idx']) for xlf in xLFs]
 
         # check each point against PLF meshes (if it's solid or empty)
         for v1 in dim1_range:
             for v2 in dim2_range:
                 is_on_material = False
-                for xlf in xLFs:
-                    f_idx = xlf['Face_idx']
-                    vertices = self.face_data_list[f_idx]['mesh_vertices']
-                    triangles = self.face_data_list[f_idx]['mesh_triangles']
+                for vertices, triangles in face_meshes:
                     # Point-in-Triangle check (projected to 2D)
                     if self._is_point_in_face_mesh(v1, v2, vertices, triangles, idx1, idx2):
                         is_on_material = True
@@ -237,14 +307,42 @@ class Setup_Plan:
 
         return idx1, idx2, safe_points
 
-    def find_locators(self, grid_points_PLF, PLF_axis, grid_points_SLF, SLF_axis, grid_points_TLF, TLF_axis):
+    def find_locators(self, grid_points_PLF, PLF_axis, grid_points_SLF, SLF_axis, grid_points_TLF, TLF_axis,
+                      time_budget=None, max_evaluations=None, cancel=None, progress=None):
+        # anytime search: time_budget (s), max_evaluations (trios tested, deterministic) or cancel() -> True
+        # stop the PLF search and keep the best set found so far; progress(info) is called after every k
+        # -> search summary (quality + why it stopped) in self.locator_search[PLF_axis]
         cog = self.get_part_cog()
         axis_map = {'z': (0, 1), '-z': (0, 1), 'x': (1, 2), '-x': (1, 2), 'y': (0, 2), '-y': (0, 2)}
+        start = time.monotonic()
+        search = {'evaluated': 0, 'stopped': None}
+
+        def stop_reason():
+            if cancel is not None and cancel():
+                return 'cancelled'
+            if time_budget is not None and time.monotonic() - start > time_budget:
+                return 'timeout'
+            if max_evaluations is not None and search['evaluated'] >= max_evaluations:
+                return 'max_evaluations'
+            return None
+
+        def report(**info):
+            if progress is not None:
+                progress(dict(info, axis=PLF_axis, evaluated=search['evaluated'],
+                              elapsed=time.monotonic() - start))
 
         ######## 1. PLF LOCATORS ###########
+        idx1, idx2 = axis_map[PLF_axis.lower()]
         tries = 0
         offset_plf = 15
-        while tries <= 3:
+        safe_points = []
+        sorted_quadrants = [[], [], [], []]
+        PLF_locators = None
+        is_balanced = False
+        while tries <= 3 and grid_points_PLF:
+            search['stopped'] = stop_reason()
+            if search['stopped']:
+                break
             # 1.1. Safe points grid
             idx1, idx2, safe_points = self.define_safe_pts_grid(PLF_axis, grid_points_PLF, offset_plf, offset_plf)
             if len(safe_points) < 3:
@@ -278,6 +376,11 @@ class Setup_Plan:
                 [unique_pool.append(p) for p in sampling_pool if p not in unique_pool]
                 # Check all combinations in the current pool
                 for trio in itertools.combinations(unique_pool, 3):
+                    search['evaluated'] += 1
+                    if search['evaluated'] % 256 == 0:
+                        search['stopped'] = stop_reason()
+                        if search['stopped']:
+                            break
                     p1, p2, p3 = trio
                     balanced = self._point_in_triangle_2d(cog[idx1], cog[idx2],
                                                           p1[idx1], p1[idx2],
@@ -290,37 +393,55 @@ class Setup_Plan:
                             max_area = area
                             PLF_locators = (p1, p2, p3)
                             is_balanced = True
+                report(attempt=tries, k=k, best_area=max_area, balanced=is_balanced)
 
                 if is_balanced:
                     print(f"Success: Balanced solution found at k={k}")
                     break
+                if search['stopped']:
+                    break
 
                 k += 2  # Increase the depth of the search
             if is_balanced:
                 print(f"Success: Balanced solution found at try={tries}")
                 break
+            if search['stopped']:
+                break
             tries += 1
             offset_plf -= 5
+        if search['stopped']:
+            print(f"Locator search on {PLF_axis} stopped ({search['stopped']}) after "
+                  f"{search['evaluated']} trios, keeping the best set so far")
 
 
         # 1.3. FINAL FALLBACK (If still no balance, just take the biggest possible)
-        if not PLF_locators:
+        pool = safe_points if len(safe_points) >= 3 else list(grid_points_PLF)
+        if not PLF_locators and len(pool) >= 3:
             print("Final Fallback: No balanced solution possible. Choosing max area.")
-            p1 = sorted_quadrants[0][0] if sorted_quadrants[0] else safe_points[0]
-            p2 = max(safe_points, key=lambda p: np.sqrt((p[idx1] - p1[idx1])**2 + (p[idx2] - p1[idx2])**2))
-            p3 = max(safe_points, key=lambda p: self.calculate_2d_area(p1, p2, p, (idx1, idx2)))
+            p1 = sorted_quadrants[0][0] if sorted_quadrants[0] else pool[0]
+            p2 = max(pool, key=lambda p: np.sqrt((p[idx1] - p1[idx1])**2 + (p[idx2] - p1[idx2])**2))
+            p3 = max(pool, key=lambda p: self.calculate_2d_area(p1, p2, p, (idx1, idx2)))
             PLF_locators = (p1, p2, p3)
             is_balanced = False  # Still unbalanced, but at least we have a solution
 
+        if is_balanced:
+            quality = 'balanced_partial' if search['stopped'] else 'balanced'
+        else:
+            quality = 'unbalanced' if PLF_locators else 'none'
+        self.locator_search[PLF_axis] = {'quality': quality, 'stopped': search['stopped'],
+                                         'evaluated': search['evaluated'],
+                                         'elapsed': time.monotonic() - start}
+
 
         ######## 2. SLF LOCATORS ###########
         offset_slf = 15
-        idx1_slf, idx2_slf, safe_points_slf = self.define_safe_pts_grid(SLF_axis, grid_points_SLF,
-                                                                        offset_slf, offset_slf-5)
-        while len(safe_points_slf) < 2:
-            offset_slf -= 5
-            if offset_slf < 0:
-                offset_slf = 0
+        safe_points_slf = []
+        if grid_points_SLF:
+            idx1_slf, idx2_slf, safe_points_slf = self.define_safe_pts_grid(SLF_axis, grid_points_SLF,
+                                                                            offset_slf, offset_slf-5)
+        # (at offset 0 every grid point is safe -> the loop ends there)
+        while len(safe_points_slf) < 2 and offset_slf > 0 and grid_points_SLF:
+            offset_slf = max(offset_slf - 5, 0)
             idx1_slf, idx2_slf, safe_points_slf = self.define_safe_pts_grid (SLF_axis, grid_points_SLF,
                                                                          offset_slf, offset_slf)
         # 2.1 Determine height, normal and width axis
@@ -329,32 +450,38 @@ class Setup_Plan:
         search_idx = list({0, 1, 2} - {plf_normal_idx, slf_normal_idx})[0] #width, tlf axis
 
         # 2.2. Filter to Parallel Points (same height)
-        unique_heights = sorted(list(set(p[plf_normal_idx] for p in safe_points_slf)))
-        median_height = unique_heights[len(unique_heights) // 2]
-        parallel_points = [p for p in safe_points_slf if p[plf_normal_idx] == median_height]
-        if len(parallel_points) < 2:
-            parallel_points = safe_points_slf
-
-        # 3. Maximize Distance along the width (search_idx)
-        p1_slf = min(parallel_points, key=lambda p: p[search_idx])
-        p2_slf = max(parallel_points, key=lambda p: p[search_idx])
-        SLF_locators = (p1_slf, p2_slf)
+        SLF_locators = ()
+        if safe_points_slf:
+            unique_heights = sorted(list(set(p[plf_normal_idx] for p in safe_points_slf)))
+            median_height = unique_heights[len(unique_heights) // 2]
+            parallel_points = [p for p in safe_points_slf if p[plf_normal_idx] == median_height]
+            if len(parallel_points) < 2:
+                parallel_points = safe_points_slf
+
+            # 3. Maximize Distance along the width (search_idx)
+            p1_slf = min(parallel_points, key=lambda p: p[search_idx])
+            p2_slf = max(parallel_points, key=lambda p: p[search_idx])
+            SLF_locators = (p1_slf, p2_slf)
 
         ######## 3. TLF LOCATOR  ###########
         offset_tlf = 10
-        idx1_tlf, idx2_tlf, safe_points_tlf = self.define_safe_pts_grid(TLF_axis, grid_points_TLF,
-                                                                        offset_tlf, offset_tlf-3)
-        while len(safe_points_tlf) < 1:
-            offset_tlf -= 5
+        safe_points_tlf = []
+        if grid_points_TLF:
+            idx1_tlf, idx2_tlf, safe_points_tlf = self.define_safe_pts_grid(TLF_axis, grid_points_TLF,
+                                                                            offset_tlf, offset_tlf-3)
+        while len(safe_points_tlf) < 1 and offset_tlf > 0 and grid_points_TLF:
+            offset_tlf = max(offset_tlf - 5, 0)
             idx1_tlf, idx2_tlf, safe_points_tlf = self.define_safe_pts_grid(TLF_axis, grid_points_TLF,
                                                                             offset_tlf, offset_tlf)
-        # Pick the point closest to the geometric center of the safe area for max stability
-        avg_dim1 = np.mean([p[idx1_tlf] for p in safe_points_tlf])
-        avg_dim2 = np.mean([p[idx2_tlf] for p in safe_points_tlf])
+        TLF_locators = ()
+        if safe_points_tlf:
+            # Pick the point closest to the geometric center of the safe area for max stability
+            avg_dim1 = np.mean([p[idx1_tlf] for p in safe_points_tlf])
+            avg_dim2 = np.mean([p[idx2_tlf] for p in safe_points_tlf])
 
-        p1_tlf = min(safe_points_tlf, key=lambda p: (p[idx1_tlf] - avg_dim1) ** 2 +
-                                                    (p[idx2_tlf] - avg_dim2) ** 2)
-        TLF_locators = (p1_tlf,)
+            p1_tlf = min(safe_points_tlf, key=lambda p: (p[idx1_tlf] - avg_dim1) ** 2 +
+                                                        (p[idx2_tlf] - avg_dim2) ** 2)
+            TLF_locators = (p1_tlf,)
 
         #self.visualize_safe_points(grid_points_PLF, safe_points, PLF_axis)
         #self.visualize_safe_points(grid_points_SLF, safe_points_slf, SLF_axis)
@@ -460,7 +587,8 @@ class Setup_Plan:
         TLF_grid_pts = self.generate_locating_grid(TLFs, tlf_axis)
         PLF_locators, balanced, SLF_locators, TLF_locators = self.find_locators(PLF_grid_pts, axis,
                                                                                 SLF_grid_pts, slf_axis,
-                                                                                TLF_grid_pts, tlf_axis)
+                                                                                TLF_grid_pts, tlf_axis,
+                                                                                **self.locator_options)
         # 4.1. Find 3 locators in PLF
         if len(PLF_grid_pts) >= 3 and validated:
             if not balanced:
@@ -469,7 +597,8 @@ class Setup_Plan:
             else:
                 PLF = ({
                     'PLF_faces': PLFs,
-                    'PLF_locators': PLF_locators
+                    'PLF_locators': PLF_locators,
+                    'locator_quality': self.locator_search[axis]['quality']
                 })
                 #print(f"Primary Locators: {PLF_locators} & CoG Balanced?: {balanced}")
 
@@ -493,34 +622,33 @@ class Setup_Plan:
         return PLF, SLF, TLF, validated
 
 
-    def generate_optimized_plan(self):
-        ### 1. features grouped by tads
-        groups = self.group_by_tads()
-
-        ### 2. order tads (max features 1st)
-        # sort by the length of the feature list in each group
-        sorted_setups = sorted([axis for axis in groups if axis != "INACCESSIBLE"],
-            key=lambda x: len(groups[x]), reverse=True)
-
-        optimized_plan = [] # setups in order, respective features, PLF, SLF, TLF
-        already_planned = set() #features that were already done, for filtering after
+    def get_workholding(self, axis):
+        # validate_workholding is expensive -> once per axis, shared by the greedy and exact plans
+        if axis not in self._workholding_cache:
+            self._workholding_cache[axis] = self.validate_workholding(axis)
+        return self._workholding_cache[axis]
 
-        # Initialize tracking for sharp edges
-        extra_setup_tracker = []
+    def sharp_edge_tracker(self):
+        # blind slots/steps have sharp edges -> need to be visited in 2 setups
+        info_by_idx = {f['feat_idx']: f for f in self.feature_info}
+        tracker = []
         for feat in self.features:
-            if feat['feature_type'] in ['feat_slot_blind', 'feat_step_blind']:
-                extra_setup_tracker.append({
+            if feat['feature_type'] in SHARP_EDGE_TYPES:
+                tracker.append({
                     'feat_idx': feat['feat_idx'],
                     'remaining_setups': 2,
-                    'tads': [t['axis'] for t in
-                             next(f['tads'] for f in self.feature_info if f['feat_idx'] == feat['feat_idx'])]
+                    'tads': [t['axis'] for t in info_by_idx[feat['feat_idx']]['tads']]
                 })
+        return tracker
 
-        print("\n" + "=" * 50)
-        print("GENERATING OPTIMIZED PROCESS PLAN")
-        print("=" * 50)
+    def sequence_setups(self, setup_axes, groups):
+        # go through the setups in the given order, each feature is produced in the 1st one that reaches it
+        optimized_plan = [] # setups in order, respective features, PLF, SLF, TLF
+        already_planned = set() #features that were already done, for filtering after
+        extra_setup_tracker = self.sharp_edge_tracker()
+        uid_of = {f['feat_idx']: f.get('feature_uid') for f in self.feature_info}
 
-        for axis in sorted_setups:
+        for axis in setup_axes:
             # 1. Primary features for this setup that haven't been assigned to a previous setup
             features_to_order = [f for f in groups[axis] if f['feat_idx'] not in already_planned]
             # 2. Check if we need to keep going just for sharp edges
@@ -535,25 +663,22 @@ class Setup_Plan:
             else:
                 print(f"\n>>> Planning Setup: {axis} ({len(features_to_order)} features)")
 
-
-            print(f"\n>>> Planning Setup: {axis} ({len(features_to_order)} features)")
-
             ### 3. Validate setup (check the workholding and faces used)
-            PLF, SLF, TLF, validated = self.validate_workholding(axis)
+            PLF, SLF, TLF, validated = self.get_workholding(axis)
             if not validated:
                 continue
             print (f"!!!!!!!!!!SETUP {axis} VALIDATED!!!!!!!!!!")
 
             ### 4. Sharp Edges
             # We find features that can be machined in this axis and still need setups
+            primary_ids = {f['feat_idx'] for f in features_to_order}
             extra_features_ids = []
-            for item in extra_setup_tracker:
-                if item['remaining_setups'] > 0 and axis in item['tads']:
-                    # Only add to extra column if it's not already a primary feature in THIS setup
-                    if not any(f['feat_idx'] == item['feat_idx'] for f in features_to_order):
-                        extra_features_ids.append(item['feat_idx'])
-                    # Decrement counter because we are using this axis
-                    item['remaining_setups'] -= 1
+            for item in active_sharp_reqs:
+                # Only add to extra column if it's not already a primary feature in THIS setup
+                if item['feat_idx'] not in primary_ids:
+                    extra_features_ids.append(item['feat_idx'])
+                # Decrement counter because we are using this axis
+                item['remaining_setups'] -= 1
 
             # 5. sequence the features within this TAD (not relevant but it's done)
             ordered_sequence = self.order_in_setup(features_to_order, axis)
@@ -562,7 +687,9 @@ class Setup_Plan:
             optimized_plan.append({
                 'setup': axis,
                 'sequence': [f['feat_idx'] for f in ordered_sequence],
+                'sequence_uids': [uid_of.get(f['feat_idx']) for f in ordered_sequence],
                 'extra_features': extra_features_ids,
+                'extra_feature_uids': [uid_of.get(i) for i in extra_features_ids],
                 'is_extra_only': is_extra_setup_only,
                 'PLF': PLF,
                 'SLF': SLF,
@@ -572,8 +699,11 @@ class Setup_Plan:
             # Mark these as done so they aren't produced twice in another setup
             for f in ordered_sequence:
                 already_planned.add(f['feat_idx'])
+        return optimized_plan
 
+    def print_plan(self, optimized_plan, title="PROCESS PLAN"):
         print("\n" + "=" * 80)
+        print(title)
         print(f"{'SETUP':<10} | {'PRIMARY SEQUENCE':<30} | {'SHARP EDGE EXTRAS'}")
         print("-" * 80)
         for step in optimized_plan:
@@ -588,8 +718,68 @@ class Setup_Plan:
 
         print("=" * 80 + "\n")
 
+    def generate_optimized_plan(self):
+        ### 1. features grouped by tads
+        groups = self.group_by_tads()
+
+        ### 2. order tads (max features 1st)
+        # sort by the length of the feature list in each group
+        sorted_setups = sorted([axis for axis in groups if axis != "INACCESSIBLE"],
+            key=lambda x: len(groups[x]), reverse=True)
+
+        print("\n" + "=" * 50)
+        print("GENERATING OPTIMIZED PROCESS PLAN")
+        print("=" * 50)
+
+        optimized_plan = self.sequence_setups(sorted_setups, groups)
+        self.print_plan(optimized_plan, "GREEDY PLAN")
         return optimized_plan
 
+    def generate_exact_plan(self):
+        # minimum number of setups: every feature reachable from >=1 chosen setup,
+        # sharp-edge features from 2 (or all of their TADs if they have less than 2)
+        groups = self.group_by_tads()
+        sorted_setups = sorted([axis for axis in groups if axis != "INACCESSIBLE"],
+            key=lambda x: len(groups[x]), reverse=True)
+
+        print("\n" + "=" * 50)
+        print("GENERATING MINIMUM-SETUP PROCESS PLAN")
+        print("=" * 50)
+
+        # 1. Only setups that can actually be clamped are candidates
+        valid_axes = [axis for axis in sorted_setups if axis in AXIS_BITS and self.get_workholding(axis)[3]]
+        valid_mask = axes_to_mask(valid_axes)
+
+        # 2. Features -> (bitmask of their TADs, setups needed); equal requirements collapse
+        sharp_ids = {s['feat_idx'] for s in self.sharp_edge_tracker()}
+        requirements = {}
+        unreachable = []
+        for feat in self.feature_info:
+            mask = axes_to_mask(t['axis'] for t in feat.get('tads', [])) & valid_mask
+            if not mask:
+                unreachable.append(feat['feat_idx'])
+                continue
+            needed = min(2 if feat['feat_idx'] in sharp_ids else 1, mask.bit_count())
+            requirements[mask] = max(requirements.get(mask, 0), needed)
+        if unreachable:
+            print(f"Features without a valid setup (left out of the plan): {unreachable}")
+
+        # 3. Branch and bound over the candidate setups
+        chosen = min_setup_cover(list(requirements.items()), [AXIS_BITS[a] for a in valid_axes])
+        chosen_axes = [axis for axis in valid_axes if chosen & (1 << AXIS_BITS[axis])]
+        print(f"Minimum setups: {len(chosen_axes)} -> {chosen_axes}")
+
+        exact_plan = self.sequence_setups(chosen_axes, groups)
+        self.print_plan(exact_plan, "MINIMUM-SETUP PLAN")
+        return exact_plan
+
+    def generate_plans(self):
+        # both plans + how many setups each one needs
+        plans = {'greedy': self.generate_optimized_plan(),
+                 'exact': self.generate_exact_plan()}
+        print(f"Setups -> greedy: {len(plans['greedy'])}, exact: {len(plans['exact'])}")
+        return plans
+
 
 
     def order_in_setup(self, features_of_setup, current_setup_axis):
@@ -604,48 +794,74 @@ class Setup_Plan:
             if relevant_tad and relevant_tad['tad_face_index'] != "none":
                 # Blind Features -> tad face area
                 f['priority_area'] = self.face_data_list[relevant_tad['tad_face_index']]['face_area']
-                new = self.recognizer.get_projected_area(f['feat_idx'], current_setup_axis)
-                #print(f"area inicial = {f['priority_area']} vs nova {new}")
             elif relevant_tad != "none":
                 # Through -> max area from all faces
                 f['priority_area'] = self.recognizer.get_projected_area(f['feat_idx'], current_setup_axis)
 
+        # Kahn-style: count the dependencies still to be produced, features with 0 go to a heap
+        # (max area 1st, ties -> original order), one heap for holes and one for the others
+        position = {f['feat_idx']: pos for pos, f in enumerate(features_of_setup)}
+        hole_ids = {f['feat_idx'] for f in self.group_by_feat_type(features_of_setup)['holes']}
+        n_waiting = {}
+        dependents = {feat_idx: [] for feat_idx in position}
+        outside_deps = {} # dependencies on features that are not in this setup -> never produced here
+        for f in features_of_setup:
+            current_tad = next((t for t in f['tads'] if t['axis'] == current_setup_axis), None)
+            axis_deps = set(current_tad['dependency']) if current_tad else set()
+            outside = [d for d in axis_deps if d not in position]
+            if outside:
+                outside_deps[f['feat_idx']] = outside
+            for d in axis_deps:
+                if d in position:
+                    dependents[d].append(f['feat_idx'])
+            n_waiting[f['feat_idx']] = len(axis_deps)
+
+        holes, others = [], []
+        def push(feat_idx):
+            f = features_of_setup[position[feat_idx]]
+            heapq.heappush(holes if feat_idx in hole_ids else others,
+                           (-f['priority_area'], position[feat_idx]))
+
+        for feat_idx, n in n_waiting.items():
+            if n == 0:
+                push(feat_idx)
+
         ordered_list = []
-        pending = list(features_of_setup)  # feat not done still
         previous_was_hole = 0
-
-        while pending:
-            available = []  # available to be considered and produced now
-            # available = no dependencies in pending (none at all, or they were already produced)
-            for f in pending:
-                current_tad = next((t for t in f['tads'] if t['axis'] == current_setup_axis), None)
-                axis_deps = current_tad['dependency'] if current_tad else []
-                if all(d in [o['feat_idx'] for o in ordered_list] for d in axis_deps):
-                    available.append(f)
-                    # if dependencies were already ordered, it is available; or if there are none
-
-            if not available:
-                # If nothing is available but pending is not empty, we get stuck in a loop
-                if pending:
-                    ordered_list.extend(pending)
-                break
-
-            # 1. prioritized type = others
-            grouped = self.group_by_feat_type(available)  # groups only the available ones
-            if grouped['others'] and previous_was_hole != 1:
-                # 2. priority = max area
-                chosen = max(grouped['others'], key=lambda x: x['priority_area'])
+        while holes or others:
+            # 1. prioritized type = others (2. max area), holes when the previous was a hole or no other is ready
+            if others and previous_was_hole != 1:
+                _, pos = heapq.heappop(others)
                 previous_was_hole = 0
-            elif grouped['holes']:
-                # if no other features are ready, take the hole with max area
-                chosen = max(grouped['holes'], key=lambda x: x['priority_area'])
+            elif holes:
+                _, pos = heapq.heappop(holes)
                 previous_was_hole = 1
             else:
-                chosen = max(grouped['others'], key=lambda x: x['priority_area'])
+                _, pos = heapq.heappop(others)
                 previous_was_hole = 0
-
+            chosen = features_of_setup[pos]
             ordered_list.append(chosen)
-            pending.remove(chosen)
+
+            # 3. dependencies: features waiting on this one may be ready now
+            for feat_idx in dependents[chosen['feat_idx']]:
+                n_waiting[feat_idx] -= 1
+                if n_waiting[feat_idx] == 0:
+                    push(feat_idx)
+
+        # features that never became ready: report why, and still put them at the end (original order)
+        blocked = [f for f in features_of_setup if n_waiting[f['feat_idx']] > 0]
+        if blocked:
+            waiting_outside = {i: d for i, d in outside_deps.items() if n_waiting[i] > 0}
+            # the rest is in a dependency cycle, or waits on a feature that is blocked itself
+            in_cycle = [f['feat_idx'] for f in blocked if f['feat_idx'] not in waiting_outside]
+            self.sequencing_issues[current_setup_axis] = {'outside_setup': waiting_outside,
+                                                          'cycle_or_blocked': in_cycle}
+            print(f"WARNING setup {current_setup_axis}: {len(blocked)} feature(s) could not be sequenced")
+            for feat_idx, deps in waiting_outside.items():
+                print(f"   Feature {feat_idx} needs {deps}, not produced in this setup")
+            if in_cycle:
+                print(f"   Features {in_cycle} are in a dependency cycle or wait on a blocked feature")
+            ordered_list.extend(blocked)
 
         return ordered_list
 
@@ -667,7 +883,7 @@ class Setup_Plan:
 
             print("-" * 80)
 
-    def visualize_safe_points(self, raw_grid, safe_points, axis_label):
+    def visualize_safe_points(self, raw_grid, safe_points, axis_label, output_path=None):
         import plotly.graph_objects as go
         import numpy as np
 
@@ -696,37 +912,21 @@ class Setup_Plan:
             title=f"Safe Point Analysis: {axis_label} Axis",
             scene=dict(xaxis_title="X", yaxis_title="Y", zaxis_title="Z", aspectmode="data")
         )
-        fig.show()
+        show_or_export(fig, output_path)
 
-    def visualize_setup_3d(self, PLF_locs=None, SLF_locs=None, TLF_locs=None, cog=None):
+    def visualize_setup_3d(self, PLF_locs=None, SLF_locs=None, TLF_locs=None, cog=None, output_path=None):
         import plotly.graph_objects as go
-        import numpy as np
+        from FeatureRecognition.plotly_traces import part_mesh_trace
 
         fig = go.Figure()
 
         # 1. Show the Part Mesh (Grey/Translucent for context)
-        all_vertices = []
-        all_triangles = []
-        vertex_offset = 0
-
-        for face_data in self.face_data_list:
-            vertices = face_data.get('mesh_vertices', [])
-            triangles = face_data.get('mesh_triangles', [])
-            if not vertices: continue
-
-            all_vertices.extend(vertices)
-            for tri in triangles:
-                all_triangles.append([tri[0] + vertex_offset, tri[1] + vertex_offset, tri[2] + vertex_offset])
-            vertex_offset += len(vertices)
-
-        if all_vertices:
-            all_vertices = np.array(all_vertices)
-            all_triangles = np.array(all_triangles)
-            fig.add_trace(go.Mesh3d(
-                x=all_vertices[:, 0], y=all_vertices[:, 1], z=all_vertices[:, 2],
-                i=all_triangles[:, 0], j=all_triangles[:, 1], k=all_triangles[:, 2],
-                color='rgb(200, 200, 200)', opacity=0.3, name='Part Body', showlegend=True
-            ))
+        mesh = get_shape_mesh(self.shape)
+        all_vertices, all_triangles = mesh['vertices'], mesh['triangles']
+
+        if len(all_vertices):
+            fig.add_trace(part_mesh_trace(mesh, color='rgb(200, 200, 200)', opacity=0.3, name='Part Body',
+                                          showlegend=True))
 
         # 2. Helper to add locator groups as spheres
         def add_locators(locs, name, color, labels):
@@ -758,93 +958,32 @@ class Setup_Plan:
             scene=dict(xaxis_title="X", yaxis_title="Y", zaxis_title="Z", aspectmode="data"),
             width=1000, height=800
         )
-        fig.show()
+        show_or_export(fig, output_path)
 
-    def visualize_all_setups_3d(self, optimized_plan, show_edges=True):
+    def visualize_all_setups_3d(self, optimized_plan, show_edges=True, output_path=None):
         import plotly.graph_objects as go
-        import numpy as np
+        from FeatureRecognition.plotly_traces import part_mesh_trace, edge_line_traces
 
         fig = go.Figure()
 
         # 1. Part Body
-        all_vertices = []
-        all_triangles = []
-        vertex_offset = 0
-        for face_data in self.face_data_list:
-            vertices = face_data.get('mesh_vertices', [])
-            triangles = face_data.get('mesh_triangles', [])
-            if not vertices: continue
-            all_vertices.extend(vertices)
-            for tri in triangles:
-                all_triangles.append([tri[0] + vertex_offset, tri[1] + vertex_offset, tri[2] + vertex_offset])
-            vertex_offset += len(vertices)
-
-        if all_vertices:
-            all_vertices = np.array(all_vertices)
-            all_triangles = np.array(all_triangles)
-            fig.add_trace(go.Mesh3d(
-                x=all_vertices[:, 0], y=all_vertices[:, 1], z=all_vertices[:, 2],
-                i=all_triangles[:, 0], j=all_triangles[:, 1], k=all_triangles[:, 2],
-                color='rgb(210, 210, 210)', opacity=0.9, name='Part Body',
-                showlegend=True, hoverinfo='skip'
-            ))
+        mesh = get_shape_mesh(self.shape)
+        all_vertices, all_triangles = mesh['vertices'], mesh['triangles']
 
-        # 3. EDGES
+        if len(all_vertices):
+            fig.add_trace(part_mesh_trace(mesh, color='rgb(210, 210, 210)', opacity=0.9, name='Part Body',
+                                          showlegend=True, hoverinfo='skip'))
+
+        # 3. EDGES (one grey line trace per class)
         if show_edges:
-            edge_groups = {
-                'Convex': {
-                    'x': [], 'y': [], 'z': [],
-                    'color': (0.5, 0.5, 0.5),
-                    'width': 4
-                },
-                'Concave': {
-                    'x': [], 'y': [], 'z': [],
-                    'color': (0.5, 0.5, 0.5),
-                    'width': 4
-                },
-                'Tangent': {
-                    'x': [], 'y': [], 'z': [],
-                    'color': (0.5, 0.5, 0.5),
-                    'width': 3
-                },
-                'Unknown': {
-                    'x': [], 'y': [], 'z': [],
-                    'color': (0.5, 0.5, 0.5),
-                    'width': 2
-                }
+            edge_styles = {
+                'Convex': {'color': (0.5, 0.5, 0.5), 'width': 4},
+                'Concave': {'color': (0.5, 0.5, 0.5), 'width': 4},
+                'Tangent': {'color': (0.5, 0.5, 0.5), 'width': 3},
+                'Unknown': {'color': (0.5, 0.5, 0.5), 'width': 2}
             }
-
-            for edge in self.edge_data_list:
-                # Type
-                etype = 'Unknown'
-                if edge.get('classification'):
-                    etype = edge['classification'][0]  # Take the first classification
-
-                # Geometry Points
-                points = edge.get('points', [])
-                if len(points) == 0:
-                    continue
-
-                group = edge_groups.get(etype, edge_groups['Unknown'])
-
-                group['x'].extend([p[0] for p in points] + [None])
-                group['y'].extend([p[1] for p in points] + [None])
-                group['z'].extend([p[2] for p in points] + [None])
-
-            for name, group in edge_groups.items():
-                if not group['x']:
-                    continue
-
-                r, g, b = group['color']
-                color_str = f'rgb({int(r * 255)},{int(g * 255)},{int(b * 255)})'
-
-                fig.add_trace(go.Scatter3d(
-                    x=group['x'], y=group['y'], z=group['z'],
-                    mode='lines',
-                    line=dict(color=color_str, width=group['width']),
-                    name=f"{name} Edges",
-                    showlegend=True
-                ))
+            for trace in edge_line_traces(self.edge_data_list, edge_styles):
+                fig.add_trace(trace)
 
         # 2. Setup-specific Locators
         for idx, step in enumerate(optimized_plan):
@@ -906,4 +1045,4 @@ class Setup_Plan:
             scene=dict(xaxis_title="X", yaxis_title="Y", zaxis_title="Z", aspectmode="data"),
             legend=dict(itemsizing='constant', title_text="Click to Toggle Setups")
         )
-        fig.show()
\ No newline at end of file
+        show_or_export(fig, output_path)
\ No newline at end of file
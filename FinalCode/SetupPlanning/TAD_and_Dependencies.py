@@ -0,0 +1,200 @@
+import numpy as np
+
+from OCC.Core.BRepClass3d import BRepClass3d_SolidClassifier
+from OCC.Core.TopAbs import TopAbs_IN
+from OCC.Core.gp import gp_Pnt
+
+from FeatureRecognition.feature_recognition import FeatureRecognition
+from FeatureRecognition.geometry_analysis import analyze_shape, get_stock_box, get_shape_mesh
+from FeatureRecognition.mesh_bvh import AXIS_DIRECTIONS, triangle_geometry, get_mesh_bvh
+
+
+# TAD = Tool Access Direction. A feature is reachable along an axis if a tool coming from that
+# side sees its faces: rays are cast from every triangle of the feature faces (centroid, moved a
+# bit off the surface) towards the axis, against a BVH of the whole part mesh.
+
+class TAD_Extraction:
+    def __init__(self, my_shape, recognizer=None, min_visible=0.95, exact=False, exact_samples=20,
+                 visibility=None):
+        self.shape = my_shape
+        (self.all_faces, self.face_data_list, self.analyser, self.all_edges,
+         self.edge_data_list) = analyze_shape(self.shape)
+        self.recognizer = recognizer if recognizer else FeatureRecognition(self.shape)
+        self.features = self.recognizer.identify_features()
+
+        self.min_visible = min_visible # area fraction of the feature that has to be visible
+        self.exact = exact # confirm the accessible directions with the OCC solid classifier
+        self.exact_samples = exact_samples
+        self.visibility = visibility # VisibilityMaps -> skip the axes the z-buffers already rule out
+
+        self.mesh = get_shape_mesh(self.shape)
+        self.bvh = get_mesh_bvh(self.mesh)
+        self.tri_centroid, self.tri_normal, self.tri_area = triangle_geometry(self.mesh)
+
+        xmin, ymin, zmin, xmax, ymax, zmax, _ = get_stock_box(self.shape)
+        self.stock_min = np.array([xmin, ymin, zmin])
+        self.stock_max = np.array([xmax, ymax, zmax])
+        self.diag = float(np.linalg.norm(self.stock_max - self.stock_min))
+        self.ray_offset = 1e-3 * self.diag # start the rays slightly outside the material
+
+        self.tads_info = None
+
+    # 1. Sample points
+    def feature_triangles(self, match):
+        offsets = self.mesh['face_tri_offsets']
+        tris = [np.arange(offsets[f], offsets[f + 1]) for f in match['node_indices']]
+        return np.concatenate(tris) if tris else np.zeros(0, dtype=np.int64)
+
+    def face_direction(self, face_idx):
+        # area-weighted mean outward normal of a face (from its triangles)
+        offsets = self.mesh['face_tri_offsets']
+        tris = np.arange(offsets[face_idx], offsets[face_idx + 1])
+        n = (self.tri_normal[tris] * self.tri_area[tris, None]).sum(axis=0)
+        norm = np.linalg.norm(n)
+        return n / norm if norm > 0 else n
+
+    # 2. Ray casting
+    def visible_fraction(self, tris, axis):
+        direction = np.array(AXIS_DIRECTIONS[axis])
+        origins = self.tri_centroid[tris] + self.ray_offset * self.tri_normal[tris]
+        blocked = self.bvh.any_hit(origins, direction)
+        if self.exact and not blocked.all():
+            blocked = self.confirm_exact(origins, direction, blocked)
+        total = self.tri_area[tris].sum()
+        return float(self.tri_area[tris][~blocked].sum() / total) if total > 0 else 0.0
+
+    def confirm_exact(self, origins, direction, blocked):
+        # walk a few of the free rays through the stock box and ask OCC if any point is inside the part
+        classifier = BRepClass3d_SolidClassifier(self.shape)
+        free = np.flatnonzero(~blocked)
+        step = self.diag / 50
+        blocked = blocked.copy()
+        for ray in free[np.linspace(0, len(free) - 1, min(self.exact_samples, len(free))).astype(int)]:
+            point = origins[ray].copy()
+            while np.all(point >= self.stock_min - step) and np.all(point <= self.stock_max + step):
+                point += step * direction
+                classifier.Perform(gp_Pnt(*point), 1e-6)
+                if classifier.State() == TopAbs_IN:
+                    blocked[ray] = True
+                    break
+        return blocked
+
+    # 3. TADs of every feature
+    def extract_tads(self):
+        if self.tads_info is not None:
+            return self.tads_info
+        self.tads_info = []
+        for match in self.features:
+            tris = self.feature_triangles(match)
+            tads = []
+            for axis in AXIS_DIRECTIONS:
+                if len(tris) == 0:
+                    break
+                if (self.visibility is not None and
+                        self.visibility.max_visible_fraction(tris, axis) < self.min_visible - 0.1):
+                    continue # (0.1 margin: pixel visibility is only an estimate of the ray test)
+                fraction = self.visible_fraction(tris, axis)
+                if fraction < self.min_visible:
+                    continue
+                # base face looking at the tool -> blind feature on this axis, otherwise "none" (through)
+                direction = np.array(AXIS_DIRECTIONS[axis])
+                tad_face = next((f for f in match['tad_faces']
+                                 if np.dot(self.face_direction(f), direction) > 0.99), "none")
+                tads.append({
+                    'axis': axis,
+                    'tad_face_index': tad_face,
+                    'visible_fraction': fraction,
+                    'dependency': []
+                })
+            self.tads_info.append({
+                'feat_idx': match['feat_idx'],
+                'feature_type': match['feature_type'],
+                'node_indices': match['node_indices'],
+                'feature_uid': match.get('feature_uid'),
+                'tads': tads,
+                'dependency': []
+            })
+        return self.tads_info
+
+    def print_tad_table(self):
+        tads_info = self.extract_tads()
+        print("\n" + "=" * 80)
+        print(f"{'FEATURE':<10} | {'TYPE':<22} | {'TADs (axis: base face, visible %)'}")
+        print("-" * 80)
+        for info in tads_info:
+            tads = ", ".join(f"{t['axis']}: {t['tad_face_index']} ({t['visible_fraction'] * 100:.0f}%)"
+                             for t in info['tads']) or "INACCESSIBLE"
+            print(f"{info['feat_idx']:<10} | {info['feature_type']:<22} | {tads}")
+        print("=" * 80 + "\n")
+
+
+# Dependencies: on a given axis, feature A needs feature B first if B lies between the tool and A
+# (B starts where A ends along the axis) and their footprints on the machining plane overlap,
+# e.g. a hole in the base of a pocket needs the pocket.
+
+class Dependencies:
+    def __init__(self, my_shape, recognizer=None, tad_extractor=None, tol=1e-3):
+        self.shape = my_shape
+        (self.all_faces, self.face_data_list, self.analyser, self.all_edges,
+         self.edge_data_list) = analyze_shape(self.shape)
+        self.recognizer = recognizer if recognizer else FeatureRecognition(self.shape)
+        self.features = self.recognizer.identify_features()
+        self.tad_extractor = tad_extractor if tad_extractor else TAD_Extraction(self.shape, self.recognizer)
+        self.tol = tol
+        self.feature_info = None
+
+    def identify_relationships(self):
+        if self.feature_info is not None:
+            return self.feature_info
+        tads_info = self.tad_extractor.extract_tads()
+        self.feature_info = tads_info
+        if not tads_info:
+            return self.feature_info
+
+        # feature boxes (from the face boxes of the analysis) in an AABB tree -> one query per feature
+        boxes = self.recognizer.get_feature_boxes()
+        tree = self.recognizer.get_feature_tree()
+        info_by_idx = {info['feat_idx']: info for info in tads_info}
+        big = 1e9
+
+        for axis, direction in AXIS_DIRECTIONS.items():
+            k = int(np.argmax(np.abs(direction)))
+            others = [c for c in range(3) if c != k]
+            on_axis = {info['feat_idx'] for info in tads_info if any(t['axis'] == axis for t in info['tads'])}
+
+            for feat_idx in on_axis:
+                box = np.array(boxes[feat_idx])
+                # region on the tool side of the feature, above its footprint
+                query = box.copy()
+                if direction[k] > 0:
+                    query[k], query[k + 3] = box[k + 3] - self.tol, big
+                else:
+                    query[k], query[k + 3] = -big, box[k] + self.tol
+                tad = next(t for t in info_by_idx[feat_idx]['tads'] if t['axis'] == axis)
+
+                for other in tree.overlapping(query):
+                    if other == feat_idx or other not in on_axis:
+                        continue
+                    other_box = np.array(boxes[other])
+                    # footprints have to really overlap, not only touch
+                    if all(min(box[c + 3], other_box[c + 3]) - max(box[c], other_box[c]) > self.tol for c in others):
+                        ahead = (other_box[k] >= box[k + 3] - self.tol if direction[k] > 0
+                                 else other_box[k + 3] <= box[k] + self.tol)
+                        if ahead:
+                            tad['dependency'].append(other)
+
+        for info in tads_info:
+            for t in info['tads']:
+                t['dependency'].sort()
+            info['dependency'] = sorted({d for t in info['tads'] for d in t['dependency']})
+        return self.feature_info
+
+    def print_dependency_table(self):
+        feature_info = self.identify_relationships()
+        print("\n" + "=" * 80)
+        print(f"{'FEATURE':<10} | {'TYPE':<22} | {'NEEDS (per axis)'}")
+        print("-" * 80)
+        for info in feature_info:
+            deps = ", ".join(f"{t['axis']}: {t['dependency']}" for t in info['tads'] if t['dependency']) or "None"
+            print(f"{info['feat_idx']:<10} | {info['feature_type']:<22} | {deps}")
+        print("=" * 80 + "\n")
@@ -1,13 +1,20 @@
 from FeatureRecognition.feature_recognition import FeatureRecognition
-from FeatureRecognition.geometry_analysis import analyze_shape, get_stock_box
+from FeatureRecognition.geometry_analysis import analyze_shape, get_stock_box, get_face_mesh
+from FeatureRecognition.figure_export import show_or_export
+from FeatureRecognition.memory_profile import memory_stage
 from SetupPlanning.TAD_and_Dependencies import TAD_Extraction, Dependencies
 from SetupPlanning.Setup_Plan import Setup_Plan
+from SetupPlanning.polygon_clipping import (intersect_triangle_sets, clip_region, region_area,
+                                            points_in_region, region_span, min_far_extent)
+from SetupPlanning.vice_catalogue import ViceCatalogue, evaluate_vices
 
 import numpy as np
 
 
 class Workholding:
-    def __init__(self, my_shape, recognizer=None):
+    def __init__(self, my_shape, recognizer=None, feature_info=None, plans=None, locator_options=None):
+        # feature_info / plans: cached results of the planning stage (see result_cache.py)
+        # locator_options: budget / cancellation / progress of the locator search (Setup_Plan.find_locators)
         self.shape = my_shape
         (self.all_faces, self.face_data_list, self.analyser, self.all_edges,
          self.edge_data_list) = analyze_shape(self.shape)
@@ -18,9 +25,11 @@ class Workholding:
         self.features = self.recognizer.identify_features()
         self.colors_rgb = self.recognizer.colors_rgb
 
-        self.setup_plan = Setup_Plan(self.shape, recognizer=self.recognizer)
+        self.setup_plan = Setup_Plan(self.shape, recognizer=self.recognizer, feature_info=feature_info,
+                                     locator_options=locator_options)
         self.stock_faces = self.setup_plan.define_stock_faces_list()
-        self.optimized_plan = self.setup_plan.generate_optimized_plan()
+        self.plans = plans if plans is not None else self.setup_plan.generate_plans() # greedy + minimum number of setups
+        self.optimized_plan = self.plans['exact']
 
     # Helper functions
     def generate_grid (self, axis, step_size=0.5):
@@ -41,11 +50,11 @@ class Workholding:
             if face['opposite_TAD'] == opposite_axis_face:
                 faces.append(face['stock_face_idx'])
         h_val = self.face_data_list[faces[0]]['face_center'][fixed_idx] if faces else 0
+        face_meshes = [get_face_mesh(self.shape, f) for f in faces]
         for v1 in dim1_range:
             for v2 in dim2_range:
-                in_face = any(self.setup_plan._is_point_in_face_mesh(v1, v2,self.face_data_list[f]['mesh_vertices'],
-                                                        self.face_data_list[f]['mesh_triangles'], idx1, idx2)
-                               for f in faces)
+                in_face = any(self.setup_plan._is_point_in_face_mesh(v1, v2, vertices, triangles, idx1, idx2)
+                               for vertices, triangles in face_meshes)
                 if in_face:
                     pnt = [0, 0, 0]
                     pnt[idx1], pnt[idx2], pnt[fixed_idx] = v1, v2, h_val
@@ -53,7 +62,64 @@ class Workholding:
 
         return grid_points
 
-    def common_parallel_area (self, fa1, fa2, step_size=0.5):
+    def stock_faces_of_pair(self, fa1, fa2):
+        faces1, faces2 = [], []
+        for face in self.stock_faces:
+            if face['opposite_TAD'] == fa1:
+                faces2.append(face['stock_face_idx'])
+            elif face['opposite_TAD'] == fa2:
+                faces1.append(face['stock_face_idx'])
+        return faces1, faces2
+
+    def faces_triangles_2d(self, faces, idx1, idx2):
+        # mesh triangles of the faces projected on their plane, (N, 3, 2)
+        tris = []
+        for f in faces:
+            vertices, triangles = get_face_mesh(self.shape, f)
+            if len(triangles):
+                tris.append(vertices[triangles][:, :, [idx1, idx2]])
+        return np.concatenate(tris) if tris else np.zeros((0, 3, 2))
+
+    @memory_stage("common_parallel_region")
+    def common_parallel_region(self, fa1, fa2):
+        # exact common region of the opposite stock faces (polygon clipping of their triangles)
+        axis_map = {'z': (0, 1, 2), '-z': (0, 1, 2),
+                    'x': (1, 2, 0), '-x': (1, 2, 0),
+                    'y': (0, 2, 1), '-y': (0, 2, 1)}
+        idx1, idx2, fixed_idx = axis_map[fa1]
+        faces1, faces2 = self.stock_faces_of_pair(fa1, fa2)
+        h_val = (self.face_data_list[faces1[0]]['face_center'][fixed_idx] +
+                 self.face_data_list[faces2[0]]['face_center'][fixed_idx]) / 2 if (faces1 and faces2) else 0
+        pieces = intersect_triangle_sets(self.faces_triangles_2d(faces1, idx1, idx2),
+                                         self.faces_triangles_2d(faces2, idx1, idx2))
+        return {
+            'axes': (idx1, idx2, fixed_idx),
+            'height': h_val,
+            'pieces': pieces, # convex polygons (2D, coords idx1/idx2)
+            'area': region_area(pieces)
+        }
+
+    def region_grid_points(self, region, step_size=0.5):
+        # same grid as the sampled mode, but only the points inside the exact region
+        idx1, idx2, fixed_idx = region['axes']
+        bounds = [(self.xmin, self.xmax), (self.ymin, self.ymax), (self.zmin, self.zmax)]
+        g1, g2 = np.meshgrid(np.arange(bounds[idx1][0], bounds[idx1][1], step_size),
+                             np.arange(bounds[idx2][0], bounds[idx2][1], step_size), indexing='ij')
+        pts_2d = np.column_stack([g1.ravel(), g2.ravel()])
+        pts_2d = pts_2d[points_in_region(pts_2d, region['pieces'])]
+        pts = np.full((len(pts_2d), 3), float(region['height']))
+        pts[:, idx1], pts[:, idx2] = pts_2d[:, 0], pts_2d[:, 1]
+        return [tuple(p) for p in pts]
+
+    @memory_stage("common_parallel_area")
+    def common_parallel_area (self, fa1, fa2, step_size=0.5, exact=True, with_points=True):
+        # exact -> area from polygon clipping, grid points only if with_points
+        # exact=False -> old sampled area (point-in-mesh test on every grid point, slow)
+        if exact:
+            region = self.common_parallel_region(fa1, fa2)
+            grid_points = self.region_grid_points(region, step_size) if with_points else []
+            return grid_points, region['area']
+
         axis_map = {'z': (0, 1, 2), '-z': (0, 1, 2),
                     'x': (1, 2, 0), '-x': (1, 2, 0),
                     'y': (0, 2, 1), '-y': (0, 2, 1)}
@@ -61,23 +127,19 @@ class Workholding:
         bounds = [(self.xmin, self.xmax), (self.ymin, self.ymax), (self.zmin, self.zmax)]
         dim1_range = np.arange(bounds[idx1][0], bounds[idx1][1], step_size)
         dim2_range = np.arange(bounds[idx2][0], bounds[idx2][1], step_size)
-        faces1, faces2, grid_points = [], [], []
-        for face in self.stock_faces:
-            if face['opposite_TAD'] == fa1:
-                faces2.append(face['stock_face_idx'])
-            elif face['opposite_TAD'] == fa2:
-                faces1.append(face['stock_face_idx'])
+        faces1, faces2 = self.stock_faces_of_pair(fa1, fa2)
+        grid_points = []
         h_val = (self.face_data_list[faces1[0]]['face_center'][fixed_idx] +
                  self.face_data_list[faces2[0]]['face_center'][fixed_idx]) / 2 if (faces1 and faces2) else 0
+        face_meshes1 = [get_face_mesh(self.shape, f) for f in faces1]
+        face_meshes2 = [get_face_mesh(self.shape, f) for f in faces2]
         for v1 in dim1_range:
             for v2 in dim2_range:
-                in_face1 = any(self.setup_plan._is_point_in_face_mesh(v1, v2,self.face_data_list[f]['mesh_vertices'],
-                                                        self.face_data_list[f]['mesh_triangles'], idx1, idx2)
-                               for f in faces1)
+                in_face1 = any(self.setup_plan._is_point_in_face_mesh(v1, v2, vertices, triangles, idx1, idx2)
+                               for vertices, triangles in face_meshes1)
                 if in_face1:
-                    in_face2 = any(self.setup_plan._is_point_in_face_mesh(v1, v2,self.face_data_list[f]['mesh_vertices'],
-                                                        self.face_data_list[f]['mesh_triangles'], idx1, idx2)
-                                   for f in faces2)
+                    in_face2 = any(self.setup_plan._is_point_in_face_mesh(v1, v2, vertices, triangles, idx1, idx2)
+                                   for vertices, triangles in face_meshes2)
                     if in_face2:
                         res_pnt = [0.0, 0.0, 0.0]
                         res_pnt[idx1] = v1
@@ -100,7 +162,7 @@ class Workholding:
         }
         step_size = 0.5
         if not common_pts:
-            return 0, 0, 0
+            return 0, 0, 0, 0, 0
         idx_len, idx_height = dual_axis_map[setup][face_axis]
         pts_arr = np.array(common_pts)
 
@@ -147,28 +209,60 @@ class Workholding:
 
         return max_len, idx_len, h_min, h_max, idx_height
 
-    # ACTUAL
-    def clamping_faces (self):
-        vice_library = {
-            'width': 200,
-            'height': 50,
-            'length': 150
+    def region_height_and_length(self, region, setup, face_axis):
+        # same as find_height_and_length, straight from the polygons of the region (no grid):
+        # max_len = span along the length axis, h_max = smallest distance from the stock floor to the
+        # far end of the region over the length columns
+        # -> same tuple (max_len, idx_len, h_min, h_max, idx_height), but h_min (continuous height
+        # from the floor) is None: the polygons have no gap check and clamping_faces only uses h_max
+        dual_axis_map = {
+            'z': {'x': (1, 2), '-x': (1, 2), 'y': (0, 2), '-y': (0, 2)},
+            '-z': {'x': (1, 2), '-x': (1, 2), 'y': (0, 2), '-y': (0, 2)},
+            'x': {'y': (2, 0), '-y': (2, 0), 'z': (1, 0), '-z': (1, 0)},
+            '-x': {'y': (2, 0), '-y': (2, 0), 'z': (1, 0), '-z': (1, 0)},
+            'y': {'x': (2, 1), '-x': (2, 1), 'z': (0, 1), '-z': (0, 1)},
+            '-y': {'x': (2, 1), '-x': (2, 1), 'z': (0, 1), '-z': (0, 1)}
         }
+        idx_len, idx_height = dual_axis_map[setup][face_axis]
+        if not region['pieces']:
+            return 0, idx_len, None, 0, idx_height
+        if setup in ['x', 'y', 'z']: # positive setup -> the part is flipped
+            stock_min_h = [self.xmax, self.ymax, self.zmax][idx_height]
+        else:
+            stock_min_h = [self.xmin, self.ymin, self.zmin][idx_height]
+        u_pos = region['axes'].index(idx_len)
+        max_len = region_span(region['pieces'], u_pos)
+        h_max = abs(round(min_far_extent(region['pieces'], u_pos, stock_min_h)))
+        return max_len, idx_len, None, h_max, idx_height
+
+    # ACTUAL
+    def jaw_band(self, region, idx_height, ref_floor, h):
+        # convex polygon |height - ref_floor| <= h on the plane of the region
+        band_pos = region['axes'].index(idx_height)
+        far = 10 * (abs(self.xmax - self.xmin) + abs(self.ymax - self.ymin) + abs(self.zmax - self.zmin)) + 1
+        band = np.array([[-far, ref_floor - h], [far, ref_floor - h], [far, ref_floor + h], [-far, ref_floor + h]])
+        return band[:, ::-1] if band_pos == 0 else band
+
+    def clamping_faces (self, catalogue=None):
+        # catalogue: ViceCatalogue (default: the reference vice of vice_catalogue.DEFAULT_VICES)
+        # a pair wider than a vice's opening only rules that vice out with a real catalogue; the
+        # reference vice is never checked against the width (same PASS/FAIL as before the catalogue)
+        check_width = catalogue is not None
+        catalogue = catalogue if catalogue is not None else ViceCatalogue()
 
         perpendicular_axis = {'z': ('x', '-x', 'y', '-y'), '-z': ('x', '-x', 'y', '-y'),
                               'x': ('z', '-z', 'y', '-y'), '-x': ('z', '-z', 'y', '-y'),
                               'y': ('x', '-x', 'z', '-z'), '-y': ('x', '-x', 'z', '-z')}
         clamping_faces_info = []
-        table_data = []
 
         # Header for the console table
-        print("\n" + "=" * 125)
+        print("\n" + "=" * 140)
         print(
-            f"{'Setup':<8} | {'Pair':<10} | {'Width':<8} | {'Height':<8} | {'Length':<8} | {'H-Ratio':<8} | {'L-Ratio':<8} | {'Area-R':<8} | {'HangH-L':<8} | {'Status'}")
-        print("-" * 125)
+            f"{'Setup':<8} | {'Pair':<10} | {'Width':<8} | {'Height':<8} | {'Length':<8} | {'H-Ratio':<8} | {'L-Ratio':<8} | {'Area-R':<8} | {'HangH-L':<8} | {'Vice':<12} | {'Status'}")
+        print("-" * 140)
         # 1st Row: Library Vice Info
-        print(
-            f"{'LIB':<8} | {'N/A':<10} | {vice_library['width']:<8.2f} | {vice_library['height']:<8.2f} | {vice_library['length']:<8.2f} | {'1.00':<8} | {'1.00':<8} | {'1.00':<8} | REFERENCE")
+        print(f"{'LIB':<8} | {'N/A':<10} | {len(catalogue)} vices, opening {catalogue.width.min():.0f}-"
+              f"{catalogue.width.max():.0f} mm | REFERENCE")
 
         #print("\n--- ANALYZING CLAMPING OPTIONS PER SETUP ---")
         for setup in self.optimized_plan:
@@ -179,16 +273,13 @@ class Workholding:
             print(f"\nSetup {setup_axis}:")
 
             for fa1,fa2 in pairs_parallel_faces: #fa = face axis
-                #print(f"VALIDATING Pair {fa1}/{fa2}.")
                 max_min_pts = {'x': (self.xmin, self.xmax),
                                'y': (self.ymin, self.ymax),
                                'z': (self.zmin, self.zmax)}
-                # Validate based on clamping area, define max height without interfering with a feature of setup,
-                # height of part if clamped in that way vs height of clamp (stability)
-                # stability score
+                # Geometry of the pair, computed once and shared by every vice
                 # 1. Is there Clamping Area?
-                common_pts, common_area = self.common_parallel_area(fa1, fa2)
-                if not common_pts:
+                region = self.common_parallel_region(fa1, fa2)
+                if region['area'] <= 0:
                     print(f"  Pairs {fa1}/{fa2}: No common area found.")
                     continue
 
@@ -196,82 +287,63 @@ class Workholding:
                 clamping_width = abs(max_min_pts[fa1][1] - max_min_pts[fa1][0])
 
                 # 3. Total Height of part vs max Height of clamping area
-                max_len, idx_len, h_min, h_max, idx_height = self.find_height_and_length(common_pts, setup_axis, fa1)
+                max_len, idx_len, _, h_max, idx_height = self.region_height_and_length(region, setup_axis, fa1)
                 axis_letter = setup_axis.replace('-', '')
                 total_part_height = max_min_pts[axis_letter][1] - max_min_pts[axis_letter][0]
                 h_ratio = h_max/ total_part_height
-                '''
-                if h_max < 0.4 * total_part_height:  # 40% of total height
-                    print(f"Max height of clamping: {h_max},  too small for total height of {total_part_height}.")
-                    continue'''
 
-                # 4. Validate length
+                # 4. Length
                 len_axis = {  # input (setup, face axis) -> output(length and height)
                     'z': {'x': 'y', 'y': 'x'},
                     'x': {'y': 'z', 'z': 'y'},
                     'y': {'x': 'z', 'z': 'x'},
                 }
-                idx_len = len_axis[axis_letter][fa1]
+                idx_len = len_axis[axis_letter][fa1.replace('-', '')]
                 total_len = abs(max_min_pts[idx_len][1] - max_min_pts[idx_len][0])
-                len_ratio = max_len/total_len
-                hanging_height = total_part_height - min(h_max, vice_library['height'])
-                hanging_height_length_ratio = (hanging_height)/total_len
-                '''
-                if max_len < 0.5* total_len:
-                    print(f"Max length of clamping {max_len} too small.")
-                    continue'''
-
 
-                # 5. Contact area validation
-                h_filt = min(h_max, vice_library['height'])
+                # 5. Contact area inside the jaw band (depends on the jaw height -> per vice)
                 is_pos = setup_axis in ['x', 'y', 'z']
-                ref_floor = max_min_pts[setup_axis.replace('-', '')][1 if is_pos else 0]
-                if is_pos:# If setup is +X, height goes "down" from Xmax
-                    filtered_pts = [p for p in common_pts if abs(p[idx_height] - ref_floor) <= h_filt]
-                else:# If setup is -X, height goes "up" from Xmin
-                    filtered_pts = [p for p in common_pts if abs(p[idx_height] - ref_floor) <= h_filt]
-                common_area_filt = len(filtered_pts) * (0.5 ** 2) #0.5 is step size
-                theoretical_jaw_area = max_len * h_filt
-                contact_area_ratio = common_area_filt / (theoretical_jaw_area)
-
-
-
-                '''
-                if contact_area_ratio < 0.4:  # Require at least 40% contact in the grip zone
-                    print(f"Contact ratio {contact_area_ratio:.2f} too low.")
-                    continue'''
-
-                # 6. Flagging Logic
-                # Criteria: H >= 1/3 (0.33), Len >= 2/3 (0.66), Area >= 2/3 (0.66)
-                is_valid = h_ratio >= 0.33 and len_ratio >= 0.66 and contact_area_ratio >= 0.66 and hanging_height_length_ratio <=3
-                status = "PASS" if is_valid else "FAIL"
-
-                '''print(f"Pair of faces {fa1}/{fa2} sucessfully validated.")
-                print(f"-> Clamping Width: {clamping_width} mm.")
-                print(f"-> Max Heigth without intersecting features of this setup: {h_max} mm.")
-                print(f"-> Min Height without intersecting any feature's openings: {h_min} mm.")
-                print(f"-> Length of common area: {max_len} mm.")
-                print(f"-> Stability score: {stability_score}.")'''
-                # Print Row
+                ref_floor = max_min_pts[axis_letter][1 if is_pos else 0]
+                def band_area(h):
+                    return region_area(clip_region(region['pieces'], self.jaw_band(region, idx_height, ref_floor, h)))
+
+                # 6. Score every compatible vice at once
+                pair = {'clamping_width': clamping_width, 'common_area': region['area'], 'h_max': h_max,
+                        'h_ratio': h_ratio, 'max_len': max_len, 'total_len': total_len,
+                        'total_part_height': total_part_height}
+                ranked_vices = evaluate_vices(catalogue, pair, band_area, check_width)
+                best = ranked_vices[0] if ranked_vices else None
+
                 pair_str = f"{fa1}/{fa2}"
-                print(
-                    f"{setup_axis:<8} | {pair_str:<10} | {clamping_width:<8.2f} | {h_max:<8.2f} | {max_len:<8.2f} | {h_ratio:<8.2f} | {len_ratio:<8.2f} | {contact_area_ratio:<8.2f} | {hanging_height_length_ratio:<8.2f} | {status}")
+                if best is None:
+                    print(f"{setup_axis:<8} | {pair_str:<10} | {clamping_width:<8.2f} | {h_max:<8.2f} | {max_len:<8.2f} | {h_ratio:<8.2f} | {'-':<8} | {'-':<8} | {'-':<8} | {'-':<12} | FAIL (no vice opens {clamping_width:.0f} mm)")
+                else:
+                    print(
+                        f"{setup_axis:<8} | {pair_str:<10} | {clamping_width:<8.2f} | {h_max:<8.2f} | {max_len:<8.2f} | {h_ratio:<8.2f} | {best['len_ratio']:<8.2f} | {best['contact_area_ratio']:<8.2f} | {best['hanging_height_length_ratio']:<8.2f} | {best['vice']:<12} | {best['status']}")
 
                 clamping_pairs.append({
                     'face_axis': (fa1, fa2),
                     'clamping_width': clamping_width,
                     'h_ratio': h_ratio,
-                    'len_ratio': len_ratio,
-                    'contact_area_ratio': contact_area_ratio,
-                    'hanging_height_length_ratio': hanging_height_length_ratio,
-                    'status': status,
-                    'stability_score': (common_area) * h_ratio * max_len
+                    'len_ratio': best['len_ratio'] if best else max_len / total_len,
+                    'contact_area_ratio': best['contact_area_ratio'] if best else 0.0,
+                    'hanging_height_length_ratio': best['hanging_height_length_ratio'] if best else None,
+                    'status': best['status'] if best else "FAIL",
+                    'stability_score': best['stability_score'] if best else region['area'] * h_ratio * max_len,
+                    'vice': best['vice'] if best else None,
+                    'vices': ranked_vices # every compatible vice, best first
                 })
+
+            # ranked vice assignment of the setup: best vice of each pair, PASS first
+            assignment = sorted([p for p in clamping_pairs if p['vice']],
+                                key=lambda p: (p['status'] != "PASS", -p['stability_score']))
             clamping_faces_info.append({
                 'setup_axis': setup_axis,
-                'face_pairs': clamping_pairs
+                'face_pairs': clamping_pairs,
+                'vice_assignment': [{'face_axis': p['face_axis'], 'vice': p['vice'], 'status': p['status'],
+                                     'stability_score': p['stability_score']} for p in assignment]
             })
-        print("=" * 125 + "\n")
+        print("=" * 140 + "\n")
         return clamping_faces_info
 
     '''def final_clamping_suggestion(self):
@@ -375,7 +447,7 @@ class Workholding:
     '''
 
     # helper visualization
-    def visualize_common_area(self, axis1, axis2, common_points):
+    def visualize_common_area(self, axis1, axis2, common_points, output_path=None):
         import plotly.graph_objects as go
         import numpy as np
 
@@ -418,6 +490,6 @@ class Workholding:
             title=f"Common area for faces {axis1} and {axis2}",
             scene=dict(xaxis_title="X", yaxis_title="Y", zaxis_title="Z", aspectmode="data")
         )
-        fig.show()
+        show_or_export(fig, output_path)
 
 
@@ -0,0 +1,141 @@
+import numpy as np
+
+
+# Small 2D polygon clipping engine for the clamping area: a planar face is the union of its
+# (non overlapping) mesh triangles, so the common region of two faces is the union of the
+# pairwise triangle intersections -> convex pieces, clipped with Sutherland-Hodgman.
+
+def polygon_area(poly):
+    # shoelace, absolute value
+    if len(poly) < 3:
+        return 0.0
+    x, y = np.asarray(poly, dtype=float).T
+    return 0.5 * abs(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1)))
+
+def make_ccw(poly):
+    poly = np.asarray(poly, dtype=float)
+    x, y = poly.T
+    signed = np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1))
+    return poly[::-1] if signed < 0 else poly
+
+def clip_polygon(subject, clip):
+    # subject: any simple polygon, clip: convex polygon -> subject ∩ clip (Sutherland-Hodgman)
+    output = [tuple(p) for p in subject]
+    clip = make_ccw(clip)
+    for k in range(len(clip)):
+        if not output:
+            break
+        a, b = clip[k], clip[(k + 1) % len(clip)]
+        ex, ey = b[0] - a[0], b[1] - a[1]
+
+        def side(p):
+            return ex * (p[1] - a[1]) - ey * (p[0] - a[0]) # >= 0 -> inside (left of a->b)
+
+        points, output = output, []
+        for i in range(len(points)):
+            cur, prev = points[i], points[i - 1]
+            s_cur, s_prev = side(cur), side(prev)
+            if s_cur >= 0:
+                if s_prev < 0:
+                    t = s_prev / (s_prev - s_cur)
+                    output.append((prev[0] + t * (cur[0] - prev[0]), prev[1] + t * (cur[1] - prev[1])))
+                output.append(cur)
+            elif s_prev >= 0:
+                t = s_prev / (s_prev - s_cur)
+                output.append((prev[0] + t * (cur[0] - prev[0]), prev[1] + t * (cur[1] - prev[1])))
+    return np.array(output).reshape(-1, 2)
+
+def intersect_triangle_sets(tris_a, tris_b, min_area=1e-9):
+    # tris: (N, 3, 2) -> list of convex polygons covering (union of a) ∩ (union of b)
+    tris_a, tris_b = np.asarray(tris_a, dtype=float), np.asarray(tris_b, dtype=float)
+    if len(tris_a) == 0 or len(tris_b) == 0:
+        return []
+    min_a, max_a = tris_a.min(axis=1), tris_a.max(axis=1)
+    min_b, max_b = tris_b.min(axis=1), tris_b.max(axis=1)
+    # only pairs whose 2D boxes overlap are clipped
+    overlap = np.all((min_a[:, None] < max_b[None]) & (min_b[None] < max_a[:, None]), axis=2)
+
+    pieces = []
+    for i, j in zip(*np.nonzero(overlap)):
+        piece = clip_polygon(tris_a[i], tris_b[j])
+        if polygon_area(piece) > min_area:
+            pieces.append(piece)
+    return pieces
+
+def clip_region(pieces, clip):
+    # region (list of pieces) ∩ convex polygon
+    clipped = [clip_polygon(p, clip) for p in pieces]
+    return [p for p in clipped if polygon_area(p) > 0]
+
+def region_area(pieces):
+    return float(sum(polygon_area(p) for p in pieces))
+
+def points_in_region(points, pieces):
+    # bool per 2D point: inside any (convex) piece, edges included
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    inside = np.zeros(len(points), dtype=bool)
+    for piece in pieces:
+        piece = make_ccw(piece)
+        lo, hi = piece.min(axis=0), piece.max(axis=0)
+        cand = np.flatnonzero(~inside & np.all((points >= lo - 1e-9) & (points <= hi + 1e-9), axis=1))
+        ok = np.ones(len(cand), dtype=bool)
+        for k in range(len(piece)):
+            a, b = piece[k], piece[(k + 1) % len(piece)]
+            p = points[cand]
+            ok &= (b[0] - a[0]) * (p[:, 1] - a[1]) - (b[1] - a[1]) * (p[:, 0] - a[0]) >= -1e-9
+        inside[cand[ok]] = True
+    return inside
+
+def region_span(pieces, u_pos):
+    # extent of the region along one of its two coordinates
+    u = np.concatenate([np.asarray(p, dtype=float)[:, u_pos] for p in pieces])
+    return float(u.max() - u.min())
+
+def min_far_extent(pieces, u_pos, floor, iters=60):
+    # the region seen as columns along coordinate u_pos: for every column, the distance from `floor` to the
+    # farthest point of the region in it -> the smallest of those (columns with no region are skipped).
+    # Between two consecutive vertex positions each piece's far boundary is linear, so the column
+    # distance is a max of lines there (convex) -> its minimum is found without any grid.
+    v_pos = 1 - u_pos
+    ea = np.concatenate([np.asarray(p, dtype=float) for p in pieces])
+    eb = np.concatenate([np.roll(np.asarray(p, dtype=float), -1, axis=0) for p in pieces])
+    piece_id = np.concatenate([np.full(len(p), i) for i, p in enumerate(pieces)])
+    u_lo = np.array([np.min(np.asarray(p)[:, u_pos]) for p in pieces])
+    u_hi = np.array([np.max(np.asarray(p)[:, u_pos]) for p in pieces])
+
+    def far_at(u):
+        # far distance of every piece in column u (nan: the piece doesn't reach u)
+        a_u, b_u = ea[:, u_pos], eb[:, u_pos]
+        cross = (np.minimum(a_u, b_u) <= u + 1e-9) & (np.maximum(a_u, b_u) >= u - 1e-9)
+        du = b_u[cross] - a_u[cross]
+        a_v, b_v = ea[cross, v_pos], eb[cross, v_pos]
+        flat = np.abs(du) < 1e-12 # edge along the column -> both ends
+        t = np.where(flat, 0.0, (u - a_u[cross]) / np.where(flat, 1.0, du))
+        dist = np.where(flat, np.maximum(np.abs(a_v - floor), np.abs(b_v - floor)),
+                        np.abs(a_v + t * (b_v - a_v) - floor))
+        far = np.full(len(pieces), -np.inf)
+        np.maximum.at(far, piece_id[cross], dist)
+        return np.where(np.isinf(far), np.nan, far)
+
+    breaks = np.unique(np.round(np.concatenate([u_lo, u_hi, ea[:, u_pos]]), 9))
+    far_breaks = [far_at(u) for u in breaks]
+    best = np.inf
+    for k in range(len(breaks)):
+        column = far_breaks[k]
+        if not np.all(np.isnan(column)):
+            best = min(best, np.nanmax(column))
+        if k + 1 == len(breaks):
+            break
+        spanning = (u_lo <= breaks[k] + 1e-9) & (u_hi >= breaks[k + 1] - 1e-9)
+        if not spanning.any():
+            continue
+        f0, f1 = far_breaks[k][spanning], far_breaks[k + 1][spanning]
+        lo, hi = 0.0, 1.0 # ternary search of the convex max of lines on the interval
+        for _ in range(iters):
+            m1, m2 = lo + (hi - lo) / 3, hi - (hi - lo) / 3
+            if np.max(f0 + m1 * (f1 - f0)) <= np.max(f0 + m2 * (f1 - f0)):
+                hi = m2
+            else:
+                lo = m1
+        best = min(best, np.max(f0 + lo * (f1 - f0)))
+    return 0.0 if np.isinf(best) else float(best)
@@ -0,0 +1,80 @@
+import json
+
+import numpy as np
+
+
+# Shop vice / soft-jaw catalogue, kept as numpy columns sorted by opening width, so the vices that
+# can hold a given clamping width are one searchsorted away and are all scored at once.
+
+DEFAULT_VICES = [
+    # name, type, max opening width, jaw height, jaw length (mm)
+    # only the reference vice; the real shop list comes from load_vice_catalogue(path)
+    {'name': 'VICE-150', 'type': 'vice', 'width': 200, 'height': 50, 'length': 150},
+]
+
+
+class ViceCatalogue:
+    def __init__(self, vices=None):
+        vices = vices if vices is not None else DEFAULT_VICES
+        order = sorted(range(len(vices)), key=lambda i: vices[i]['width'])
+        self.vices = [vices[i] for i in order]
+        self.names = np.array([v['name'] for v in self.vices])
+        self.types = np.array([v.get('type', 'vice') for v in self.vices])
+        self.width = np.array([v['width'] for v in self.vices], dtype=float)
+        self.height = np.array([v['height'] for v in self.vices], dtype=float)
+        self.length = np.array([v['length'] for v in self.vices], dtype=float)
+
+    def __len__(self):
+        return len(self.vices)
+
+    def compatible(self, clamping_width):
+        # indices of the vices that open wide enough
+        first = np.searchsorted(self.width, clamping_width, side='left')
+        return np.arange(first, len(self.width))
+
+
+def load_vice_catalogue(path):
+    # json list of {'name', 'type', 'width', 'height', 'length'}
+    with open(path) as fh:
+        return ViceCatalogue(json.load(fh))
+
+
+def evaluate_vices(catalogue, pair, band_area, check_width=True):
+    # pair: geometry of one setup/face pair (computed once)
+    # band_area(h) -> common area inside a jaw band of height h
+    # check_width=False -> no opening check, every vice is scored (the old single-vice behaviour)
+    # -> every compatible vice scored with the same criteria as clamping_faces, best first
+    idx = catalogue.compatible(pair['clamping_width']) if check_width else np.arange(len(catalogue))
+    if len(idx) == 0:
+        return []
+    jaw_h, jaw_len = catalogue.height[idx], catalogue.length[idx]
+
+    # same formulas as the single-vice check: only the jaw height changes from one vice to the other
+    h_filt = np.minimum(pair['h_max'], jaw_h)
+    areas = {h: band_area(h) for h in np.unique(h_filt)}
+    band = np.array([areas[h] for h in h_filt])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        contact_area_ratio = np.nan_to_num(band / (pair['max_len'] * h_filt))
+        hanging_ratio = (pair['total_part_height'] - h_filt) / pair['total_len']
+    len_ratio = np.full(len(idx), pair['max_len'] / pair['total_len'])
+    h_ratio = np.full(len(idx), pair['h_ratio'])
+
+    # Criteria: H >= 1/3 (0.33), Len >= 2/3 (0.66), Area >= 2/3 (0.66), hanging height/length <= 3
+    passed = (h_ratio >= 0.33) & (len_ratio >= 0.66) & (contact_area_ratio >= 0.66) & (hanging_ratio <= 3)
+    score = np.full(len(idx), pair['common_area'] * pair['h_ratio'] * pair['max_len'])
+    spare_width = catalogue.width[idx] - pair['clamping_width']
+
+    # PASS first, then stability score, then the tightest opening
+    ranking = np.lexsort((spare_width, -score, ~passed))
+    return [{
+        'vice': catalogue.names[idx[r]],
+        'type': catalogue.types[idx[r]],
+        'width': float(catalogue.width[idx[r]]),
+        'height': float(jaw_h[r]),
+        'length': float(jaw_len[r]),
+        'len_ratio': float(len_ratio[r]),
+        'contact_area_ratio': float(contact_area_ratio[r]),
+        'hanging_height_length_ratio': float(hanging_ratio[r]),
+        'status': "PASS" if passed[r] else "FAIL",
+        'stability_score': float(score[r])
+    } for r in ranking]
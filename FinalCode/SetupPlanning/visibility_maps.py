@@ -0,0 +1,97 @@
+import numpy as np
+
+from FeatureRecognition.geometry_analysis import get_shape_mesh, get_stock_box
+from FeatureRecognition.mesh_bvh import AXIS_DIRECTIONS, triangle_geometry
+from FeatureRecognition.mesh_raster import AXIS_COORDS, raster_grid, rasterize_depth
+
+
+# Whole-part accessibility: the part mesh is rasterised once for each of the 6 setup directions
+# and every face gets the fraction of its area a tool coming along that axis can see.
+# TAD extraction and the workholding checks query these images instead of per-feature tests.
+
+class VisibilityMaps:
+    def __init__(self, my_shape, resolution=512):
+        self.shape = my_shape
+        self.mesh = get_shape_mesh(self.shape)
+        self.resolution = resolution
+        self.tri_centroid, self.tri_normal, self.tri_area = triangle_geometry(self.mesh)
+        self.n_faces = len(self.mesh['face_tri_offsets']) - 1
+
+        xmin, ymin, zmin, xmax, ymax, zmax, _ = get_stock_box(self.shape)
+        self.maps = {}
+        for axis in AXIS_DIRECTIONS:
+            grid = raster_grid((xmin, ymin, zmin), (xmax, ymax, zmax), axis, resolution)
+            self.maps[axis] = rasterize_depth(self.mesh['vertices'], self.mesh['triangles'], grid)
+        self._tri_visibility = {}
+        self._face_visibility = {}
+
+    def facing(self, axis, tol=1e-3):
+        # +1 triangle looks at the tool, 0 seen edge-on, -1 looks away
+        cos = self.tri_normal @ np.array(AXIS_DIRECTIONS[axis])
+        return np.where(cos > tol, 1, np.where(cos < -tol, -1, 0))
+
+    def triangle_visibility(self, axis):
+        # visible fraction per triangle (triangles too small for a pixel -> centroid against the z-buffer)
+        if axis in self._tri_visibility:
+            return self._tri_visibility[axis]
+        m = self.maps[axis]
+        vis = np.zeros(len(self.tri_area))
+        covered = m['coverage'] > 0
+        vis[covered] = m['visible'][covered] / m['coverage'][covered]
+
+        small = ~covered & (self.facing(axis) > 0)
+        if small.any():
+            u, v, k = AXIS_COORDS[axis]
+            c = self.tri_centroid[small]
+            pi = np.clip(((c[:, u] - m['origin'][0]) / m['pixel']).astype(np.int64), 0, m['width'] - 1)
+            pj = np.clip(((c[:, v] - m['origin'][1]) / m['pixel']).astype(np.int64), 0, m['height'] - 1)
+            depth = AXIS_DIRECTIONS[axis][k] * c[:, k]
+            vis[small] = depth >= m['depth'][pj, pi] - m['depth_tol']
+        vis[self.facing(axis) <= 0] = 0.0
+        self._tri_visibility[axis] = vis
+        return vis
+
+    def face_visibility(self, axis):
+        # visible area / area of the face turned towards the tool (nan: face seen edge-on or from behind)
+        if axis not in self._face_visibility:
+            front = (self.facing(axis) > 0) * self.tri_area
+            seen = self.triangle_visibility(axis) * front
+            tri_face = self.mesh['tri_face']
+            front_area = np.bincount(tri_face, front, minlength=self.n_faces)
+            seen_area = np.bincount(tri_face, seen, minlength=self.n_faces)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                self._face_visibility[axis] = np.where(front_area > 0, seen_area / front_area, np.nan)
+        return self._face_visibility[axis]
+
+    def max_visible_fraction(self, tris, axis):
+        # upper bound of the ray-cast visible fraction of a set of triangles:
+        # looking-away triangles are always blocked, edge-on ones can't be judged from the image
+        facing = self.facing(axis)[tris]
+        area = self.tri_area[tris]
+        total = area.sum()
+        if total <= 0:
+            return 0.0
+        seen = (self.triangle_visibility(axis)[tris] * area)[facing > 0].sum()
+        return float((seen + area[facing == 0].sum()) / total)
+
+    def print_visibility_table(self, face_data_list):
+        print("\n" + "=" * 90)
+        print(f"{'FACE':<6} | {'TYPE':<10} | " + " | ".join(f"{axis:>7}" for axis in AXIS_DIRECTIONS))
+        print("-" * 90)
+        table = {axis: self.face_visibility(axis) for axis in AXIS_DIRECTIONS}
+        for f in face_data_list:
+            cells = []
+            for axis in AXIS_DIRECTIONS:
+                value = table[axis][f['index']]
+                cells.append(f"{'-':>7}" if np.isnan(value) else f"{value * 100:>6.0f}%")
+            print(f"{f['index']:<6} | {f['type']:<10} | " + " | ".join(cells))
+        print("=" * 90 + "\n")
+
+
+def get_visibility_maps(my_shape, resolution=512):
+    # kept with the shared mesh -> computed once per part
+    mesh = get_shape_mesh(my_shape)
+    cache = mesh.setdefault('visibility', {})
+    if resolution not in cache:
+        cache[resolution] = VisibilityMaps(my_shape, resolution)
+    return cache[resolution]
@@ -0,0 +1,246 @@
+import argparse
+import json
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from FeatureRecognition.geometry_analysis import load_step_solids, clear_analysis_cache
+from FeatureRecognition.memory_profile import enable_memory_profiling, disable_memory_profiling
+from FeatureRecognition.feature_recognition import FeatureRecognition
+from FeatureRecognition.shape_fingerprint import group_unique_shapes, relative_transform
+from SetupPlanning.Workholding import Workholding
+from SetupPlanning.vice_catalogue import load_vice_catalogue
+from result_cache import ResultCache, part_key, stage_keys
+
+
+# Batch runner: every solid of every STEP file is one work item, processed in a worker pool.
+# Workers only get (step_file, solid_idx); they load each STEP once and keep its solids.
+
+_loaded_solids = {}  # per worker process: step_file -> list of solid items
+_result_cache = None # per worker process, see configure_result_cache
+
+def configure_result_cache(cache_mb=None, cache_dir=None):
+    # pool initializer too; no size and no folder -> no result cache
+    global _result_cache
+    if cache_mb or cache_dir:
+        _result_cache = ResultCache(int((cache_mb or 256) * 2**20), cache_dir)
+    else:
+        _result_cache = None
+
+def get_solid_list(step_file):
+    if step_file not in _loaded_solids:
+        _loaded_solids[step_file] = load_step_solids(step_file)
+    return _loaded_solids[step_file]
+
+def get_solid(step_file, solid_idx):
+    return get_solid_list(step_file)[solid_idx]
+
+def to_jsonable(obj):
+    # numpy values/arrays (locator points, areas...) -> plain python
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    if isinstance(obj, (set, tuple)):
+        return list(obj)
+    return str(obj)
+
+def export_figures(export_dir, recognizer, workholding):
+    recognizer.visualize_features_3d(show_mesh=True, show_face_centers=False, show_edges=True,
+                                     output_path=os.path.join(export_dir, "features.html"))
+    recognizer.export_features_glb(os.path.join(export_dir, "features.glb"))
+    recognizer.aag.visualize_2d_aag(output_path=os.path.join(export_dir, "aag_2d.png"))
+    recognizer.aag.export_aag(os.path.join(export_dir, "aag.npz"))
+    workholding.setup_plan.visualize_all_setups_3d(workholding.optimized_plan,
+                                                   output_path=os.path.join(export_dir, "setups.html"))
+
+def locator_options(locator=None, label=""):
+    # locator: {'time_budget': s, 'max_evaluations': n, 'progress': bool} (plain data -> picklable)
+    locator = locator or {}
+    options = {k: locator[k] for k in ('time_budget', 'max_evaluations') if locator.get(k) is not None}
+    if locator.get('progress'):
+        def progress(info):
+            print(f"[{label}] locators {info['axis']}: try {info['attempt']} k={info['k']} "
+                  f"{info['evaluated']} trios {info['elapsed']:.1f}s balanced={info['balanced']}")
+        options['progress'] = progress
+    return options
+
+def plan_solid(shape, export_dir=None, backend="networkx", vice_file=None, keys=None, locator=None,
+               label=""):
+    # keys: result cache keys per stage (None -> no cache)
+    cache = _result_cache if keys else None
+    recognizer = FeatureRecognition(shape, backend=backend)
+    cached = cache.get('recognition', keys['recognition']) if cache else None
+    if cached is not None:
+        recognizer.matches = cached # identify_features returns them as they are
+    features = recognizer.identify_features()
+    if cache and cached is None:
+        cache.put('recognition', keys['recognition'], features, default=to_jsonable)
+
+    # (figures need the live locator arrays -> exports always plan again)
+    planning = cache.get('planning', keys['planning']) if cache and not export_dir else None
+    if planning is not None:
+        workholding = Workholding(shape, recognizer, feature_info=planning['feature_info'],
+                                  plans=planning['plans'])
+    else:
+        workholding = Workholding(shape, recognizer, locator_options=locator_options(locator, label))
+    # a locator search stopped by its budget -> partial locators, not stored in the cache
+    complete = not any(s['stopped'] for s in workholding.setup_plan.locator_search.values())
+    if planning is None and cache and complete:
+        cache.put('planning', keys['planning'], {'feature_info': workholding.setup_plan.feature_info,
+                                                 'plans': workholding.plans}, default=to_jsonable)
+    plan = workholding.optimized_plan
+    catalogue = load_vice_catalogue(vice_file) if vice_file else None
+    clamping = workholding.clamping_faces(catalogue)
+    if export_dir:
+        export_figures(export_dir, recognizer, workholding)
+    return {
+        'features': features,
+        'feature_info': workholding.setup_plan.feature_info,
+        'plan': plan,
+        'clamping': clamping,
+        'locator_search': workholding.setup_plan.locator_search,
+        'complete': complete
+    }
+
+def process_work_item(work_item, export_dir=None, backend="networkx", vice_file=None, locator=None,
+                      memory_dir=None):
+    step_file, solid_idx = work_item
+    result = {'step_file': step_file, 'solid_idx': solid_idx}
+    shape = None # analysis/mesh caches of this shape are dropped at the end, also after an error
+    if memory_dir:
+        enable_memory_profiling()
+    try:
+        # 1. Same file content + same settings as before -> stored result, the STEP isn't even loaded
+        keys = stage_keys(part_key(step_file, solid_idx), backend, vice_file) if _result_cache else None
+        if keys and not export_dir:
+            cached = _result_cache.get('clamping', keys['clamping'])
+            if cached is not None:
+                result.update(cached, status='OK', cached=True)
+                return result
+
+        solid = get_solid(step_file, solid_idx)
+        shape = solid['shape']
+        result['transform'] = solid['transform']
+        if export_dir:
+            stem = os.path.splitext(os.path.basename(step_file))[0]
+            export_dir = os.path.join(export_dir, f"{stem}_solid{solid_idx}")
+        label = f"{os.path.basename(step_file)}#{solid_idx}"
+        result.update(plan_solid(shape, export_dir, backend, vice_file, keys, locator, label))
+        if keys and result['complete']:
+            _result_cache.put('clamping', keys['clamping'],
+                              {k: v for k, v in result.items() if k not in ('step_file', 'solid_idx')},
+                              default=to_jsonable)
+        result['status'] = 'OK'
+    except Exception:
+        result['status'] = 'ERROR'
+        result['error'] = traceback.format_exc()
+    finally:
+        if shape is not None:
+            clear_analysis_cache(shape)
+        if memory_dir:
+            # one report per work item (also on a cache hit): stages of this part only
+            stem = os.path.splitext(os.path.basename(step_file))[0]
+            result['memory_profile'] = os.path.join(memory_dir, f"{stem}_solid{solid_idx}_memory.json")
+            disable_memory_profiling().write_report(result['memory_profile'])
+    # round trip so the result is plain data when it goes back to the main process
+    return json.loads(json.dumps(result, default=to_jsonable))
+
+def collect_solids(step_files):
+    solids = []
+    for step_file in step_files:
+        file_solids = load_step_solids(step_file)
+        _loaded_solids[step_file] = file_solids
+        solids.extend(file_solids)
+    return solids
+
+def run_batch(step_files, workers=None, deduplicate=True, export_dir=None, backend="networkx",
+              vice_file=None, cache_mb=None, cache_dir=None, locator=None, memory_dir=None):
+    solids = collect_solids(step_files)
+
+    # 1. Same part several times (assembly instances or identical files) -> analyse it once
+    if deduplicate:
+        groups = group_unique_shapes(solids)
+    else:
+        groups = {i: [s] for i, s in enumerate(solids)}
+    work_items = [(g[0]['step_file'], g[0]['solid_idx']) for g in groups.values()]
+    print(f"\n{len(solids)} solid(s) from {len(step_files)} STEP file(s), "
+          f"{len(work_items)} unique work item(s)")
+
+    # 2. Process the unique shapes
+    unique_results = {}
+    if workers == 1:
+        configure_result_cache(cache_mb, cache_dir)
+        for item in work_items:
+            unique_results[item] = process_work_item(item, export_dir, backend, vice_file, locator, memory_dir)
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=configure_result_cache,
+                                 initargs=(cache_mb, cache_dir)) as pool:
+            futures = {pool.submit(process_work_item, item, export_dir, backend, vice_file, locator, memory_dir): item
+                       for item in work_items}
+            for future in as_completed(futures):
+                unique_results[futures[future]] = future.result()
+
+    # 3. Map the results back to every instance
+    results = []
+    for group in groups.values():
+        rep = group[0]
+        rep_result = unique_results[(rep['step_file'], rep['solid_idx'])]
+        for solid in group:
+            result = dict(rep_result, step_file=solid['step_file'], solid_idx=solid['solid_idx'],
+                          transform=solid['transform'])
+            if solid is not rep:
+                result['instance_of'] = (rep['step_file'], rep['solid_idx'])
+                result['transform_from_representative'] = relative_transform(rep['shape'], solid['shape'])
+            results.append(result)
+
+    results.sort(key=lambda r: (r['step_file'], r['solid_idx']))
+    print_batch_summary(results)
+    return results
+
+def print_batch_summary(results):
+    print("\n" + "=" * 110)
+    print(f"{'STEP file':<35} | {'Solid':<6} | {'Status':<6} | {'Features':<9} | {'Instance of':<20} | {'Setups'}")
+    print("-" * 110)
+    for r in results:
+        n_feats = len(r.get('features', []))
+        setups = [s['setup'] for s in r.get('plan', [])]
+        instance_of = "-"
+        if 'instance_of' in r:
+            instance_of = f"{os.path.basename(r['instance_of'][0])}#{r['instance_of'][1]}"
+        print(f"{os.path.basename(r['step_file']):<35} | {r['solid_idx']:<6} | {r['status']:<6} | "
+              f"{n_feats:<9} | {instance_of:<20} | {setups}")
+    print("=" * 110 + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Feature recognition + setup planning for a batch of STEP files")
+    parser.add_argument('step_files', nargs='+')
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (1 = run in this process)")
+    parser.add_argument('--output', default=None, help="json file with the per-solid results")
+    parser.add_argument('--no-dedup', action='store_true', help="analyse every instance, even repeated ones")
+    parser.add_argument('--export-dir', default=None, help="write html/png/glb figures + binary AAG per solid (headless)")
+    parser.add_argument('--aag-backend', choices=("networkx", "sparse"), default="networkx")
+    parser.add_argument('--vices', default=None, help="json vice catalogue (default: built-in shop vices)")
+    parser.add_argument('--cache-dir', default=None, help="keep results between runs (per part + settings)")
+    parser.add_argument('--cache-mb', type=float, default=None, help="result cache budget (default 256 MB)")
+    parser.add_argument('--locator-budget', type=float, default=None, help="seconds per locator search")
+    parser.add_argument('--locator-max-evals', type=int, default=None,
+                        help="trios per locator search (deterministic budget)")
+    parser.add_argument('--locator-progress', action='store_true', help="print the locator search progress")
+    parser.add_argument('--memory-profile', default=None, metavar='DIR',
+                        help="tracemalloc + peak RSS per pipeline stage, one json report per solid (slow)")
+    args = parser.parse_args()
+    locator = {'time_budget': args.locator_budget, 'max_evaluations': args.locator_max_evals,
+               'progress': args.locator_progress}
+
+    results = run_batch(args.step_files, workers=args.workers, deduplicate=not args.no_dedup,
+                        export_dir=args.export_dir, backend=args.aag_backend, vice_file=args.vices,
+                        cache_mb=args.cache_mb, cache_dir=args.cache_dir, locator=locator,
+                        memory_dir=args.memory_profile)
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(results, fh, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
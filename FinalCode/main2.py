@@ -1,5 +1,5 @@
-from OCC.Display.SimpleGui import init_display
 import os
+import argparse
 
 from FeatureRecognition.feature_recognition import FeatureRecognition
 from FeatureRecognition.geometry_analysis import load_step_file
@@ -9,6 +9,10 @@ from SetupPlanning.Workholding import Workholding
 
 
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--export', default=None, help="write the visualisations to this folder (no GUI)")
+    args = parser.parse_args()
+
     # 1. Load STEP file
     step_file = os.path.join("STEPFiles", "Part3.stp")
     my_shape = load_step_file(step_file)
@@ -24,7 +28,7 @@ def main():
     extractor = TAD_Extraction(my_shape, recognizer=recognizer)
     extractor.print_tad_table()
 
-    dependencies = Dependencies(my_shape, recognizer=recognizer)
+    dependencies = Dependencies(my_shape, recognizer=recognizer, tad_extractor=extractor)
     dependencies.print_dependency_table()
 
     # 3. Process Planning & Workholding Validation
@@ -62,11 +66,20 @@ def main():
                      'x': '-x', '-x': 'x',
                      'y': '-y', '-y': 'y'}
     test_axis_2 = opposite_axis[test_axis]
-    common_points, common_area = workholding.common_parallel_area(test_axis, test_axis_2)
+    common_points, common_area = workholding.common_parallel_area(test_axis, test_axis_2, exact=True)
     workholding.visualize_common_area(test_axis, test_axis_2, common_points) #'''
 
     # 4. Visualization
     print("\n" + "=" * 30 + "\nVISUALIZATION\n" + "=" * 30)
+    if args.export:
+        recognizer.visualize_features_3d(show_mesh=True, show_face_centers=False, show_edges=True,
+                                         show_feat_idx=True, show_all_face_centers=True,
+                                         output_path=os.path.join(args.export, "features.html"))
+        recognizer.export_features_glb(os.path.join(args.export, "features.glb"))
+        process_planner.visualize_all_setups_3d(optimized_plan,
+                                                output_path=os.path.join(args.export, "setups.html"))
+        return
+
     choice = input(
         "Visualize:"
         "(0) Only Features,"
@@ -1,15 +1,27 @@
 import os
-from OCC.Display.SimpleGui import init_display
+import argparse
 from FeatureRecognition.geometry_analysis import (load_step_file, analyze_shape, print_face_analysis_table, print_edge_analysis_table)
 from FeatureRecognition.aag_builder import AAGBuilder_2D, AAGBuilder_3D
 from FeatureRecognition.feature_recognition import FeatureRecognition
-from FeatureRecognition.part_visualizer_occ import PartVisualizer_occ
 from FeatureRecognition.part_vizualizer_plotly import Part_Visualizer
 
 
+def export_all(export_dir, builder2D, builder3D, recognizer, viz):
+    # headless: every visualisation written to export_dir, no GUI / browser needed
+    viz.visualize_numbered_faces(output_path=os.path.join(export_dir, "numbered_faces.html"))
+    viz.visualize_geometric_edges(output_path=os.path.join(export_dir, "edge_types.html"))
+    recognizer.visualize_features_3d(show_mesh=True, show_face_centers=True, show_edges=True,
+                                     output_path=os.path.join(export_dir, "features.html"))
+    recognizer.export_features_glb(os.path.join(export_dir, "features.glb"))
+    builder2D.visualize_2d_aag(output_path=os.path.join(export_dir, "aag_2d.png"))
+    builder3D.visualize_3d_aag(hide_convex=False, output_path=os.path.join(export_dir, "aag_3d.html"))
+    builder3D.visualize_3d_aag(hide_convex=True, output_path=os.path.join(export_dir, "aag_3d_no_convex.html"))
+
+
 def main():
-    # Initialize display
-    display, start_display, add_menu, add_function_to_menu = init_display()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--export', default=None, help="write all visualisations to this folder (no GUI)")
+    args = parser.parse_args()
 
     # Load STEP file
     my_shape = load_step_file(os.path.join("STEPFiles", "Part3.stp"))
@@ -42,6 +54,11 @@ def main():
 
     # Visualize results
     print("\n VISUALIZATION")
+    viz = Part_Visualizer(builder3D)
+    if args.export:
+        export_all(args.export, builder2D, builder3D, recognizer, viz)
+        return
+
     choice = input(
         "Visualize: "
         "(0) Numbered Faces,"
@@ -54,9 +71,6 @@ def main():
         "[0/1/2/3/4/5/6]: "
     )
 
-    viz_occ = PartVisualizer_occ(builder2D, recognizer)
-    viz = Part_Visualizer(builder3D)
-
     if choice == "0":
         #builder3D.visualize_numbered_faces()
         viz.visualize_numbered_faces()
@@ -88,8 +102,6 @@ def main():
     if choice == "6":
         builder3D.visualize_3d_aag(hide_convex=True)
 
-    start_display()
-
 
 if __name__ == "__main__":
     main()
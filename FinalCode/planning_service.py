@@ -0,0 +1,172 @@
+import argparse
+import hashlib
+import json
+import os
+import socketserver
+import tempfile
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import batch_planning
+
+
+# Long-lived local planning service: the OCC / networkx / numpy imports and the loaded solids stay
+# warm in a pool of worker processes, so a request only pays for the planning of its part.
+#   GET  /health           -> {"status": "ok", "workers": n}
+#   POST /plan             -> raw STEP bytes in the body (?solid=0&backend=sparse&vices=file.json)
+#                             or json {"path": "...", "solid": 0, "backend": "...", "vices": "..."}
+# Response: {"step_file", "sha256", "solids": [one batch_planning result per solid]}
+# STEP files are spooled by content hash, so the same part sent twice hits the worker's solid cache.
+
+MAX_LOADED_FILES = 16 # per worker: STEP files kept loaded (oldest dropped first)
+
+
+#### Worker side ####
+
+def warm_worker(warm_step=None, cache_mb=256, cache_dir=None):
+    # pool initializer: batch_planning is already imported (OCC + planning modules);
+    # optionally run a part once so lazily built things are ready too
+    batch_planning.configure_result_cache(cache_mb, cache_dir)
+    if warm_step:
+        for solid_idx in range(len(batch_planning.get_solid_list(warm_step))):
+            batch_planning.process_work_item((warm_step, solid_idx))
+
+def plan_step(step_file, solid_idx=None, backend="networkx", vice_file=None):
+    loaded = batch_planning._loaded_solids
+    if step_file in loaded:
+        loaded[step_file] = loaded.pop(step_file) # most recently used goes last
+    solids = batch_planning.get_solid_list(step_file)
+    while len(loaded) > MAX_LOADED_FILES:
+        loaded.pop(next(iter(loaded)))
+
+    indices = range(len(solids)) if solid_idx is None else [solid_idx]
+    return [batch_planning.process_work_item((step_file, i), backend=backend, vice_file=vice_file)
+            for i in indices]
+
+def ping():
+    return os.getpid()
+
+
+#### Service ####
+
+class PlanningService:
+    def __init__(self, workers=2, spool_dir=None, warm_step=None, cache_mb=256, cache_dir=None):
+        self.workers = workers
+        self.spool_dir = spool_dir or os.path.join(tempfile.gettempdir(), "planning_service_spool")
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self.pool = ProcessPoolExecutor(max_workers=workers, initializer=warm_worker,
+                                        initargs=(warm_step, cache_mb, cache_dir))
+        # start every worker now (the pool only forks on demand) -> first requests are warm too
+        pids = {f.result() for f in [self.pool.submit(ping) for _ in range(workers)]}
+        print(f"{len(pids)} warm worker(s) ready")
+
+    def spool(self, data):
+        # content addressed copy of the STEP file
+        sha = hashlib.sha256(data).hexdigest()
+        path = os.path.join(self.spool_dir, f"{sha}.stp")
+        if not os.path.exists(path):
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, 'wb') as fh:
+                fh.write(data)
+            os.replace(tmp, path)
+        return path, sha
+
+    def plan(self, data=None, path=None, solid_idx=None, backend="networkx", vice_file=None):
+        if data is None:
+            with open(path, 'rb') as fh:
+                data = fh.read()
+        step_file, sha = self.spool(data)
+        solids = self.pool.submit(plan_step, step_file, solid_idx, backend, vice_file).result()
+        return {'step_file': path or step_file, 'sha256': sha, 'solids': solids}
+
+    def shutdown(self):
+        self.pool.shutdown(wait=True)
+
+
+class PlanningRequestHandler(BaseHTTPRequestHandler):
+    service = None # set by make_server
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload, default=batch_planning.to_jsonable).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if urlparse(self.path).path == '/health':
+            self.send_json(200, {'status': 'ok', 'workers': self.service.workers})
+        else:
+            self.send_json(404, {'error': f"unknown path {self.path}"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != '/plan':
+            self.send_json(404, {'error': f"unknown path {self.path}"})
+            return
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        try:
+            if self.headers.get('Content-Type', '').startswith('application/json'):
+                options = json.loads(body)
+                data, path = None, options['path']
+            else:
+                options = {k: v[0] for k, v in parse_qs(url.query).items()}
+                data, path = body, None
+            solid = options.get('solid')
+            result = self.service.plan(data=data, path=path,
+                                       solid_idx=None if solid is None else int(solid),
+                                       backend=options.get('backend', "networkx"),
+                                       vice_file=options.get('vices'))
+            self.send_json(200, result)
+        except (KeyError, ValueError, OSError) as e:
+            self.send_json(400, {'error': str(e)})
+        except Exception:
+            self.send_json(500, {'error': traceback.format_exc()})
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        return request, ("local", 0) # BaseHTTPRequestHandler logs client_address[0]
+
+
+def make_server(service, host="127.0.0.1", port=8765, unix_socket=None):
+    handler = type("Handler", (PlanningRequestHandler,), {'service': service})
+    if unix_socket:
+        if os.path.exists(unix_socket):
+            os.remove(unix_socket)
+        return UnixHTTPServer(unix_socket, handler)
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local feature recognition + setup planning service")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--host', default="127.0.0.1", help="keep it on localhost, there is no auth")
+    parser.add_argument('--unix-socket', default=None, help="serve on a unix socket instead of tcp")
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--spool-dir', default=None, help="where received STEP files are stored")
+    parser.add_argument('--warm-step', default=None, help="STEP file every worker plans once at start")
+    parser.add_argument('--cache-mb', type=float, default=256, help="result cache budget per worker (0 = off)")
+    parser.add_argument('--cache-dir', default=None, help="result cache shared on disk by the workers")
+    args = parser.parse_args()
+
+    service = PlanningService(args.workers, args.spool_dir, args.warm_step, args.cache_mb, args.cache_dir)
+    server = make_server(service, args.host, args.port, args.unix_socket)
+    print(f"Planning service on {args.unix_socket or f'http://{args.host}:{args.port}'}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+
+
+if __name__ == "__main__":
+    main()
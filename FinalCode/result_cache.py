@@ -0,0 +1,148 @@
+import hashlib
+import inspect
+import json
+import os
+from collections import OrderedDict
+
+from FeatureRecognition.feature_recognition import FeatureRecognition
+from FeatureRecognition.geometry_analysis import default_deflection
+from SetupPlanning.TAD_and_Dependencies import TAD_Extraction, Dependencies
+from SetupPlanning.Setup_Plan import Setup_Plan
+from SetupPlanning.visibility_maps import get_visibility_maps
+
+
+# Cache of the final pipeline outputs, one entry per stage:
+#   'recognition' -> matches                           key: part + recognition settings
+#   'planning'    -> feature_info (TADs/deps) + plans  key: ... + planner settings
+#   'clamping'    -> clamping + the full result        key: ... + vice catalogue
+# so a rerun of an unchanged part returns without loading the STEP, and changing only the vices
+# reuses recognition and planning. Entries are stored as json (plain copies, size = their bytes),
+# evicted least-recently-used above a byte budget; optionally mirrored on disk between runs.
+
+CACHE_VERSION = 2 # bump when planner code changes what it returns for the same settings
+STAGES = ('recognition', 'planning', 'clamping')
+
+
+def signature_defaults(func):
+    # default values of the parameters (grid steps, thresholds...) -> part of the settings hash
+    return {name: p.default for name, p in inspect.signature(func).parameters.items()
+            if p.default is not inspect.Parameter.empty and isinstance(p.default, (int, float, str, bool))}
+
+def settings_hash(settings):
+    return hashlib.sha1(json.dumps(settings, sort_keys=True, default=str).encode()).hexdigest()
+
+def file_hash(path, chunk=1 << 20):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for block in iter(lambda: fh.read(chunk), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+_file_hashes = {} # (path, mtime, size) -> sha256, so an unchanged file is not read again
+
+def part_key(step_file, solid_idx):
+    stat = os.stat(step_file)
+    stamp = (os.path.abspath(step_file), stat.st_mtime_ns, stat.st_size)
+    if stamp not in _file_hashes:
+        _file_hashes[stamp] = file_hash(step_file)
+    return f"{_file_hashes[stamp]}_{solid_idx}"
+
+def stage_keys(part, backend="networkx", vice_file=None):
+    # each stage key includes the settings of the stages before it
+    recognition = {'version': CACHE_VERSION, 'backend': backend,
+                   'mesh': signature_defaults(default_deflection),
+                   'footprints': signature_defaults(FeatureRecognition.get_footprints)}
+    planning = dict(recognition,
+                    visibility=signature_defaults(get_visibility_maps),
+                    tad=signature_defaults(TAD_Extraction.__init__),
+                    dependencies=signature_defaults(Dependencies.__init__),
+                    locating_grid=signature_defaults(Setup_Plan.generate_locating_grid),
+                    locators=signature_defaults(Setup_Plan.find_locators))
+    clamping = dict(planning,
+                    vices=file_hash(vice_file) if vice_file else "default")
+    return {stage: f"{part}_{settings_hash(settings)[:16]}"
+            for stage, settings in zip(STAGES, (recognition, planning, clamping))}
+
+
+class ResultCache:
+    def __init__(self, max_bytes=256 * 2**20, directory=None):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self._entries = OrderedDict() # (stage, key) -> json text, least recently used first
+        self.size = 0
+        self.stats = {stage: {'hits': 0, 'misses': 0} for stage in STAGES}
+        if directory:
+            for stage in STAGES:
+                os.makedirs(os.path.join(directory, stage), exist_ok=True)
+
+    def _path(self, stage, key):
+        return os.path.join(self.directory, stage, f"{key}.json")
+
+    def get(self, stage, key):
+        text = self._entries.get((stage, key))
+        if text is not None:
+            self._entries.move_to_end((stage, key))
+        elif self.directory:
+            try:
+                with open(self._path(stage, key)) as fh:
+                    text = fh.read()
+                os.utime(self._path(stage, key)) # disk eviction is by last use too
+            except FileNotFoundError: # (not there, or evicted by another worker)
+                text = None
+            if text is not None:
+                self._store(stage, key, text)
+        self.stats[stage]['hits' if text is not None else 'misses'] += 1
+        return None if text is None else json.loads(text)
+
+    def put(self, stage, key, value, default=str):
+        text = json.dumps(value, default=default)
+        self._store(stage, key, text)
+        if self.directory:
+            tmp = f"{self._path(stage, key)}.{os.getpid()}.tmp"
+            with open(tmp, 'w') as fh:
+                fh.write(text)
+            os.replace(tmp, self._path(stage, key))
+            self._evict_disk()
+
+    def _store(self, stage, key, text):
+        if (stage, key) in self._entries:
+            self.size -= len(self._entries.pop((stage, key)))
+        if len(text) > self.max_bytes:
+            return # bigger than the whole budget -> not kept in memory
+        self._entries[(stage, key)] = text
+        self.size += len(text)
+        while self.size > self.max_bytes:
+            _, old = self._entries.popitem(last=False)
+            self.size -= len(old)
+
+    def _evict_disk(self):
+        files = []
+        for stage in STAGES:
+            folder = os.path.join(self.directory, stage)
+            for name in os.listdir(folder):
+                if name.endswith('.json'):
+                    path = os.path.join(folder, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+
+    def print_stats(self):
+        print(f"Result cache: {len(self._entries)} entries, {self.size / 2**20:.1f} / "
+              f"{self.max_bytes / 2**20:.0f} MB")
+        for stage, s in self.stats.items():
+            print(f"  {stage:<12} hits {s['hits']:<5} misses {s['misses']}")